@@ -1,21 +1,105 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import zlib
+from decimal import Decimal
+
+import simplejson
+
+# orderProductsVersion of the stored line items, items written before it have no version
+# and hold a list of maps with the attribute names of OrderProduct
+COMPACT_VERSION = 1  # list of [productId, price, quantity]
+COMPRESSED_VERSION = 2  # zlib compressed JSON of the compact list, as binary
+# compact line items of at least this many bytes are stored compressed
+compression_min_bytes = 1024
+compression_level = 6
+
 class Order:
-    key=''
+    __slots__ = ('shardId', 'orderId', 'key', 'orderName', 'orderProducts', 'orderTotal')
+
     def __init__(self, shardId, orderId, orderName, orderProducts):
         self.shardId = shardId
         self.orderId = orderId
         self.key = shardId + ':' +  orderId
         self.orderName = orderName
         self.orderProducts = orderProducts
+        self.orderTotal = sum(orderProduct.price * orderProduct.quantity for orderProduct in orderProducts)
+
+    @classmethod
+    def from_item(cls, item):
+        """ Builds an order and its line items from a DynamoDB item
+        """
+        return cls(item['shardId'], item['orderId'], item['orderName'],
+            decode_order_products(item['orderProducts'], item.get('orderProductsVersion')))
+
+    def to_item(self):
+        """ Returns the DynamoDB item of the order
+        """
+        orderProducts, version = encode_order_products(self.orderProducts)
+        return {
+            'shardId': self.shardId,
+            'orderId': self.orderId,
+            'orderName': self.orderName,
+            'orderProducts': orderProducts,
+            'orderProductsVersion': version,
+            'orderTotal': self.orderTotal
+        }
+
+    def for_json(self):
+        """ Returns the attributes serialized in API responses
+        """
+        return {
+            'shardId': self.shardId,
+            'orderId': self.orderId,
+            'key': self.key,
+            'orderName': self.orderName,
+            'orderProducts': self.orderProducts,
+            'orderTotal': self.orderTotal
+        }
 
 class  OrderProduct:
+    __slots__ = ('productId', 'price', 'quantity')
 
     def __init__(self, productId, price, quantity):
         self.productId = productId
         self.price = price
         self.quantity = quantity
 
+    @classmethod
+    def from_item(cls, item):
+        return cls(item['productId'], item['price'], item['quantity'])
+
+    def to_item(self):
+        return {
+            'productId': self.productId,
+            'price': self.price,
+            'quantity': self.quantity
+        }
+
+    for_json = to_item
+
+
+def encode_order_products(orderProducts):
+    """ Encodes line items for storage, without repeating attribute names per line.
+    Large orders are compressed, which keeps them far from the 400 KB item limit
+    and reduces the capacity consumed to read and write them.
+
+    Returns:
+        tuple: (attribute value, orderProductsVersion)
+    """
+    compact = [[orderProduct.productId, orderProduct.price, orderProduct.quantity] for orderProduct in orderProducts]
+    encoded = simplejson.dumps(compact, use_decimal=True, separators=(',', ':')).encode('utf-8')
+    if (len(encoded) >= compression_min_bytes):
+        return zlib.compress(encoded, compression_level), COMPRESSED_VERSION
+    return compact, COMPACT_VERSION
 
 
+def decode_order_products(value, version):
+    """ Decodes stored line items of any version into OrderProduct objects
+    """
+    if (version is None):
+        return [OrderProduct.from_item(orderProduct) for orderProduct in value]
+    if (int(version) == COMPRESSED_VERSION):
+        # the table resource returns binary attributes wrapped in boto3 Binary
+        value = simplejson.loads(zlib.decompress(getattr(value, 'value', value)).decode('utf-8'), use_decimal=True, parse_int=Decimal)
+    return [OrderProduct(productId, price, quantity) for productId, price, quantity in value]
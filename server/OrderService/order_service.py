@@ -5,12 +5,21 @@ import json
 import utils
 import logger
 import metrics_manager
+import auth_manager
 import order_service_dal
+import dynamodb_manager
+import export_manager
+import shard_manager
 from decimal import Decimal
 from types import SimpleNamespace
 from aws_lambda_powertools import Tracer
 tracer = Tracer()
 
+default_page_size = 50
+max_page_size = 1000
+max_batch_get_keys = 1000
+max_order_lines = 1000
+
 @tracer.capture_lambda_handler
 def get_order(event, context):
     tenantId = event['requestContext']['authorizer']['tenantId']
@@ -20,11 +29,27 @@ def get_order(event, context):
     params = event['pathParameters']
     key = params['id']
     logger.log_with_tenant_context(event, params)
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("order key is not valid")
+    expand = utils.get_query_parameter(event, 'expand')
+    if (expand is not None and expand != 'products'):
+        return utils.create_badrequest_response("expand must be products")
+
     order = order_service_dal.get_order(event, key)
+    if (order is None):
+        return utils.create_notfound_response("Order not found")
 
-    logger.log_with_tenant_context(event, "Request completed to get a order")
     metrics_manager.record_metric(event, "SingleOrderRequested", "Count", 1)
-    return utils.generate_response(order)
+    if (expand):
+        # the products of every line item, so the order is shown without a request per product
+        products = order_service_dal.get_products_of_order(event, order)
+        response = order.for_json()
+        response['orderProducts'] = [dict(orderProduct.to_item(), product=products[orderProduct.productId]) for orderProduct in order.orderProducts]
+        logger.log_with_tenant_context(event, "Request completed to get a order with its products")
+        return utils.generate_response(response, event)
+
+    logger.log_with_tenant_context(event, "Request completed to get a order")
+    return utils.generate_response(order, event)
     
 @tracer.capture_lambda_handler
 def create_order(event, context):  
@@ -32,8 +57,13 @@ def create_order(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
 
     logger.log_with_tenant_context(event, "Request received to create a order")
-    payload = json.loads(event['body'], object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
-    order = order_service_dal.create_order(event, payload)
+    payload = json.loads(utils.get_request_body(event), object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    if (not __is_valid_order_products(event, payload, tenantId)):
+        return utils.create_badrequest_response(__order_products_message)
+    try:
+        order = order_service_dal.create_order(event, payload)
+    except order_service_dal.UnknownProductsError as e:
+        return utils.create_badrequest_response(str(e))
     logger.log_with_tenant_context(event, "Request completed to create a order")
     metrics_manager.record_metric(event, "OrderCreated", "Count", 1)
     return utils.generate_response(order)
@@ -44,10 +74,19 @@ def update_order(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
     
     logger.log_with_tenant_context(event, "Request received to update a order")
-    payload = json.loads(event['body'], object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    payload = json.loads(utils.get_request_body(event), object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
     params = event['pathParameters']
     key = params['id']
-    order = order_service_dal.update_order(event, payload, key)
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("order key is not valid")
+    if (not __is_valid_order_products(event, payload, tenantId)):
+        return utils.create_badrequest_response(__order_products_message)
+    try:
+        order = order_service_dal.update_order(event, payload, key)
+    except order_service_dal.UnknownProductsError as e:
+        return utils.create_badrequest_response(str(e))
+    if (order is None):
+        return utils.create_notfound_response("Order not found")
     logger.log_with_tenant_context(event, "Request completed to update a order") 
     metrics_manager.record_metric(event, "OrderUpdated", "Count", 1)   
     return utils.generate_response(order)
@@ -60,6 +99,8 @@ def delete_order(event, context):
     logger.log_with_tenant_context(event, "Request received to delete a order")
     params = event['pathParameters']
     key = params['id']
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("order key is not valid")
     response = order_service_dal.delete_order(event, key)
     logger.log_with_tenant_context(event, "Request completed to delete a order")
     metrics_manager.record_metric(event, "OrderDeleted", "Count", 1)
@@ -71,9 +112,118 @@ def get_orders(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
     
     logger.log_with_tenant_context(event, "Request received to get all orders")
+    limit = utils.get_query_parameter(event, 'limit')
+    cursor = utils.get_query_parameter(event, 'cursor')
+    # the version changes with every write, an unchanged listing is answered without reading it
+    etag = utils.create_etag(order_service_dal.get_orders_version(event, tenantId), limit, cursor)
+    if (utils.is_not_modified(event, etag)):
+        metrics_manager.record_metric(event, "OrdersNotModified", "Count", 1)
+        logger.log_with_tenant_context(event, "Request completed, orders not modified")
+        return utils.create_not_modified_response(etag)
+
+    if (limit or cursor):
+        return __get_orders_page(event, tenantId, limit, cursor, etag)
+
     response = order_service_dal.get_orders(event, tenantId)
     metrics_manager.record_metric(event, "OrdersRetrieved", "Count", len(response))
     logger.log_with_tenant_context(event, "Request completed to get all orders")
-    return utils.generate_response(response)
+    return utils.generate_response(response, event, etag)
+
+def __get_orders_page(event, tenantId, limit, cursor, etag=None):
+    try:
+        limit = int(limit) if limit else default_page_size
+    except ValueError:
+        return utils.create_badrequest_response("limit must be a number")
+    if (limit < 1 or limit > max_page_size):
+        return utils.create_badrequest_response("limit must be between 1 and " + str(max_page_size))
+
+    try:
+        orders, next_cursor = order_service_dal.get_orders_page(event, tenantId, limit, cursor)
+    except dynamodb_manager.InvalidCursorError:
+        return utils.create_badrequest_response("cursor is not valid")
+
+    metrics_manager.record_metric(event, "OrdersRetrieved", "Count", len(orders))
+    logger.log_with_tenant_context(event, "Request completed to get a page of orders")
+    return utils.generate_response({"items": orders, "nextCursor": next_cursor}, event, etag)
+
+
+
+@tracer.capture_lambda_handler
+def export_orders(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    if (export_manager.is_export_job(event)):
+        # invoked asynchronously by the request below, the export is not bound by the API Gateway timeout
+        count = order_service_dal.export_orders(event, tenantId, event['exportKey'])
+        metrics_manager.record_metric(event, "OrdersExported", "Count", count)
+        logger.log_with_tenant_context(event, "Export of orders completed")
+        return {"key": event['exportKey'], "count": count}
+
+    logger.log_with_tenant_context(event, "Request received to export orders")
+    if (not auth_manager.isTenantAdmin(event['requestContext']['authorizer']['userRole'])):
+        logger.log_with_tenant_context(event, "Request completed as unauthorized. Only tenant admin can export orders!")
+        return utils.create_unauthorized_response()
+
+    key = export_manager.get_export_key(tenantId, 'orders')
+    export_manager.start_export_job(context.invoked_function_arn, event, key)
+    logger.log_with_tenant_context(event, "Request completed to start an export of orders")
+    # the object is available at the url once the export has completed
+    return utils.generate_response({"key": key, "url": order_service_dal.get_export_url(event, key)})
+
+@tracer.capture_lambda_handler
+def get_orders_count(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    logger.log_with_tenant_context(event, "Request received to count orders")
+    count = order_service_dal.get_orders_count(event, tenantId)
+    metrics_manager.record_metric(event, "OrdersCounted", "Count", 1)
+    logger.log_with_tenant_context(event, "Request completed to count orders")
+    return utils.generate_response({"count": count}, event)
+
+@tracer.capture_lambda_handler
+def batch_get_orders(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    logger.log_with_tenant_context(event, "Request received to get orders by key")
+    keys = __get_batch_keys(event, tenantId)
+    if (keys is None):
+        return utils.create_badrequest_response("keys must be a list of 1 to " + str(max_batch_get_keys) + " order keys")
+
+    orders = order_service_dal.batch_get_orders(event, keys)
+    metrics_manager.record_metric(event, "OrdersRetrievedByKey", "Count", len(keys))
+    logger.log_with_tenant_context(event, "Request completed to get orders by key")
+    return utils.generate_response(orders, event)
+
+__order_products_message = "orderProducts must be a list of 1 to " + str(max_order_lines) + " line items with a productId and a positive quantity"
+
+def __is_valid_order_products(event, payload, tenantId):
+    orderProducts = getattr(payload, 'orderProducts', None)
+    if (not isinstance(orderProducts, list) or len(orderProducts) < 1 or len(orderProducts) > max_order_lines):
+        return False
+    for orderProduct in orderProducts:
+        productId = getattr(orderProduct, 'productId', None)
+        quantity = getattr(orderProduct, 'quantity', None)
+        # a bare productId, as the application sends, or a product key naming a shard of the tenant
+        if (not shard_manager.is_valid_key(event, tenantId, productId)):
+            return False
+        if (not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1):
+            return False
+    return True
 
-  
\ No newline at end of file
+def __get_batch_keys(event, tenantId):
+    """ Returns the keys of the request body, None when they are not valid
+    """
+    try:
+        keys = json.loads(utils.get_request_body(event) or '{}').get('keys')
+    except (ValueError, AttributeError):
+        return None
+    if (not isinstance(keys, list) or len(keys) < 1 or len(keys) > max_batch_get_keys):
+        return None
+    for key in keys:
+        # a key is shardId:orderId in one of the shards of the tenant, or a bare orderId
+        if (not shard_manager.is_valid_key(event, tenantId, key)):
+            return None
+    return keys
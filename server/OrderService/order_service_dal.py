@@ -6,34 +6,58 @@ import os
 import boto3
 from botocore.exceptions import ClientError
 import uuid
-from order_models import Order
+from order_models import Order, OrderProduct
 import json
 import utils
 from types import SimpleNamespace
 import logger
-import random
-import threading
+import client_manager
+import fanout_executor
+import dynamodb_manager
+import shard_manager
+import counter_manager
+import export_manager
+import cache_manager
+import metrics_manager
+from contextlib import closing
 from boto3.dynamodb.conditions import Key
 
 is_pooled_deploy = os.environ['IS_POOLED_DEPLOY']
 table_name = os.environ['ORDER_TABLE_NAME']
-dynamodb = None
+# line items are priced from the products of the tenant
+product_table_name = os.environ.get('PRODUCT_TABLE_NAME')
+# product attributes shown with the line items of an order
+order_product_attributes = ['sku', 'name', 'price', 'category']
 
-suffix_start = 1 
-suffix_end = 10
+# products read by this container to expand orders, a max of 0 entries disables the cache
+order_product_cache = cache_manager.LruTtlCache(
+    int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 1000)),
+    int(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', 30)))
+export_bucket_name = os.environ.get('EXPORT_BUCKET_NAME')
+
+# leave headroom for serialization within the 29 seconds API Gateway timeout
+shard_query_timeout = int(os.environ.get('SHARD_QUERY_TIMEOUT_SECONDS', 20))
+
+
+class UnknownProductsError(Exception):
+    """Raised when line items of an order name products that do not exist"""
+    def __init__(self, keys):
+        super().__init__('Unknown products: ' + ', '.join(keys))
+        self.keys = keys
  
 
 def get_order(event, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
 
     try:
-        shardId = key.split(":")[0]
-        orderId = key.split(":")[1] 
+        shardId, orderId = shard_manager.split_key(key)
         logger.log_with_tenant_context(event, shardId)
         logger.log_with_tenant_context(event, orderId)
-        response = table.get_item(Key={'shardId': shardId, 'orderId': orderId})
-        item = response['Item']
-        order = Order(item['shardId'], item['orderId'], item['orderName'], item['orderProducts'])
+        # a reshard changes the shard of an order, the key it was handed out with still resolves
+        item = shard_manager.get_item(event, table, 'shardId', 'orderId', event['requestContext']['authorizer']['tenantId'], key)
+        if (item is None):
+            return None
+        order = Order.from_item(item)
 
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
@@ -42,12 +66,20 @@ def get_order(event, key):
         return order
 
 def delete_order(event, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
+    
+    tenantId = event['requestContext']['authorizer']['tenantId']
     
     try:
-        shardId = key.split(":")[0]
-        orderId = key.split(":")[1] 
-        response = table.delete_item(Key={'shardId':shardId, 'orderId': orderId})
+        shardId, orderId = shard_manager.split_key(key)
+        response = __delete_order(table, tenantId, shardId, orderId) if shardId else None
+        if (response is None):
+            # moved by a reshard since the key was handed out, or a bare id
+            item = shard_manager.find_item(event, table, 'shardId', 'orderId', tenantId, orderId)
+            response = __delete_order(table, tenantId, item['shardId'], orderId) if item else None
+        if (response is None):
+            logger.info("Order to delete does not exist")
+            return None
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error deleting a order', e)
@@ -55,22 +87,43 @@ def delete_order(event, key):
         logger.info("DeleteItem succeeded:")
         return response
 
+def __delete_order(table, tenantId, shardId, orderId):
+    try:
+        # the order is only uncounted when it existed
+        return table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Delete': {
+                    'TableName': table.name,
+                    'Key': {'shardId': shardId, 'orderId': orderId},
+                    'ConditionExpression': 'attribute_exists(orderId)'
+                }
+            },
+            counter_manager.get_transact_increment(table.name, counter_manager.get_counter_key('shardId', 'orderId', tenantId, orderId), -1)
+        ])
+    except ClientError as e:
+        if (dynamodb_manager.is_condition_failure(e)):
+            return None
+        raise
+
 
 def create_order(event, payload):
     tenantId = event['requestContext']['authorizer']['tenantId']
-    table = __get_dynamodb_table(event, dynamodb)
-    suffix = random.randrange(suffix_start, suffix_end)
-    shardId = tenantId+"-"+str(suffix)
+    table = __get_dynamodb_table(event)
+    orderId = str(uuid.uuid4())
+    shardId = shard_manager.get_write_partition_id(event, tenantId, orderId)
     
-    order = Order(shardId, str(uuid.uuid4()), payload.orderName, payload.orderProducts)
+    order = Order(shardId, orderId, payload.orderName, get_order_products(event, payload.orderProducts))
 
     try:
-        response = table.put_item(Item={
-        'shardId':shardId,
-        'orderId': order.orderId, 
-        'orderName': order.orderName,
-        'orderProducts': get_order_products_dict(order.orderProducts)
-        })
+        response = table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Put': {
+                    'TableName': table.name,
+                    'Item': order.to_item()
+                }
+            },
+            counter_manager.get_transact_increment(table.name, counter_manager.get_counter_key('shardId', 'orderId', tenantId, orderId), 1)
+        ])
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error adding a order', e)
@@ -79,22 +132,23 @@ def create_order(event, payload):
         return order
 
 def update_order(event, payload, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
+    tenantId = event['requestContext']['authorizer']['tenantId']
     
     try:
-        shardId = key.split(":")[0]
-        orderId = key.split(":")[1] 
+        shardId, orderId = shard_manager.split_key(key)
         logger.log_with_tenant_context(event, shardId)
         logger.log_with_tenant_context(event, orderId)
-        order = Order(shardId, orderId,payload.orderName, payload.orderProducts)
-        response = table.update_item(Key={'shardId':order.shardId, 'orderId': order.orderId},
-        UpdateExpression="set orderName=:orderName, "
-        +"orderProducts=:orderProducts",
-        ExpressionAttributeValues={
-            ':orderName': order.orderName,
-            ':orderProducts': get_order_products_dict(order.orderProducts)
-        },
-        ReturnValues="UPDATED_NEW")
+        orderProducts = get_order_products(event, payload.orderProducts)
+        order = __update_order(table, tenantId, Order(shardId, orderId, payload.orderName, orderProducts)) if shardId else None
+        if (order is None):
+            # moved by a reshard since the key was handed out, or a bare id
+            item = shard_manager.find_item(event, table, 'shardId', 'orderId', tenantId, orderId)
+            if (item is not None):
+                order = __update_order(table, tenantId, Order(item['shardId'], orderId, payload.orderName, orderProducts))
+        if (order is None):
+            logger.info("Order to update does not exist")
+            return None
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error updating a order', e)
@@ -102,44 +156,187 @@ def update_order(event, payload, key):
         logger.info("UpdateItem succeeded:")
         return order
 
+def __update_order(table, tenantId, order):
+    item = order.to_item()
+    try:
+        # an update never creates an order, an order that is not in the shard is not written.
+        # The counter of the order is touched in the same transaction, so listings see a new version
+        table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Update': {
+                    'TableName': table.name,
+                    'Key': {'shardId': order.shardId, 'orderId': order.orderId},
+                    'UpdateExpression': "set orderName=:orderName, "
+                        +"orderProducts=:orderProducts, orderProductsVersion=:orderProductsVersion, orderTotal=:orderTotal",
+                    'ConditionExpression': "attribute_exists(orderId)",
+                    'ExpressionAttributeValues': {
+                        ':orderName': order.orderName,
+                        ':orderProducts': item['orderProducts'],
+                        ':orderProductsVersion': item['orderProductsVersion'],
+                        ':orderTotal': order.orderTotal
+                    }
+                }
+            },
+            counter_manager.get_transact_touch(table.name, counter_manager.get_counter_key('shardId', 'orderId', tenantId, order.orderId))
+        ])
+    except ClientError as e:
+        if (dynamodb_manager.is_condition_failure(e)):
+            return None
+        raise
+    return order
+
 def get_orders(event, tenantId):
-    table = __get_dynamodb_table(event, dynamodb)
-    get_all_products_response = []
+    """ Returns the orders of a tenant across all shards, use get_orders_page to read them a page at a time
 
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+
+    Returns:
+        list of Order
+    """
+    table = __get_dynamodb_table(event)
+    get_all_orders_response = []
     try:
-        __query_all_partitions(tenantId,get_all_products_response, table)
+        with closing(__query_all_partitions(shard_manager.get_read_partition_ids(event, tenantId), table)) as orders:
+            for order in orders:
+                get_all_orders_response.append(order)
     except ClientError as e:
-        logger.error()
-        raise Exception('Error getting all orders', e) 
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting all orders', e)
     else:
         logger.info("Get orders succeeded")
-        return get_all_products_response
+        return get_all_orders_response
 
-def __query_all_partitions(tenantId,get_all_products_response, table):
-    threads = []    
-    
-    for suffix in range(suffix_start, suffix_end):
-        partition_id = tenantId+'-'+str(suffix)
-        
-        thread = threading.Thread(target=__get_tenant_data, args=[partition_id, get_all_products_response, table])
-        threads.append(thread)
-        
-    # Start threads
-    for thread in threads:
-        thread.start()
-    # Ensure all threads are finished
-    for thread in threads:
-        thread.join()
+def get_orders_page(event, tenantId, limit, cursor=None):
+    """ Returns one page of the orders of a tenant
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+        limit (int): maximum number of orders in the page
+        cursor (string): cursor returned with the previous page, none for the first page
+
+    Returns:
+        tuple: (list of Order, cursor for the next page or None on the last page)
+    """
+    table = __get_dynamodb_table(event)
+    partition_ids = shard_manager.get_read_partition_ids(event, tenantId)
+    try:
+        items, next_cursor = dynamodb_manager.query_partitions_page(table, partition_ids, 'shardId', 'orderId', limit, cursor, shard_query_timeout)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting a page of orders', e)
+    else:
+        logger.info("Get orders page succeeded")
+        return [Order.from_item(item) for item in items], next_cursor
+
+def batch_get_orders(event, keys):
+    """ Returns the orders with the given keys using BatchGetItem.
+    Bare orderIds, and keys of orders a reshard has moved since, are resolved by their orderId.
+
+    Args:
+        event: lambda event with authorizer context
+        keys (list): order keys, shardId:orderId or a bare orderId
+
+    Returns:
+        list of Order in the same order as keys, None for keys that were not found
+    """
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    table = __get_dynamodb_table(event)
+    try:
+        items = shard_manager.batch_get_items(event, table, 'shardId', 'orderId', tenantId, keys, shard_query_timeout)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting orders by key', e)
+    else:
+        logger.info("Batch get orders succeeded")
+        return [None if item is None else Order.from_item(item) for item in items]
+
+def get_orders_version(event, tenantId):
+    """ Returns the version of the orders of a tenant, it changes whenever one of them is written
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+
+    Returns:
+        string, compare it for equality only
+    """
+    table = __get_dynamodb_table(event)
+    try:
+        return counter_manager.get_version(table, 'shardId', 'orderId', tenantId)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the version of the orders', e)
+
+def get_orders_count(event, tenantId):
+    """ Returns the number of orders of a tenant from its counters, without reading the orders
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+
+    Returns:
+        int
+    """
+    table = __get_dynamodb_table(event)
+    try:
+        return counter_manager.get_count(table, 'shardId', 'orderId', tenantId)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the number of orders', e)
+
+def export_orders(event, tenantId, key):
+    """ Exports the orders of a tenant to the export bucket as gzip compressed NDJSON.
+    Pages are streamed from every shard as they arrive and uploaded in parts, without
+    holding the orders in memory. Exports run as asynchronous jobs, without the deadline
+    of the shard queries of a request, and with the role of the function since the credentials
+    of the request can expire first. The key must be under the prefix of the tenant.
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+        key (string): object key of the export, see export_manager.get_export_key
+
+    Returns:
+        int: number of orders exported
+    """
+    if (not export_manager.is_tenant_export_key(tenantId, key)):
+        raise Exception('Error exporting orders, the key is not under the prefix of the tenant', key)
+    table = client_manager.get_table(table_name)
+    s3 = client_manager.get_client('s3')
+    try:
+        with closing(__query_all_partitions(shard_manager.get_read_partition_ids(event, tenantId), table, timeout_seconds=None)) as orders:
+            count = export_manager.export_ndjson(s3, export_bucket_name, key, orders)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error exporting orders', e)
+    else:
+        logger.info("Export orders succeeded")
+        return count
+
+def get_export_url(event, key):
+    """ Returns a presigned url to download an export, signed with the role of the function
+    so the url does not expire with the credentials of the request
+    """
+    return client_manager.get_client('s3').generate_presigned_url('get_object', Params={'Bucket': export_bucket_name, 'Key': key}, ExpiresIn=3600)
+
+def __query_all_partitions(partition_ids, table, timeout_seconds=shard_query_timeout):
+    """ Streams the items of every shard of a tenant, page by page, as the pages arrive
+    """
+    latencies = {}
+
+    yield from fanout_executor.stream(lambda partition_id: __get_tenant_data(partition_id, table), partition_ids, timeout_seconds, latencies)
+    logger.info({"shardLatenciesMs": latencies})
            
-def __get_tenant_data(partition_id, get_all_products_response, table):    
+def __get_tenant_data(partition_id, table):    
     logger.info(partition_id)
-    response = table.query(KeyConditionExpression=Key('shardId').eq(partition_id))    
-    if (len(response['Items']) > 0):
-        for item in response['Items']:
-            order = Order(item['shardId'], item['orderId'], item['orderName'], item['orderProducts'])
-            get_all_products_response.append(order)
+    query_args = {'KeyConditionExpression': Key('shardId').eq(partition_id)}
+    for response in dynamodb_manager.query_pages(table, **query_args):
+        yield [Order.from_item(item) for item in response['Items']]
 
-def __get_dynamodb_table(event, dynamodb):
+def __get_dynamodb_table(event):
     """ Determine the table name based upo pooled vs silo model
 
     Args:
@@ -149,26 +346,83 @@ def __get_dynamodb_table(event, dynamodb):
         [type]: [description]
     """
     if (is_pooled_deploy=='true'):
-        accesskey = event['requestContext']['authorizer']['accesskey']
-        secretkey = event['requestContext']['authorizer']['secretkey']
-        sessiontoken = event['requestContext']['authorizer']['sessiontoken']    
-        dynamodb = boto3.resource('dynamodb',
-                aws_access_key_id=accesskey,
-                aws_secret_access_key=secretkey,
-                aws_session_token=sessiontoken
-                )        
+        return client_manager.get_table_for_tenant(table_name, event)
     else:
-        if not dynamodb:
-            dynamodb = boto3.resource('dynamodb')
-        
-    return dynamodb.Table(table_name)
+        return client_manager.get_table(table_name)
 
-def get_order_products_dict(orderProducts):
-    orderProductList = []
-    for i in range(len(orderProducts)):
-        product = orderProducts[i]
-        orderProductList.append(vars(product))
-    return orderProductList    
+def get_order_products(event, orderProducts):
+    """ Builds the line items of an order from the request payload, priced from the product table.
+    The products of every line are read with BatchGetItem, in parallel chunks of 100 distinct products,
+    the prices sent by the client are ignored.
 
-  
+    Args:
+        event: lambda event with authorizer context
+        orderProducts (list): line items with productId (a bare productId or a product key, shardId:productId) and quantity
+
+    Returns:
+        list of OrderProduct, with the productId of every line as it was sent
+    """
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    keys = [orderProduct.productId for orderProduct in orderProducts]
+    table = __get_product_table(event)
+    try:
+        items = shard_manager.batch_get_items(event, table, 'shardId', 'productId', tenantId, keys, shard_query_timeout, ['price'])
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the products of a order', e)
+
+    unknown = sorted(set(key for key, item in zip(keys, items) if item is None))
+    if (unknown):
+        raise UnknownProductsError(unknown)
+    return [OrderProduct(orderProduct.productId, item['price'], orderProduct.quantity) for orderProduct, item in zip(orderProducts, items)]
+
+def get_products_of_order(event, order):
+    """ Returns the products referenced by the line items of an order.
+    Products cached by this container are served from the cache, the others are read
+    with BatchGetItem, in parallel chunks of 100 products. Lines of orders placed with
+    bare productIds, or with keys of products a reshard has moved since, are resolved by
+    their productId.
+
+    Args:
+        event: lambda event with authorizer context
+        order (Order):
 
+    Returns:
+        dict: product key -> product item, None for products deleted since the order was placed
+    """
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    products = {}
+    missing = []
+    for key in dict.fromkeys(orderProduct.productId for orderProduct in order.orderProducts):
+        product = order_product_cache.get(tenantId, key)
+        if (product is None):
+            missing.append(key)
+        else:
+            products[key] = product
+    metrics_manager.record_metric(event, "OrderProductCacheHit", "Count", len(products))
+    metrics_manager.record_metric(event, "OrderProductCacheMiss", "Count", len(missing))
+    if (not missing):
+        return products
+
+    table = __get_product_table(event)
+    try:
+        items = shard_manager.batch_get_items(event, table, 'shardId', 'productId', tenantId, missing,
+            shard_query_timeout, order_product_attributes)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the products of a order', e)
+
+    evicted = 0
+    for key, item in zip(missing, items):
+        products[key] = item
+        if (item is not None):
+            evicted += order_product_cache.put(tenantId, key, item)
+    if (evicted):
+        metrics_manager.record_metric(event, "OrderProductCacheEviction", "Count", evicted)
+    return products
+
+def __get_product_table(event):
+    if (is_pooled_deploy=='true'):
+        return client_manager.get_table_for_tenant(product_table_name, event)
+    else:
+        return client_manager.get_table(product_table_name)
@@ -2,7 +2,8 @@
 # SPDX-License-Identifier: MIT-0
 
 class Product:
-    key =''
+    __slots__ = ('shardId', 'productId', 'key', 'sku', 'name', 'price', 'category')
+
     def __init__(self, shardId, productId, sku, name, price, category):
         self.shardId = shardId
         self.productId = productId
@@ -12,14 +13,38 @@ class Product:
         self.price = price
         self.category = category
 
+    @classmethod
+    def from_item(cls, item):
+        """ Builds a product from a DynamoDB item
+        """
+        return cls(item['shardId'], item['productId'], item['sku'], item['name'], item['price'], item['category'])
+
+    def to_item(self):
+        """ Returns the DynamoDB item of the product
+        """
+        return {
+            'shardId': self.shardId,
+            'productId': self.productId,
+            'sku': self.sku,
+            'name': self.name,
+            'price': self.price,
+            'category': self.category
+        }
+
+    def for_json(self):
+        """ Returns the attributes serialized in API responses
+        """
+        return {
+            'shardId': self.shardId,
+            'productId': self.productId,
+            'key': self.key,
+            'sku': self.sku,
+            'name': self.name,
+            'price': self.price,
+            'category': self.category
+        }
+
 class Category:
     def __init__(self, id, name):
         self.id = id
         self.name = name
-                
-
-        
-
-               
-
-        
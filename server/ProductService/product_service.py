@@ -5,12 +5,22 @@ import json
 import utils
 import logger
 import metrics_manager
+import auth_manager
 import product_service_dal
+import dynamodb_manager
+import export_manager
+import shard_manager
 from decimal import Decimal
 from aws_lambda_powertools import Tracer
 from types import SimpleNamespace
 tracer = Tracer()
 
+default_page_size = 50
+max_page_size = 1000
+max_batch_get_keys = 1000
+max_import_rows = 10000
+import_fields = ('sku', 'name', 'price', 'category')
+
 @tracer.capture_lambda_handler
 def get_product(event, context):
     tenantId = event['requestContext']['authorizer']['tenantId']
@@ -21,11 +31,15 @@ def get_product(event, context):
     logger.log_with_tenant_context(event, params)
     key = params['id']
     logger.log_with_tenant_context(event, key)
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("product key is not valid")
     product = product_service_dal.get_product(event, key)
+    if (product is None):
+        return utils.create_notfound_response("Product not found")
 
     logger.log_with_tenant_context(event, "Request completed to get a product")
     metrics_manager.record_metric(event, "SingleProductRequested", "Count", 1)
-    return utils.generate_response(product)
+    return utils.generate_response(product, event)
     
 @tracer.capture_lambda_handler
 def create_product(event, context):    
@@ -33,7 +47,11 @@ def create_product(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
 
     logger.log_with_tenant_context(event, "Request received to create a product")
-    payload = json.loads(event['body'], object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    payload = json.loads(utils.get_request_body(event), object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    if (not __is_valid_category(getattr(payload, 'category', None))):
+        return utils.create_badrequest_response("category is required")
+    if (not __is_valid_price(getattr(payload, 'price', None))):
+        return utils.create_badrequest_response("price must be a non-negative number")
     product = product_service_dal.create_product(event, payload)
     logger.log_with_tenant_context(event, "Request completed to create a product")
     metrics_manager.record_metric(event, "ProductCreated", "Count", 1)
@@ -45,10 +63,18 @@ def update_product(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
 
     logger.log_with_tenant_context(event, "Request received to update a product")
-    payload = json.loads(event['body'], object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    payload = json.loads(utils.get_request_body(event), object_hook=lambda d: SimpleNamespace(**d), parse_float=Decimal)
+    if (not __is_valid_category(getattr(payload, 'category', None))):
+        return utils.create_badrequest_response("category is required")
+    if (not __is_valid_price(getattr(payload, 'price', None))):
+        return utils.create_badrequest_response("price must be a non-negative number")
     params = event['pathParameters']
     key = params['id']
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("product key is not valid")
     product = product_service_dal.update_product(event, payload, key)
+    if (product is None):
+        return utils.create_notfound_response("Product not found")
     logger.log_with_tenant_context(event, "Request completed to update a product") 
     metrics_manager.record_metric(event, "ProductUpdated", "Count", 1)   
     return utils.generate_response(product)
@@ -61,6 +87,8 @@ def delete_product(event, context):
     logger.log_with_tenant_context(event, "Request received to delete a product")
     params = event['pathParameters']
     key = params['id']
+    if (not shard_manager.is_valid_key(event, tenantId, key)):
+        return utils.create_badrequest_response("product key is not valid")
     response = product_service_dal.delete_product(event, key)
     logger.log_with_tenant_context(event, "Request completed to delete a product")
     metrics_manager.record_metric(event, "ProductDeleted", "Count", 1)
@@ -72,9 +100,187 @@ def get_products(event, context):
     tracer.put_annotation(key="TenantId", value=tenantId)
     
     logger.log_with_tenant_context(event, "Request received to get all products")
-    response = product_service_dal.get_products(event, tenantId)
+    limit = utils.get_query_parameter(event, 'limit')
+    cursor = utils.get_query_parameter(event, 'cursor')
+    category = utils.get_query_parameter(event, 'category')
+    # the version changes with every write, an unchanged listing is answered without reading it
+    etag = utils.create_etag(product_service_dal.get_products_version(event, tenantId), limit, cursor, category)
+    if (utils.is_not_modified(event, etag)):
+        metrics_manager.record_metric(event, "ProductsNotModified", "Count", 1)
+        logger.log_with_tenant_context(event, "Request completed, products not modified")
+        return utils.create_not_modified_response(etag)
+
+    if (limit or cursor):
+        return __get_products_page(event, tenantId, limit, cursor, category, etag)
+
+    response = product_service_dal.get_products(event, tenantId, category=category)
     metrics_manager.record_metric(event, "ProductsRetrieved", "Count", len(response))
     logger.log_with_tenant_context(event, "Request completed to get all products")
-    return utils.generate_response(response)
+    return utils.generate_response(response, event, etag)
+
+def __get_products_page(event, tenantId, limit, cursor, category=None, etag=None):
+    try:
+        limit = int(limit) if limit else default_page_size
+    except ValueError:
+        return utils.create_badrequest_response("limit must be a number")
+    if (limit < 1 or limit > max_page_size):
+        return utils.create_badrequest_response("limit must be between 1 and " + str(max_page_size))
+
+    try:
+        products, next_cursor = product_service_dal.get_products_page(event, tenantId, limit, cursor, category)
+    except dynamodb_manager.InvalidCursorError:
+        return utils.create_badrequest_response("cursor is not valid")
+
+    metrics_manager.record_metric(event, "ProductsRetrieved", "Count", len(products))
+    logger.log_with_tenant_context(event, "Request completed to get a page of products")
+    return utils.generate_response({"items": products, "nextCursor": next_cursor}, event, etag)
+
+
+
+@tracer.capture_lambda_handler
+def export_products(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    if (export_manager.is_export_job(event)):
+        # invoked asynchronously by the request below, the export is not bound by the API Gateway timeout
+        count = product_service_dal.export_products(event, tenantId, event['exportKey'])
+        metrics_manager.record_metric(event, "ProductsExported", "Count", count)
+        logger.log_with_tenant_context(event, "Export of products completed")
+        return {"key": event['exportKey'], "count": count}
+
+    logger.log_with_tenant_context(event, "Request received to export products")
+    if (not auth_manager.isTenantAdmin(event['requestContext']['authorizer']['userRole'])):
+        logger.log_with_tenant_context(event, "Request completed as unauthorized. Only tenant admin can export products!")
+        return utils.create_unauthorized_response()
+
+    key = export_manager.get_export_key(tenantId, 'products')
+    export_manager.start_export_job(context.invoked_function_arn, event, key)
+    logger.log_with_tenant_context(event, "Request completed to start an export of products")
+    # the object is available at the url once the export has completed
+    return utils.generate_response({"key": key, "url": product_service_dal.get_export_url(event, key)})
+
+@tracer.capture_lambda_handler
+def get_products_count(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    logger.log_with_tenant_context(event, "Request received to count products")
+    count = product_service_dal.get_products_count(event, tenantId)
+    metrics_manager.record_metric(event, "ProductsCounted", "Count", 1)
+    logger.log_with_tenant_context(event, "Request completed to count products")
+    return utils.generate_response({"count": count}, event)
+
+@tracer.capture_lambda_handler
+def batch_get_products(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    logger.log_with_tenant_context(event, "Request received to get products by key")
+    keys = __get_batch_keys(event, tenantId)
+    if (keys is None):
+        return utils.create_badrequest_response("keys must be a list of 1 to " + str(max_batch_get_keys) + " product keys")
+
+    products = product_service_dal.batch_get_products(event, keys)
+    metrics_manager.record_metric(event, "ProductsRetrievedByKey", "Count", len(keys))
+    logger.log_with_tenant_context(event, "Request completed to get products by key")
+    return utils.generate_response(products, event)
+
+def __get_batch_keys(event, tenantId):
+    """ Returns the keys of the request body, None when they are not valid
+    """
+    try:
+        keys = json.loads(utils.get_request_body(event) or '{}').get('keys')
+    except (ValueError, AttributeError):
+        return None
+    if (not isinstance(keys, list) or len(keys) < 1 or len(keys) > max_batch_get_keys):
+        return None
+    for key in keys:
+        # a key is shardId:productId in one of the shards of the tenant, or a bare productId
+        if (not shard_manager.is_valid_key(event, tenantId, key)):
+            return None
+    return keys
+
+
+@tracer.capture_lambda_handler
+def import_products(event, context):
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    tracer.put_annotation(key="TenantId", value=tenantId)
+
+    logger.log_with_tenant_context(event, "Request received to import products")
+    rows = __get_import_rows(utils.get_request_body(event))
+    if (rows is None or len(rows) < 1 or len(rows) > max_import_rows):
+        return utils.create_badrequest_response("body must be a JSON array or NDJSON with 1 to " + str(max_import_rows) + " products")
+
+    # a retried import with the same idempotency keys returns the products created the first time
+    header_key = utils.get_header(event, 'Idempotency-Key')
+    results = [None] * len(rows)
+    valid_rows = []
+    idempotency_keys = {}
+    for index, row in enumerate(rows):
+        error = __validate_import_row(row)
+        if (not error):
+            idempotency_key = row.get('idempotencyKey', header_key + '/' + str(index) if header_key else None)
+            if (idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) == 0)):
+                error = "idempotencyKey must be a non empty string"
+            elif (idempotency_key is not None and idempotency_key in idempotency_keys):
+                error = "idempotencyKey is repeated in row " + str(idempotency_keys[idempotency_key])
+            elif (idempotency_key is not None):
+                idempotency_keys[idempotency_key] = index
+        if (error):
+            results[index] = {"row": index, "error": error}
+        else:
+            valid_rows.append(index)
+
+    payloads = [SimpleNamespace(**{field: rows[index][field] for field in import_fields}) for index in valid_rows]
+    keys_by_row = {index: key for key, index in idempotency_keys.items()}
+    if (payloads):
+        for index, (product, error) in zip(valid_rows, product_service_dal.import_products(event, payloads, [keys_by_row.get(index) for index in valid_rows])):
+            results[index] = {"row": index, "error": error} if error else {"row": index, "key": product.key}
+
+    created = sum(1 for result in results if "key" in result)
+    metrics_manager.record_metric(event, "ProductsImported", "Count", created)
+    logger.log_with_tenant_context(event, "Request completed to import products")
+    return utils.generate_response({"created": created, "failed": len(results) - created, "results": results}, event)
+
+def __get_import_rows(body):
+    """ Returns the rows of a JSON array, {"products": [...]} or NDJSON body, None when it is not valid.
+    An NDJSON line that cannot be parsed is returned as is and reported as a failed row.
+    """
+    if (not body):
+        return None
+    try:
+        document = json.loads(body, parse_float=Decimal)
+    except ValueError:
+        rows = []
+        for line in body.splitlines():
+            if (line.strip()):
+                try:
+                    rows.append(json.loads(line, parse_float=Decimal))
+                except ValueError:
+                    rows.append(line)
+        return rows
+    if (isinstance(document, dict)):
+        # a single line NDJSON body is one product
+        document = document['products'] if 'products' in document else [document]
+    return document if isinstance(document, list) else None
+
+def __validate_import_row(row):
+    if (not isinstance(row, dict)):
+        return "row is not a JSON object"
+    for field in import_fields:
+        if (field not in row):
+            return field + " is required"
+    if (not __is_valid_price(row['price'])):
+        return "price must be a non-negative number"
+    if (not __is_valid_category(row['category'])):
+        return "category is required"
+    return None
+
+def __is_valid_category(category):
+    # category is a key of the category index, it cannot be empty
+    return isinstance(category, str) and len(category) > 0
 
-  
\ No newline at end of file
+def __is_valid_price(price):
+    # JSON numbers are parsed as int or Decimal, booleans are ints in Python
+    return not isinstance(price, bool) and isinstance(price, (int, Decimal)) and price >= 0
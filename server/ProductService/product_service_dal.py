@@ -7,9 +7,17 @@ import boto3
 from botocore.exceptions import ClientError
 import uuid
 import json
+import time
 import logger
-import random
-import threading
+import client_manager
+import fanout_executor
+import dynamodb_manager
+import shard_manager
+import counter_manager
+import export_manager
+import cache_manager
+import metrics_manager
+from contextlib import closing
 
 from product_models import Product
 from types import SimpleNamespace
@@ -18,36 +26,67 @@ from boto3.dynamodb.conditions import Key
 
 is_pooled_deploy = os.environ['IS_POOLED_DEPLOY']
 table_name = os.environ['PRODUCT_TABLE_NAME']
-dynamodb = None
+export_bucket_name = os.environ.get('EXPORT_BUCKET_NAME')
 
-suffix_start = 1 
-suffix_end = 10
+# leave headroom for serialization within the 29 seconds API Gateway timeout
+shard_query_timeout = int(os.environ.get('SHARD_QUERY_TIMEOUT_SECONDS', 20))
+# product ids of imported rows are derived from their idempotency key within this namespace
+import_namespace = uuid.UUID('0f8e1c52-3b8a-4d5e-9a61-7c2d4b9e5f13')
+# keyed by shardId and category, so a category is read without reading the rest of the catalog
+category_index_name = 'ProductCategoryIndex'
+
+# products read by this container, a max of 0 entries disables the cache.
+# Updates and deletes run in other functions and cannot reach it, a product read
+# here may be stale for up to the TTL after it was written.
+product_cache = cache_manager.LruTtlCache(
+    int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 1000)),
+    int(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', 30)))
 
 def get_product(event, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    shardId, productId = shard_manager.split_key(key)
+    logger.log_with_tenant_context(event, shardId)
+    logger.log_with_tenant_context(event, productId)
+
+    # a reshard changes the shard of a product, the key it was handed out with still resolves
+    product = product_cache.get(tenantId, productId)
+    if (product is not None):
+        metrics_manager.record_metric(event, "ProductCacheHit", "Count", 1)
+        return product
+    metrics_manager.record_metric(event, "ProductCacheMiss", "Count", 1)
+
+    table = __get_dynamodb_table(event)
     
     try:
-        shardId = key.split(":")[0]
-        productId = key.split(":")[1] 
-        logger.log_with_tenant_context(event, shardId)
-        logger.log_with_tenant_context(event, productId)
-        response = table.get_item(Key={'shardId': shardId, 'productId': productId})
-        item = response['Item']
-        product = Product(item['shardId'], item['productId'], item['sku'], item['name'], item['price'], item['category'])
+        item = shard_manager.get_item(event, table, 'shardId', 'productId', tenantId, key)
+        if (item is None):
+            return None
+        product = Product.from_item(item)
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error getting a product', e)
     else:
         logger.info("GetItem succeeded:"+ str(product))
+        evicted = product_cache.put(tenantId, productId, product)
+        if (evicted):
+            metrics_manager.record_metric(event, "ProductCacheEviction", "Count", evicted)
         return product
 
 def delete_product(event, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
+    
+    tenantId = event['requestContext']['authorizer']['tenantId']
     
     try:
-        shardId = key.split(":")[0]
-        productId = key.split(":")[1] 
-        response = table.delete_item(Key={'shardId':shardId, 'productId': productId})
+        shardId, productId = shard_manager.split_key(key)
+        response = __delete_product(table, tenantId, shardId, productId) if shardId else None
+        if (response is None):
+            # moved by a reshard since the key was handed out, or a bare id
+            item = shard_manager.find_item(event, table, 'shardId', 'productId', tenantId, productId)
+            response = __delete_product(table, tenantId, item['shardId'], productId) if item else None
+        if (response is None):
+            logger.info("Product to delete does not exist")
+            return None
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error deleting a product', e)
@@ -55,29 +94,45 @@ def delete_product(event, key):
         logger.info("DeleteItem succeeded:")
         return response
 
+def __delete_product(table, tenantId, shardId, productId):
+    try:
+        # the product is only uncounted when it existed
+        return table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Delete': {
+                    'TableName': table.name,
+                    'Key': {'shardId': shardId, 'productId': productId},
+                    'ConditionExpression': 'attribute_exists(productId)'
+                }
+            },
+            counter_manager.get_transact_increment(table.name, counter_manager.get_counter_key('shardId', 'productId', tenantId, productId), -1)
+        ])
+    except ClientError as e:
+        if (dynamodb_manager.is_condition_failure(e)):
+            return None
+        raise
+
 
 def create_product(event, payload):
     tenantId = event['requestContext']['authorizer']['tenantId']    
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
 
     
-    suffix = random.randrange(suffix_start, suffix_end)
-    shardId = tenantId+"-"+str(suffix)
+    productId = str(uuid.uuid4())
+    shardId = shard_manager.get_write_partition_id(event, tenantId, productId)
 
-    product = Product(shardId, str(uuid.uuid4()), payload.sku,payload.name, payload.price, payload.category)
+    product = Product(shardId, productId, payload.sku,payload.name, payload.price, payload.category)
     
     try:
-        response = table.put_item(
-            Item=
-                {
-                    'shardId': shardId,  
-                    'productId': product.productId,
-                    'sku': product.sku,
-                    'name': product.name,
-                    'price': product.price,
-                    'category': product.category
+        response = table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Put': {
+                    'TableName': table.name,
+                    'Item': product.to_item()
                 }
-        )
+            },
+            counter_manager.get_transact_increment(table.name, counter_manager.get_counter_key('shardId', 'productId', tenantId, productId), 1)
+        ])
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error adding a product', e)
@@ -85,27 +140,69 @@ def create_product(event, payload):
         logger.info("PutItem succeeded:")
         return product
 
+def import_products(event, payloads, idempotencyKeys=None):
+    """ Creates products in bulk with BatchWriteItem, spread over the tenant shards by id.
+    A row with an idempotency key always gets the same product id, so an import that is
+    retried does not create its products again, the products already written are returned.
+
+    Args:
+        event: lambda event with authorizer context
+        payloads (list): products to create, with sku, name, price and category
+        idempotencyKeys (list): idempotency key of every row, None for a row without one
+
+    Returns:
+        list of (Product, error message or None when it was created), in the same order as payloads
+    """
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    table = __get_dynamodb_table(event)
+    deadline = time.monotonic() + shard_query_timeout
+    idempotencyKeys = idempotencyKeys or [None] * len(payloads)
+
+    productIds = [str(uuid.uuid5(import_namespace, tenantId + '/' + key)) if key else str(uuid.uuid4()) for key in idempotencyKeys]
+    products = [Product(shard_manager.get_write_partition_id(event, tenantId, productId), productId, payload.sku, payload.name, payload.price, payload.category) for productId, payload in zip(productIds, payloads)]
+
+    try:
+        # products of a row imported before are only in the shards their id hashes to
+        keyedIds = [productId for productId, key in zip(productIds, idempotencyKeys) if key]
+        existing = {item['productId']: Product.from_item(item) for item in
+            shard_manager.batch_find_items(event, table, 'shardId', 'productId', tenantId, keyedIds, shard_query_timeout, other_shards=False) if item}
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error importing products', e)
+
+    new_products = [product for product in products if product.productId not in existing]
+    errors = dynamodb_manager.batch_write_items(table, [product.to_item() for product in new_products], max(deadline - time.monotonic(), 0))
+    written = [product.productId for product, error in zip(new_products, errors) if error is None]
+    if (written):
+        # BatchWriteItem is not transactional, the products written are counted afterwards
+        # and a failure in between is corrected by the counter reconciliation
+        try:
+            __count_created(table, tenantId, written)
+        except ClientError as e:
+            logger.error('Error counting imported products: {0}'.format(e.response['Error']['Message']))
+
+    logger.info("Batch write products completed")
+    errors_by_id = {product.productId: error for product, error in zip(new_products, errors)}
+    return [(existing[product.productId], None) if product.productId in existing else (product, errors_by_id[product.productId]) for product in products]
+
 def update_product(event, payload, key):
-    table = __get_dynamodb_table(event, dynamodb)
+    table = __get_dynamodb_table(event)
+    tenantId = event['requestContext']['authorizer']['tenantId']
     
     try:
-        shardId = key.split(":")[0]
-        productId = key.split(":")[1] 
+        shardId, productId = shard_manager.split_key(key)
         logger.log_with_tenant_context(event, shardId)
         logger.log_with_tenant_context(event, productId)
 
-        product = Product(shardId,productId,payload.sku, payload.name, payload.price, payload.category)
-
-        response = table.update_item(Key={'shardId':product.shardId, 'productId': product.productId},
-        UpdateExpression="set sku=:sku, #n=:productName, price=:price, category=:category",
-        ExpressionAttributeNames= {'#n':'name'},
-        ExpressionAttributeValues={
-            ':sku': product.sku,
-            ':productName': product.name,
-            ':price': product.price,
-            ':category': product.category
-        },
-        ReturnValues="UPDATED_NEW")
+        product = __update_product(table, tenantId, Product(shardId, productId, payload.sku, payload.name, payload.price, payload.category)) if shardId else None
+        if (product is None):
+            # moved by a reshard since the key was handed out, or a bare id
+            item = shard_manager.find_item(event, table, 'shardId', 'productId', tenantId, productId)
+            if (item is not None):
+                product = __update_product(table, tenantId, Product(item['shardId'], productId, payload.sku, payload.name, payload.price, payload.category))
+        if (product is None):
+            logger.info("Product to update does not exist")
+            return None
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error updating a product', e)
@@ -113,11 +210,51 @@ def update_product(event, payload, key):
         logger.info("UpdateItem succeeded:")
         return product        
 
-def get_products(event, tenantId):    
-    table = __get_dynamodb_table(event, dynamodb)
-    get_all_products_response =[]
+def __update_product(table, tenantId, product):
+    try:
+        # an update never creates a product, a product that is not in the shard is not written.
+        # The counter of the product is touched in the same transaction, so listings see a new version
+        table.meta.client.transact_write_items(TransactItems=[
+            {
+                'Update': {
+                    'TableName': table.name,
+                    'Key': {'shardId': product.shardId, 'productId': product.productId},
+                    'UpdateExpression': "set sku=:sku, #n=:productName, price=:price, category=:category",
+                    'ConditionExpression': "attribute_exists(productId)",
+                    'ExpressionAttributeNames': {'#n': 'name'},
+                    'ExpressionAttributeValues': {
+                        ':sku': product.sku,
+                        ':productName': product.name,
+                        ':price': product.price,
+                        ':category': product.category
+                    }
+                }
+            },
+            counter_manager.get_transact_touch(table.name, counter_manager.get_counter_key('shardId', 'productId', tenantId, product.productId))
+        ])
+    except ClientError as e:
+        if (dynamodb_manager.is_condition_failure(e)):
+            return None
+        raise
+    return product
+
+def get_products(event, tenantId, category=None):
+    """ Returns the products of a tenant across all shards, use get_products_page to read them a page at a time
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+        category (string): only return the products of this category, read from the category index
+
+    Returns:
+        list of Product
+    """
+    table = __get_dynamodb_table(event)
+    get_all_products_response = []
     try:
-        __query_all_partitions(tenantId,get_all_products_response, table)
+        with closing(__query_all_partitions(shard_manager.get_read_partition_ids(event, tenantId), table, category)) as products:
+            for product in products:
+                get_all_products_response.append(product)
     except ClientError as e:
         logger.error(e.response['Error']['Message'])
         raise Exception('Error getting all products', e)
@@ -125,42 +262,152 @@ def get_products(event, tenantId):
         logger.info("Get products succeeded")
         return get_all_products_response
 
-def __query_all_partitions(tenantId,get_all_products_response, table):
-    threads = []    
-    
-    for suffix in range(suffix_start, suffix_end):
-        partition_id = tenantId+'-'+str(suffix)
-        
-        thread = threading.Thread(target=__get_tenant_data, args=[partition_id, get_all_products_response, table])
-        threads.append(thread)
-        
-    # Start threads
-    for thread in threads:
-        thread.start()
-    # Ensure all threads are finished
-    for thread in threads:
-        thread.join()
+def get_products_page(event, tenantId, limit, cursor=None, category=None):
+    """ Returns one page of the products of a tenant
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+        limit (int): maximum number of products in the page
+        cursor (string): cursor returned with the previous page, none for the first page
+        category (string): only return the products of this category, read from the category index
+
+    Returns:
+        tuple: (list of Product, cursor for the next page or None on the last page)
+    """
+    table = __get_dynamodb_table(event)
+    partition_ids = shard_manager.get_read_partition_ids(event, tenantId)
+    try:
+        if (category):
+            items, next_cursor = dynamodb_manager.query_partitions_page(table, partition_ids, 'shardId', 'productId', limit, cursor, shard_query_timeout,
+                category_index_name, ('category', category))
+        else:
+            items, next_cursor = dynamodb_manager.query_partitions_page(table, partition_ids, 'shardId', 'productId', limit, cursor, shard_query_timeout)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting a page of products', e)
+    else:
+        logger.info("Get products page succeeded")
+        return [Product.from_item(item) for item in items], next_cursor
+
+def batch_get_products(event, keys):
+    """ Returns the products with the given keys using BatchGetItem.
+    Bare productIds, and keys of products a reshard has moved since, are resolved by their productId.
+
+    Args:
+        event: lambda event with authorizer context
+        keys (list): product keys, shardId:productId or a bare productId
+
+    Returns:
+        list of Product in the same order as keys, None for keys that were not found
+    """
+    tenantId = event['requestContext']['authorizer']['tenantId']
+    table = __get_dynamodb_table(event)
+    try:
+        items = shard_manager.batch_get_items(event, table, 'shardId', 'productId', tenantId, keys, shard_query_timeout)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting products by key', e)
+    else:
+        logger.info("Batch get products succeeded")
+        return [None if item is None else Product.from_item(item) for item in items]
+
+def get_products_version(event, tenantId):
+    """ Returns the version of the products of a tenant, it changes whenever one of them is written
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+
+    Returns:
+        string, compare it for equality only
+    """
+    table = __get_dynamodb_table(event)
+    try:
+        return counter_manager.get_version(table, 'shardId', 'productId', tenantId)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the version of the products', e)
+
+def get_products_count(event, tenantId):
+    """ Returns the number of products of a tenant from its counters, without reading the products
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+
+    Returns:
+        int
+    """
+    table = __get_dynamodb_table(event)
+    try:
+        return counter_manager.get_count(table, 'shardId', 'productId', tenantId)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error getting the number of products', e)
+
+def __count_created(table, tenantId, productIds):
+    increments = {}
+    for productId in productIds:
+        counter_key = counter_manager.get_counter_key('shardId', 'productId', tenantId, productId)
+        increments.setdefault(counter_key['shardId'], [counter_key, 0])[1] += 1
+    for counter_key, amount in increments.values():
+        counter_manager.increment(table, counter_key, amount)
+
+def export_products(event, tenantId, key):
+    """ Exports the products of a tenant to the export bucket as gzip compressed NDJSON.
+    Pages are streamed from every shard as they arrive and uploaded in parts, without
+    holding the products in memory. Exports run as asynchronous jobs, without the deadline
+    of the shard queries of a request, and with the role of the function since the credentials
+    of the request can expire first. The key must be under the prefix of the tenant.
+
+    Args:
+        event: lambda event with authorizer context
+        tenantId (string):
+        key (string): object key of the export, see export_manager.get_export_key
+
+    Returns:
+        int: number of products exported
+    """
+    if (not export_manager.is_tenant_export_key(tenantId, key)):
+        raise Exception('Error exporting products, the key is not under the prefix of the tenant', key)
+    table = client_manager.get_table(table_name)
+    s3 = client_manager.get_client('s3')
+    try:
+        with closing(__query_all_partitions(shard_manager.get_read_partition_ids(event, tenantId), table, timeout_seconds=None)) as products:
+            count = export_manager.export_ndjson(s3, export_bucket_name, key, products)
+    except ClientError as e:
+        logger.error(e.response['Error']['Message'])
+        raise Exception('Error exporting products', e)
+    else:
+        logger.info("Export products succeeded")
+        return count
+
+def get_export_url(event, key):
+    """ Returns a presigned url to download an export, signed with the role of the function
+    so the url does not expire with the credentials of the request
+    """
+    return client_manager.get_client('s3').generate_presigned_url('get_object', Params={'Bucket': export_bucket_name, 'Key': key}, ExpiresIn=3600)
+
+def __query_all_partitions(partition_ids, table, category=None, timeout_seconds=shard_query_timeout):
+    """ Streams the items of every shard of a tenant, page by page, as the pages arrive
+    """
+    latencies = {}
+
+    yield from fanout_executor.stream(lambda partition_id: __get_tenant_data(partition_id, table, category), partition_ids, timeout_seconds, latencies)
+    logger.info({"shardLatenciesMs": latencies})
            
-def __get_tenant_data(partition_id, get_all_products_response, table):    
+def __get_tenant_data(partition_id, table, category=None):    
     logger.info(partition_id)
-    response = table.query(KeyConditionExpression=Key('shardId').eq(partition_id))    
-    if (len(response['Items']) > 0):
-        for item in response['Items']:
-            product = Product(item['shardId'], item['productId'], item['sku'], item['name'], item['price'], item['category'])
-            get_all_products_response.append(product)
+    query_args = {'KeyConditionExpression': Key('shardId').eq(partition_id)}
+    if (category):
+        query_args['IndexName'] = category_index_name
+        query_args['KeyConditionExpression'] = Key('shardId').eq(partition_id) & Key('category').eq(category)
+    for response in dynamodb_manager.query_pages(table, **query_args):
+        yield [Product.from_item(item) for item in response['Items']]
 
-def __get_dynamodb_table(event, dynamodb):    
+def __get_dynamodb_table(event):    
     if (is_pooled_deploy=='true'):
-        accesskey = event['requestContext']['authorizer']['accesskey']
-        secretkey = event['requestContext']['authorizer']['secretkey']
-        sessiontoken = event['requestContext']['authorizer']['sessiontoken']    
-        dynamodb = boto3.resource('dynamodb',
-                aws_access_key_id=accesskey,
-                aws_secret_access_key=secretkey,
-                aws_session_token=sessiontoken
-                )       
+        return client_manager.get_table_for_tenant(table_name, event)
     else:
-        if not dynamodb:
-            dynamodb = boto3.resource('dynamodb')
-        
-    return dynamodb.Table(table_name)
+        return client_manager.get_table(table_name)
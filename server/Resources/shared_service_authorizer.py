@@ -4,19 +4,20 @@
 import re
 import json
 import os
-import urllib.request
 import boto3
-import time
 import logger
-from jose import jwk, jwt
-from jose.utils import base64url_decode
+from jose import jwt
 import auth_manager
+import credentials_manager
+import jwks_manager
+import tenant_details_manager
 import utils
 
 region = os.environ['AWS_REGION']
 sts_client = boto3.client("sts", region_name=region)
 dynamodb = boto3.resource('dynamodb')
 table_tenant_details = dynamodb.Table('ServerlessSaaS-TenantDetails')
+table_settings = dynamodb.Table('ServerlessSaaS-Settings')
 user_pool_operation_user = os.environ['OPERATION_USERS_USER_POOL']
 app_client_operation_user = os.environ['OPERATION_USERS_APP_CLIENT']
 api_key_operation_user = os.environ['OPERATION_USERS_API_KEY']
@@ -40,24 +41,20 @@ def lambda_handler(event, context):
         api_key = api_key_operation_user      
     else:
         #get tenant user pool and app client to validate jwt token against
-        tenant_details = table_tenant_details.get_item( 
-            Key ={
-                'tenantId': unauthorized_claims['custom:tenantId']
-            }
-        )
+        tenant_details = tenant_details_manager.get_tenant_details(table_tenant_details, table_settings, unauthorized_claims['custom:tenantId'])
+        if (tenant_details is None):
+            logger.error('Unauthorized')
+            raise Exception('Unauthorized')
         logger.info(tenant_details)
-        userpool_id = tenant_details['Item']['userPoolId']
-        appclient_id = tenant_details['Item']['appClientId']        
-        api_key = tenant_details['Item']['apiKey']
+        userpool_id = tenant_details['userPoolId']
+        appclient_id = tenant_details['appClientId']        
+        api_key = tenant_details['apiKey']
 
     #get keys for tenant user pool to validate
-    keys_url = 'https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json'.format(region, userpool_id)
-    with urllib.request.urlopen(keys_url) as f:
-        response = f.read()
-    keys = json.loads(response.decode('utf-8'))['keys']
+    jwks_url = jwks_manager.get_jwks_url(region, userpool_id)
 
     #authenticate against cognito user pool using the key
-    response = validateJWT(jwt_bearer_token, appclient_id, keys)
+    response = jwks_manager.verify_token(jwt_bearer_token, appclient_id, jwks_url)
     
     #get authenticated claims
     if (response == False):
@@ -86,6 +83,7 @@ def lambda_handler(event, context):
         if (auth_manager.isTenantAdmin(user_role)):
             policy.denyMethod(HttpVerb.POST, "tenant-activation")
             policy.denyMethod(HttpVerb.GET, "tenants")
+            policy.denyMethod(HttpVerb.PUT, "tenant/*/shards")
     else:
         #if not tenant admin or system admin then only allow to get info and update info
         policy.allowMethod(HttpVerb.GET, "user/*")
@@ -101,23 +99,29 @@ def lambda_handler(event, context):
     #   Another option is to generate the STS token inside the lambda function itself, as mentioned in this blog post: https://aws.amazon.com/blogs/apn/isolating-saas-tenants-with-dynamically-generated-iam-policies/
     #   Finally, you can also consider creating one Authorizer per microservice in cases where you want the IAM policy specific to that service 
     
-    iam_policy = auth_manager.getPolicyForUser(user_role, utils.Service_Identifier.SHARED_SERVICES.value, tenant_id, region, aws_account_id)
-    logger.info(iam_policy)
+    #   Users of a tenant with the same role get the same policy, their credentials are reused until shortly before they expire
     
-    role_arn = "arn:aws:iam::{}:role/authorizer-access-role".format(aws_account_id)
-    
-    assumed_role = sts_client.assume_role(
-        RoleArn=role_arn,
-        RoleSessionName="tenant-aware-session",
-        Policy=iam_policy,
-    )
-    credentials = assumed_role["Credentials"]
+    def assume_role():
+        iam_policy = auth_manager.getPolicyForUser(user_role, utils.Service_Identifier.SHARED_SERVICES.value, tenant_id, region, aws_account_id)
+        logger.info(iam_policy)
+        
+        role_arn = "arn:aws:iam::{}:role/authorizer-access-role".format(aws_account_id)
+        
+        assumed_role = sts_client.assume_role(
+            RoleArn=role_arn,
+            RoleSessionName="tenant-aware-session",
+            Policy=iam_policy,
+        )
+        return assumed_role["Credentials"]
+
+    credentials = credentials_manager.get_credentials(tenant_id, user_role, utils.Service_Identifier.SHARED_SERVICES.value, assume_role)
 
     #pass sts credentials to lambda
     context = {
         'accesskey': credentials['AccessKeyId'], # $context.authorizer.key -> value
         'secretkey' : credentials['SecretAccessKey'],
         'sessiontoken' : credentials["SessionToken"],
+        'credentialsexpiration' : int(credentials['Expiration'].timestamp()),
         'userName': user_name,
         'tenantId': tenant_id,
         'userPoolId': userpool_id,
@@ -130,46 +134,6 @@ def lambda_handler(event, context):
     
     return authResponse
 
-def validateJWT(token, app_client_id, keys):
-    # get the kid from the headers prior to verification
-    headers = jwt.get_unverified_headers(token)
-    kid = headers['kid']
-    # search for the kid in the downloaded public keys
-    key_index = -1
-    for i in range(len(keys)):
-        if kid == keys[i]['kid']:
-            key_index = i
-            break
-    if key_index == -1:
-        logger.info('Public key not found in jwks.json')
-        return False
-    # construct the public key
-    public_key = jwk.construct(keys[key_index])
-    # get the last two sections of the token,
-    # message and signature (encoded in base64)
-    message, encoded_signature = str(token).rsplit('.', 1)
-    # decode the signature
-    decoded_signature = base64url_decode(encoded_signature.encode('utf-8'))
-    # verify the signature
-    if not public_key.verify(message.encode("utf8"), decoded_signature):
-        logger.info('Signature verification failed')
-        return False
-    logger.info('Signature successfully verified')
-    # since we passed the verification, we can now safely
-    # use the unverified claims
-    claims = jwt.get_unverified_claims(token)
-    # additionally we can verify the token expiration
-    if time.time() > claims['exp']:
-        logger.info('Token is expired')
-        return False
-    # and the Audience  (use claims['client_id'] if verifying an access token)
-    if claims['aud'] != app_client_id:
-        logger.info('Token was not issued for this audience')
-        return False
-    # now we can use the claims
-    logger.info(claims)
-    return claims
-
 
 class HttpVerb:
     GET     = "GET"
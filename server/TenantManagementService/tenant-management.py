@@ -3,6 +3,7 @@
 
 import os
 import json
+import time
 import boto3
 from boto3.dynamodb.conditions import Key
 import urllib.parse
@@ -11,6 +12,11 @@ from botocore.exceptions import ClientError
 import logger
 import metrics_manager
 import auth_manager
+import client_manager
+import shard_manager
+import counter_manager
+import dynamodb_manager
+import tenant_details_manager
 import requests
 from aws_requests_auth.aws_auth import AWSRequestsAuth
 
@@ -19,12 +25,19 @@ tracer = Tracer()
 
 
 region = os.environ['AWS_REGION']
+# authorizer responses are cached for up to 30 seconds, on top of the tenant details the authorizers
+# cache until they see the version bump, writes can reach retired shards until then
+reshard_settle_seconds = int(os.environ.get('RESHARD_SETTLE_SECONDS', 120))
+tenant_details_version_key = tenant_details_manager.tenant_details_version_key
 
 #This method has been locked down to be only
 def create_tenant(event, context):
     
     api_gateway_url = ''       
-    tenant_details = json.loads(event['body'])
+    tenant_details = json.loads(utils.get_request_body(event))
+    shard_count = tenant_details.get('shardCount', shard_manager.DEFAULT_SHARD_COUNT)
+    if (not shard_manager.is_valid_shard_count(shard_count)):
+        return utils.create_badrequest_response("shardCount must be a number between 1 and " + str(shard_manager.MAX_SHARD_COUNT))
 
     dynamodb = boto3.resource('dynamodb')
     table_tenant_details = dynamodb.Table('ServerlessSaaS-TenantDetails')#TODO: read table names from env vars
@@ -54,9 +67,11 @@ def create_tenant(event, context):
                     'appClientId': tenant_details['appClientId'],
                     'dedicatedTenancy': tenant_details['dedicatedTenancy'],
                     'isActive': True,
-                    'apiGatewayUrl': api_gateway_url
+                    'apiGatewayUrl': api_gateway_url,
+                    'shardCount': shard_count
                 }
             )                    
+        dynamodb_manager.bump_version(table_system_settings, tenant_details_version_key)
 
     except Exception as e:
         raise Exception('Error creating a new tenant', e)
@@ -68,11 +83,14 @@ def get_tenants(event, context):
     table_tenant_details = __getTenantManagementTable(event)
 
     try:
+        etag = utils.create_etag(dynamodb_manager.get_version(__getSettingsTable(event), tenant_details_version_key))
+        if (utils.is_not_modified(event, etag)):
+            return utils.create_not_modified_response(etag)
         response = table_tenant_details.scan()
     except Exception as e:
         raise Exception('Error getting all tenants', e)
     else:
-        return utils.generate_response(response['Items'])    
+        return utils.generate_response(response['Items'], event, etag)    
 
 
 @tracer.capture_lambda_handler
@@ -83,7 +101,7 @@ def update_tenant(event, context):
     requesting_tenant_id = event['requestContext']['authorizer']['tenantId']    
     user_role = event['requestContext']['authorizer']['userRole']
 
-    tenant_details = json.loads(event['body'])
+    tenant_details = json.loads(utils.get_request_body(event))
     tenant_id = event['pathParameters']['tenantid']
     
     tracer.put_annotation(key="TenantId", value=tenant_id)
@@ -117,7 +135,7 @@ def update_tenant(event, context):
                 },
             ReturnValues="UPDATED_NEW"
             )             
-            
+        dynamodb_manager.bump_version(__getSettingsTable(event), tenant_details_version_key)
         
         logger.log_with_tenant_context(event, response_update)     
 
@@ -192,13 +210,15 @@ def deactivate_tenant(event, context):
                 },
             ReturnValues="ALL_NEW"
             )             
+        dynamodb_manager.bump_version(__getSettingsTable(event), tenant_details_version_key)
         
         logger.log_with_tenant_context(event, response)
 
-        if (response["Attributes"]["dedicatedTenancy"].upper() == "TRUE"):
-            update_details = {}
-            update_details['tenantId'] = tenant_id            
-            update_user_response = __invoke_deprovision_tenant(update_details, headers, auth, host, stage_name, url_deprovision_tenant)
+        # dedicated tenants have their stack removed, the data of pooled tenants is purged from the pooled tables
+        update_details = {}
+        update_details['tenantId'] = tenant_id            
+        update_details['dedicatedTenancy'] = response["Attributes"]["dedicatedTenancy"]
+        update_user_response = __invoke_deprovision_tenant(update_details, headers, auth, host, stage_name, url_deprovision_tenant)
 
         
         update_details = {}
@@ -246,6 +266,7 @@ def activate_tenant(event, context):
                 },
             ReturnValues="ALL_NEW"
             )             
+        dynamodb_manager.bump_version(__getSettingsTable(event), tenant_details_version_key)
         
         logger.log_with_tenant_context(event, response)
 
@@ -269,6 +290,124 @@ def activate_tenant(event, context):
         logger.log_with_tenant_context(event, "Request completed as unauthorized. Only system admin can activate tenant!")        
         return utils.create_unauthorized_response()    
 
+@tracer.capture_lambda_handler
+def reshard_tenant(event, context):
+    """ Changes the number of shards used for the products and orders of a tenant.
+    Reads cover both the old and the new shards until every item has been moved out of
+    the retired shards, so this can run while the tenant is live. Moving the items can take
+    longer than a single request, call again until the response reports completion.
+    """
+    table_tenant_details = __getTenantManagementTable(event)
+    user_role = event['requestContext']['authorizer']['userRole']
+
+    tenant_id = event['pathParameters']['tenantid']
+    tracer.put_annotation(key="TenantId", value=tenant_id)
+
+    logger.log_with_tenant_context(event, "Request received to reshard tenant")
+
+    if (not auth_manager.isSystemAdmin(user_role)):
+        logger.log_with_tenant_context(event, "Request completed as unauthorized. Only system admin can reshard tenant!")
+        return utils.create_unauthorized_response()
+
+    try:
+        body = json.loads(utils.get_request_body(event) or '')
+    except ValueError:
+        return utils.create_badrequest_response("Request body is not valid")
+
+    shard_count = body.get('shardCount') if isinstance(body, dict) else None
+    if (not shard_manager.is_valid_shard_count(shard_count)):
+        return utils.create_badrequest_response("shardCount must be a number between 1 and " + str(shard_manager.MAX_SHARD_COUNT))
+
+    tenant = table_tenant_details.get_item(Key={'tenantId': tenant_id}).get('Item')
+    if (tenant is None):
+        return utils.create_notfound_response("Tenant not found")
+    current_shard_count = int(tenant.get('shardCount', shard_manager.DEFAULT_SHARD_COUNT))
+    retired_shard_count = max(current_shard_count, int(tenant.get('previousShardCount', 0)))
+
+    if (shard_count != current_shard_count):
+        if (shard_count < retired_shard_count):
+            table_tenant_details.update_item(
+                Key={'tenantId': tenant_id},
+                UpdateExpression="set shardCount = :shardCount, previousShardCount = :previousShardCount, reshardStartedAt = :reshardStartedAt",
+                ExpressionAttributeValues={
+                    ':shardCount': shard_count,
+                    ':previousShardCount': retired_shard_count,
+                    ':reshardStartedAt': int(time.time())
+                })
+            tenant['reshardStartedAt'] = int(time.time())
+        else:
+            # every existing item already sits in one of the new shards
+            table_tenant_details.update_item(
+                Key={'tenantId': tenant_id},
+                UpdateExpression="set shardCount = :shardCount remove previousShardCount, reshardStartedAt",
+                ExpressionAttributeValues={':shardCount': shard_count})
+            retired_shard_count = shard_count
+        dynamodb_manager.bump_version(__getSettingsTable(event), tenant_details_version_key)
+
+    if (retired_shard_count <= shard_count):
+        logger.log_with_tenant_context(event, "Request completed to reshard tenant")
+        return utils.create_success_response("Resharding complete")
+
+    # leave enough time to record progress before the lambda times out
+    deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - 5
+    drained = True
+    for table_name, sort_key_name in __getTenantDataTables(tenant):
+        table = client_manager.get_table_for_tenant(table_name, event)
+        moved, done = shard_manager.drain_partitions(table, 'shardId', sort_key_name, tenant_id, retired_shard_count, shard_count, deadline)
+        logger.log_with_tenant_context(event, {"table": table_name, "itemsMoved": moved, "drained": done})
+        if (moved):
+            # the keys of moved items changed
+            dynamodb_manager.bump_version(table, shard_manager.get_version_key('shardId', sort_key_name, tenant_id))
+        drained = drained and done
+
+    if (drained and time.time() - int(tenant.get('reshardStartedAt', 0)) > reshard_settle_seconds):
+        table_tenant_details.update_item(
+            Key={'tenantId': tenant_id},
+            UpdateExpression="remove previousShardCount, reshardStartedAt")
+        dynamodb_manager.bump_version(__getSettingsTable(event), tenant_details_version_key)
+        logger.log_with_tenant_context(event, "Request completed to reshard tenant")
+        return utils.create_success_response("Resharding complete")
+
+    logger.log_with_tenant_context(event, "Request completed, resharding still in progress")
+    return utils.create_success_response("Resharding in progress, call again to continue")
+
+@tracer.capture_lambda_handler
+def reconcile_tenant_counters(event, context):
+    """ Recomputes the product and order counters of a tenant from its data.
+    The counters are updated in the same transaction as the items they count, this corrects
+    drift left by writes that are not transactional, such as a bulk import that failed halfway.
+    """
+    table_tenant_details = __getTenantManagementTable(event)
+    user_role = event['requestContext']['authorizer']['userRole']
+
+    tenant_id = event['pathParameters']['tenantid']
+    tracer.put_annotation(key="TenantId", value=tenant_id)
+
+    logger.log_with_tenant_context(event, "Request received to reconcile tenant counters")
+
+    if (not auth_manager.isSystemAdmin(user_role)):
+        logger.log_with_tenant_context(event, "Request completed as unauthorized. Only system admin can reconcile tenant counters!")
+        return utils.create_unauthorized_response()
+
+    tenant = table_tenant_details.get_item(Key={'tenantId': tenant_id})['Item']
+    shard_count = max(int(tenant.get('shardCount', shard_manager.DEFAULT_SHARD_COUNT)), int(tenant.get('previousShardCount', 0)))
+    partition_ids = shard_manager.get_partition_ids(tenant_id, shard_count)
+
+    counts = {}
+    for table_name, sort_key_name in __getTenantDataTables(tenant):
+        table = client_manager.get_table_for_tenant(table_name, event)
+        result = counter_manager.reconcile(table, 'shardId', sort_key_name, tenant_id, partition_ids)
+        if (result is None):
+            logger.log_with_tenant_context(event, "Request completed, counters changed while reconciling")
+            return utils.create_success_response("Counters changed while reconciling, call again to retry")
+        count, correction = result
+        logger.log_with_tenant_context(event, {"table": table_name, "count": count, "correction": correction})
+        metrics_manager.record_metric(event, "CounterCorrection", "Count", abs(correction))
+        counts[sort_key_name] = count
+
+    logger.log_with_tenant_context(event, "Request completed to reconcile tenant counters")
+    return utils.generate_response({"products": counts['productId'], "orders": counts['orderId']})
+
 def load_tenant_config(event, context):
     params = event['pathParameters']
     tenantName = urllib.parse.unquote(params['tenantname'])
@@ -362,14 +501,20 @@ def __getApiKey(tenant_tier):
         return os.environ['BASIC_TIER_API_KEY']
 
 def __getTenantManagementTable(event):
-    accesskey = event['requestContext']['authorizer']['accesskey']
-    secretkey = event['requestContext']['authorizer']['secretkey']
-    sessiontoken = event['requestContext']['authorizer']['sessiontoken']    
-    dynamodb = boto3.resource('dynamodb', aws_access_key_id=accesskey, aws_secret_access_key=secretkey, aws_session_token=sessiontoken)
-    table_tenant_details = dynamodb.Table('ServerlessSaaS-TenantDetails')#TODO: read table names from env vars
+    table_tenant_details = client_manager.get_table_for_tenant('ServerlessSaaS-TenantDetails', event)#TODO: read table names from env vars
     
     return table_tenant_details
 
+def __getSettingsTable(event):
+    return client_manager.get_table_for_tenant('ServerlessSaaS-Settings', event)
+
+def __getTenantDataTables(tenant):
+    if (tenant['dedicatedTenancy'].lower() == 'true'):
+        suffix = tenant['tenantId']
+    else:
+        suffix = 'pooled'
+    return [('Product-' + suffix, 'productId'), ('Order-' + suffix, 'orderId')]
+
 class TenantInfo:
     def __init__(self, tenant_name, tenant_address, tenant_email, tenant_phone):
         self.tenant_name = tenant_name
@@ -2,26 +2,37 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
+import time
 import boto3
 import utils
 from botocore.exceptions import ClientError
 import logger
 import os
+import shard_manager
+import purge_manager
+import dynamodb_manager
+import tenant_details_manager
 from aws_lambda_powertools import Tracer
 tracer = Tracer()
 
 tenant_stack_mapping_table_name = os.environ['TENANT_STACK_MAPPING_TABLE_NAME']
+# deleting a tenant shares the write capacity of the pooled tables with the live tenants
+purge_max_writes_per_second = int(os.environ.get('PURGE_MAX_WRITES_PER_SECOND', 200))
 
 dynamodb = boto3.resource('dynamodb')
 codepipeline = boto3.client('codepipeline')
 cloudformation = boto3.client('cloudformation')
+lambda_client = boto3.client('lambda')
 table_tenant_stack_mapping = dynamodb.Table(tenant_stack_mapping_table_name)
+table_tenant_details = dynamodb.Table('ServerlessSaaS-TenantDetails')#TODO: read table names from env vars
+table_system_settings = dynamodb.Table('ServerlessSaaS-Settings')
+pooled_data_tables = [('Product-pooled', 'productId'), ('Order-pooled', 'orderId')]
 
 stack_name = 'stack-{0}'
 @tracer.capture_lambda_handler
 def provision_tenant(event, context):
     
-    tenant_details = json.loads(event['body'])
+    tenant_details = json.loads(utils.get_request_body(event))
     
     try:          
         response_ddb = table_tenant_stack_mapping.put_item(
@@ -52,6 +63,10 @@ def deprovision_tenant(event, context):
     logger.info("Request received to deprovision a tenant")
     
     tenantid_to_deprovision = event['tenantId']
+
+    # pooled tenants have no stack, their data is deleted from the pooled tables
+    if (str(event.get('dedicatedTenancy', 'true')).lower() != 'true'):
+        return __purge_pooled_tenant(event, context)
     
     try:          
         response_ddb = table_tenant_stack_mapping.delete_item(
@@ -74,3 +89,60 @@ def deprovision_tenant(event, context):
         return utils.create_success_response("Tenant Deprovisioning Started")
 
  
+
+def __purge_pooled_tenant(event, context):
+    """ Deletes the products and orders of a pooled tenant.
+    Progress is checkpointed on the tenant as purgeProgress. When the purge does not finish
+    within this invocation, the function invokes itself to resume from the checkpoint.
+    """
+    tenant_id = event['tenantId']
+    tenant = table_tenant_details.get_item(Key={'tenantId': tenant_id})['Item']
+    if (tenant.get('isActive')):
+        # the tenant was activated again while the purge was pending
+        logger.info("Tenant is active, data purge stopped")
+        return utils.create_success_response("Tenant is active, data purge stopped")
+
+    if (event.get('resumePurge') and 'purgeProgress' in tenant):
+        progress = tenant['purgeProgress']
+    else:
+        shard_count = max(int(tenant.get('shardCount', shard_manager.DEFAULT_SHARD_COUNT)), int(tenant.get('previousShardCount', 0)))
+        partition_ids = purge_manager.get_tenant_partition_ids(tenant_id, shard_count)
+        progress = {
+            'status': 'IN_PROGRESS',
+            'itemsDeleted': 0,
+            'remainingPartitions': {table_name: partition_ids for table_name, sort_key_name in pooled_data_tables},
+            'startedAt': int(time.time())
+        }
+
+    # leave enough time to checkpoint before the lambda times out
+    deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - 10
+    rate_limiter = purge_manager.RateLimiter(purge_max_writes_per_second)
+    for table_name, sort_key_name in pooled_data_tables:
+        partition_ids = progress['remainingPartitions'].get(table_name, [])
+        if (not partition_ids):
+            continue
+        table = dynamodb.Table(table_name)
+        deleted, remaining = purge_manager.purge_partitions(table, 'shardId', sort_key_name, partition_ids, deadline, rate_limiter)
+        progress['itemsDeleted'] = int(progress['itemsDeleted']) + deleted
+        progress['remainingPartitions'][table_name] = remaining
+        if (not remaining):
+            # listings cached by clients must not revalidate against an empty table
+            dynamodb_manager.bump_version(table, shard_manager.get_version_key('shardId', sort_key_name, tenant_id))
+
+    if (not any(progress['remainingPartitions'].values())):
+        progress['status'] = 'COMPLETE'
+    table_tenant_details.update_item(
+        Key={'tenantId': tenant_id},
+        UpdateExpression="set purgeProgress = :purgeProgress",
+        ExpressionAttributeValues={':purgeProgress': progress})
+    # the tenant list is served with an ETag, clients must see the purge progress change
+    dynamodb_manager.bump_version(table_system_settings, tenant_details_manager.tenant_details_version_key)
+    logger.info({"tenantId": tenant_id, "purgeStatus": progress['status'], "itemsDeleted": progress['itemsDeleted'],
+        "remainingPartitions": sum(len(partition_ids) for partition_ids in progress['remainingPartitions'].values())})
+
+    if (progress['status'] != 'COMPLETE'):
+        lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event',
+            Payload=json.dumps({'tenantId': tenant_id, 'dedicatedTenancy': 'false', 'resumePurge': True}))
+        return utils.create_success_response("Tenant data purge in progress")
+
+    return utils.create_success_response("Tenant data purged")
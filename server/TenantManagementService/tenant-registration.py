@@ -28,8 +28,10 @@ def register_tenant(event, context):
     try:
         api_key=''
         tenant_id = uuid.uuid1().hex
-        tenant_details = json.loads(event['body'])
+        tenant_details = json.loads(utils.get_request_body(event))
         tenant_details['dedicatedTenancy'] = 'false'
+        # registration is public, tenants start with the default shard count and are resharded by a system admin
+        tenant_details.pop('shardCount', None)
 
         if (tenant_details['tenantTier'].upper() == utils.TenantTier.PLATINUM.value.upper()):
             tenant_details['dedicatedTenancy'] = 'true'
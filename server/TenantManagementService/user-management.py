@@ -22,7 +22,7 @@ def create_tenant_admin_user(event, context):
     tenant_user_pool_id = os.environ['TENANT_USER_POOL_ID']
     tenant_app_client_id = os.environ['TENANT_APP_CLIENT_ID']
     
-    tenant_details = json.loads(event['body'])
+    tenant_details = json.loads(utils.get_request_body(event))
     tenant_id = tenant_details['tenantId']
     logger.info(tenant_details)
 
@@ -65,7 +65,7 @@ def create_user(event, context):
     user_pool_id = event['requestContext']['authorizer']['userPoolId']    
     user_role = event['requestContext']['authorizer']['userRole']
 
-    user_details = json.loads(event['body'])
+    user_details = json.loads(utils.get_request_body(event))
 
     tracer.put_annotation(key="TenantId", value=tenant_id)
     
@@ -161,7 +161,7 @@ def get_users(event, context):
                     user_info.user_name = user["Username"]
                     users.append(user_info)                    
         
-        return utils.generate_response(users)
+        return utils.generate_response(users, event)
     else:
         logger.log_with_tenant_context(event, "Request completed as unauthorized.")        
         return utils.create_unauthorized_response()
@@ -210,7 +210,7 @@ def update_user(event, context):
     user_pool_id = event['requestContext']['authorizer']['userPoolId']    
     user_role = event['requestContext']['authorizer']['userRole']    
     
-    user_details = json.loads(event['body'])
+    user_details = json.loads(utils.get_request_body(event))
 
     user_name = event['pathParameters']['username']    
 
@@ -1,6 +1,8 @@
 import json
 import boto3
 import logger
+import dynamodb_manager
+import tenant_details_manager
 from boto3.dynamodb.conditions import Key
 from crhelper import CfnResource
 helper = CfnResource()
@@ -48,6 +50,8 @@ def do_action(event, _):
             ':apiGatewayUrl': tenant_api_gateway_url
             },
             ReturnValues="NONE") 
+        # authorizers cache the api gateway url of the tenant until the version changes
+        dynamodb_manager.bump_version(dynamodb.Table(settings_table_name), tenant_details_manager.tenant_details_version_key)
                    
     
 @helper.delete
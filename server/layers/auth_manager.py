@@ -1,9 +1,14 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import re
 import json
+import functools
 import utils
 
+# distinct (role, service, tenant, region, account) policies kept rendered, enough for the tenants of a warm authorizer
+policy_cache_size = 4096
+
 # These are the roles being supported in this reference architecture
 class UserRoles:
     SYSTEM_ADMIN    = "SystemAdmin"
@@ -36,10 +41,12 @@ def isTenantUser(user_role):
         return False
 
 def getPolicyForUser(user_role, service_identifier, tenant_id, region, aws_account_id):
-    """ This method is being used by Authorizer to get appropriate policy by user role
+    """ This method is being used by Authorizer to get appropriate policy by user role.
+    Policies are rendered from templates compiled at import, and memoized.
 
     Args:
         user_role (string): UserRoles enum
+        service_identifier (string): utils.Service_Identifier value
         tenant_id (string): 
         region (string): 
         aws_account_id (string):  
@@ -47,16 +54,41 @@ def getPolicyForUser(user_role, service_identifier, tenant_id, region, aws_accou
     Returns:
         string: policy that tenant needs to assume
     """
-    iam_policy = ""
-    
+    return __renderPolicy(user_role, service_identifier, tenant_id, region, aws_account_id)
+
+@functools.lru_cache(maxsize=policy_cache_size)
+def __renderPolicy(user_role, service_identifier, tenant_id, region, aws_account_id):
     if (isSystemAdmin(user_role)):
-        iam_policy = __getPolicyForSystemAdmin(region, aws_account_id)
+        template = __policy_templates['SystemAdmin']
     elif (isTenantAdmin(user_role)):
-        iam_policy = __getPolicyForTenantAdmin(tenant_id, service_identifier, region, aws_account_id)
+        if (service_identifier == utils.Service_Identifier.SHARED_SERVICES.value):
+            template = __policy_templates['TenantAdmin-SharedServices']
+        else:
+            template = __policy_templates['TenantAdmin']
     elif (isTenantUser(user_role)):
-        iam_policy = __getPolicyForTenantUser(tenant_id, region, aws_account_id)
-    
-    return iam_policy
+        template = __policy_templates['TenantUser']
+    else:
+        return ""
+
+    values = {
+        'tenantId': __escape(tenant_id),
+        'region': __escape(region),
+        'awsAccountId': __escape(aws_account_id)
+    }
+    parts = list(template)
+    for index in range(1, len(parts), 2):
+        parts[index] = values[parts[index]]
+    return ''.join(parts)
+
+def __escape(value):
+    # the values end up inside JSON strings, escaped the way json.dumps escapes them
+    return json.dumps(value)[1:-1]
+
+def __compilePolicy(policy):
+    """ Splits a policy rendered with placeholders into literal text, at even indices,
+    and the names of the values that go between the literals, at odd indices
+    """
+    return tuple(re.split(r'\$\{(tenantId|region|awsAccountId)\}', policy))
 
 def __getPolicyForSystemAdmin(region, aws_account_id):
     policy = {	
@@ -70,7 +102,8 @@ def __getPolicyForSystemAdmin(region, aws_account_id):
                     "dynamodb:PutItem",
                     "dynamodb:DeleteItem",
                     "dynamodb:Query",          
-                    "dynamodb:Scan"
+                    "dynamodb:Scan",
+                    "dynamodb:BatchGetItem"
                   ],
                   "Resource": [
                        "arn:aws:dynamodb:{0}:{1}:table/*".format(region, aws_account_id),
@@ -133,7 +166,9 @@ def __getPolicyForTenantAdmin(tenant_id, sevice_identifier, region, aws_account_
                         "dynamodb:GetItem",
                         "dynamodb:PutItem",
                         "dynamodb:DeleteItem",
-                        "dynamodb:Query"    
+                        "dynamodb:Query",
+                        "dynamodb:BatchGetItem",
+                        "dynamodb:BatchWriteItem"
                     ],
                     "Resource": [
                         "arn:aws:dynamodb:{0}:{1}:table/Product-*".format(region, aws_account_id),                      
@@ -153,7 +188,8 @@ def __getPolicyForTenantAdmin(tenant_id, sevice_identifier, region, aws_account_
                         "dynamodb:GetItem",
                         "dynamodb:PutItem",
                         "dynamodb:DeleteItem",
-                        "dynamodb:Query"       
+                        "dynamodb:Query",
+                        "dynamodb:BatchGetItem"
                     ],
                     "Resource": [
                         "arn:aws:dynamodb:{0}:{1}:table/Order-*".format(region, aws_account_id),                      
@@ -182,7 +218,9 @@ def __getPolicyForTenantUser(tenant_id, region, aws_account_id):
                       "dynamodb:GetItem",
                       "dynamodb:PutItem",
                       "dynamodb:DeleteItem",
-                      "dynamodb:Query"      
+                      "dynamodb:Query",
+                      "dynamodb:BatchGetItem",
+                      "dynamodb:BatchWriteItem"
                   ],
                   "Resource": [
                       "arn:aws:dynamodb:{0}:{1}:table/Product-*".format(region, aws_account_id),                      
@@ -202,7 +240,8 @@ def __getPolicyForTenantUser(tenant_id, region, aws_account_id):
                       "dynamodb:GetItem",
                       "dynamodb:PutItem",
                       "dynamodb:DeleteItem",
-                      "dynamodb:Query"               
+                      "dynamodb:Query",
+                      "dynamodb:BatchGetItem"
                   ],
                   "Resource": [
                       "arn:aws:dynamodb:{0}:{1}:table/Order-*".format(region, aws_account_id),                      
@@ -220,3 +259,10 @@ def __getPolicyForTenantUser(tenant_id, region, aws_account_id):
     
     return json.dumps(policy)
 
+# the policies rendered once with placeholders in place of the values
+__policy_templates = {
+    'SystemAdmin': __compilePolicy(__getPolicyForSystemAdmin('${region}', '${awsAccountId}')),
+    'TenantAdmin-SharedServices': __compilePolicy(__getPolicyForTenantAdmin('${tenantId}', utils.Service_Identifier.SHARED_SERVICES.value, '${region}', '${awsAccountId}')),
+    'TenantAdmin': __compilePolicy(__getPolicyForTenantAdmin('${tenantId}', utils.Service_Identifier.BUSINESS_SERVICES.value, '${region}', '${awsAccountId}')),
+    'TenantUser': __compilePolicy(__getPolicyForTenantUser('${tenantId}', '${region}', '${awsAccountId}'))
+}
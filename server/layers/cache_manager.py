@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class LruTtlCache:
+    """ In memory cache that lives as long as the lambda container.
+    Entries are kept per namespace (e.g. tenant id), so a key of one tenant never resolves
+    to the value of another. Least recently used entries are evicted once max_entries is reached
+    and entries expire ttl_seconds after they were put.
+    """
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+
+    def get(self, namespace, key):
+        """ Returns the cached value, None when it is missing or expired
+        """
+        with self.__lock:
+            entry = self.__entries.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.__entries[(namespace, key)]
+                return None
+            self.__entries.move_to_end((namespace, key))
+            return value
+
+    def put(self, namespace, key, value):
+        """ Caches value
+
+        Returns:
+            int: number of entries evicted to make room
+        """
+        if self.max_entries <= 0:
+            return 0
+        with self.__lock:
+            self.__entries[(namespace, key)] = (value, time.monotonic() + self.ttl_seconds)
+            self.__entries.move_to_end((namespace, key))
+            evicted = 0
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def invalidate(self, namespace, key):
+        with self.__lock:
+            self.__entries.pop((namespace, key), None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
@@ -0,0 +1,193 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import boto3
+
+# STS credentials generated by the authorizer are valid for one hour by default.
+# When the authorizer does not pass the expiration we assume a slightly shorter lifetime.
+default_ttl_seconds = int(os.environ.get('CLIENT_CACHE_TTL_SECONDS', 3300))
+max_entries = int(os.environ.get('CLIENT_CACHE_MAX_ENTRIES', 32))
+# Stop handing out cached objects this many seconds before the credentials expire
+expiry_skew_seconds = 60
+
+__lock = threading.Lock()
+__cache = OrderedDict()
+__default_session = None
+
+
+class _CacheEntry:
+    def __init__(self, session, expires_at):
+        self.session = session
+        self.expires_at = expires_at
+        self.resources = {}
+        self.clients = {}
+        self.tables = {}
+
+
+def get_resource(service_name, accesskey=None, secretkey=None, sessiontoken=None, expiration=None):
+    """ Returns a boto3 resource, reused across invocations for the same credentials
+
+    Args:
+        service_name (string): e.g. dynamodb
+        accesskey (string): STS access key. When not passed, the lambda execution role is used
+        secretkey (string):
+        sessiontoken (string):
+        expiration (number): epoch seconds when the credentials expire, if known
+
+    Returns:
+        boto3 resource
+    """
+    with __lock:
+        entry = __get_entry(accesskey, secretkey, sessiontoken, expiration)
+        if service_name not in entry.resources:
+            entry.resources[service_name] = entry.session.resource(service_name)
+        return entry.resources[service_name]
+
+
+def get_client(service_name, accesskey=None, secretkey=None, sessiontoken=None, expiration=None):
+    """ Returns a boto3 client, reused across invocations for the same credentials
+
+    Args:
+        service_name (string): e.g. dynamodb
+        accesskey (string): STS access key. When not passed, the lambda execution role is used
+        secretkey (string):
+        sessiontoken (string):
+        expiration (number): epoch seconds when the credentials expire, if known
+
+    Returns:
+        boto3 client
+    """
+    with __lock:
+        entry = __get_entry(accesskey, secretkey, sessiontoken, expiration)
+        if service_name not in entry.clients:
+            entry.clients[service_name] = entry.session.client(service_name)
+        return entry.clients[service_name]
+
+
+def get_table(table_name, accesskey=None, secretkey=None, sessiontoken=None, expiration=None):
+    """ Returns a DynamoDB Table, reused across invocations for the same credentials
+
+    Args:
+        table_name (string):
+        accesskey (string): STS access key. When not passed, the lambda execution role is used
+        secretkey (string):
+        sessiontoken (string):
+        expiration (number): epoch seconds when the credentials expire, if known
+
+    Returns:
+        boto3 DynamoDB Table resource
+    """
+    with __lock:
+        entry = __get_entry(accesskey, secretkey, sessiontoken, expiration)
+        if table_name not in entry.tables:
+            if 'dynamodb' not in entry.resources:
+                entry.resources['dynamodb'] = entry.session.resource('dynamodb')
+            entry.tables[table_name] = entry.resources['dynamodb'].Table(table_name)
+        return entry.tables[table_name]
+
+
+def get_resource_for_tenant(service_name, event):
+    """ Returns a boto3 resource scoped to the STS credentials passed by the authorizer
+
+    Args:
+        service_name (string): e.g. dynamodb
+        event: lambda event with authorizer context
+
+    Returns:
+        boto3 resource
+    """
+    authorizer = event['requestContext']['authorizer']
+    return get_resource(service_name,
+        authorizer['accesskey'],
+        authorizer['secretkey'],
+        authorizer['sessiontoken'],
+        authorizer.get('credentialsexpiration'))
+
+
+def get_client_for_tenant(service_name, event):
+    """ Returns a boto3 client scoped to the STS credentials passed by the authorizer
+
+    Args:
+        service_name (string): e.g. dynamodb
+        event: lambda event with authorizer context
+
+    Returns:
+        boto3 client
+    """
+    authorizer = event['requestContext']['authorizer']
+    return get_client(service_name,
+        authorizer['accesskey'],
+        authorizer['secretkey'],
+        authorizer['sessiontoken'],
+        authorizer.get('credentialsexpiration'))
+
+
+def get_table_for_tenant(table_name, event):
+    """ Returns a DynamoDB Table scoped to the STS credentials passed by the authorizer
+
+    Args:
+        table_name (string):
+        event: lambda event with authorizer context
+
+    Returns:
+        boto3 DynamoDB Table resource
+    """
+    authorizer = event['requestContext']['authorizer']
+    return get_table(table_name,
+        authorizer['accesskey'],
+        authorizer['secretkey'],
+        authorizer['sessiontoken'],
+        authorizer.get('credentialsexpiration'))
+
+
+def clear():
+    """ Drops every cached session, resource and client
+    """
+    global __default_session
+    with __lock:
+        __cache.clear()
+        __default_session = None
+
+
+def __get_entry(accesskey, secretkey, sessiontoken, expiration):
+    global __default_session
+    if not accesskey:
+        if __default_session is None:
+            __default_session = _CacheEntry(boto3.session.Session(), None)
+        return __default_session
+
+    now = time.time()
+    __evict_expired(now)
+
+    entry = __cache.get(accesskey)
+    if entry is not None:
+        __cache.move_to_end(accesskey)
+        return entry
+
+    if expiration:
+        expires_at = float(expiration) - expiry_skew_seconds
+    else:
+        expires_at = now + default_ttl_seconds
+
+    session = boto3.session.Session(
+        aws_access_key_id=accesskey,
+        aws_secret_access_key=secretkey,
+        aws_session_token=sessiontoken)
+    entry = _CacheEntry(session, expires_at)
+    __cache[accesskey] = entry
+
+    while len(__cache) > max_entries:
+        __cache.popitem(last=False)
+
+    return entry
+
+
+def __evict_expired(now):
+    expired_keys = [key for key, entry in __cache.items() if entry.expires_at <= now]
+    for key in expired_keys:
+        del __cache[key]
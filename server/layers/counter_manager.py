@@ -0,0 +1,157 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import zlib
+
+from boto3.dynamodb.conditions import Key
+
+import dynamodb_manager
+import fanout_executor
+import shard_manager
+
+# Counter updates are spread over this many items, each in its own partition,
+# so a burst of writes for one tenant does not throttle on a single counter item.
+# Changing it requires reconciling every counter.
+COUNTER_SHARD_COUNT = 10
+max_reconcile_attempts = 3
+
+
+def get_counter_keys(partition_key_name, sort_key_name, tenant_id):
+    """ Keys of every counter item of a tenant in a table.
+    They are kept outside the numbered shards, so reads of the data never return them.
+
+    Args:
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+
+    Returns:
+        list of dict primary keys
+    """
+    return [{partition_key_name: partition_id, sort_key_name: 'count'} for partition_id in get_counter_partition_ids(tenant_id)]
+
+
+def get_counter_partition_ids(tenant_id):
+    return [tenant_id + '-count-' + str(suffix) for suffix in range(1, COUNTER_SHARD_COUNT + 1)]
+
+
+def get_counter_key(partition_key_name, sort_key_name, tenant_id, item_id):
+    """ Key of the counter item that records the create and delete of an item
+    """
+    suffix = zlib.crc32(item_id.encode('utf-8')) % COUNTER_SHARD_COUNT + 1
+    return {partition_key_name: tenant_id + '-count-' + str(suffix), sort_key_name: 'count'}
+
+
+def get_transact_increment(table_name, key, amount):
+    """ Returns a TransactWriteItems update adding amount to a counter item,
+    to be written in the same transaction as the item it counts.
+    It also bumps the version of the counter item, see get_version.
+    """
+    return {
+        'Update': {
+            'TableName': table_name,
+            'Key': key,
+            'UpdateExpression': 'add #count :amount, #version :one',
+            'ExpressionAttributeNames': {'#count': 'count', '#version': 'version'},
+            'ExpressionAttributeValues': {':amount': amount, ':one': 1}
+        }
+    }
+
+
+def get_transact_touch(table_name, key):
+    """ Returns a TransactWriteItems update bumping the version of a counter item,
+    to be written in the same transaction as an update of an item it counts
+    """
+    return {
+        'Update': {
+            'TableName': table_name,
+            'Key': key,
+            'UpdateExpression': 'add #version :one',
+            'ExpressionAttributeNames': {'#version': 'version'},
+            'ExpressionAttributeValues': {':one': 1}
+        }
+    }
+
+
+def increment(table, key, amount):
+    table.update_item(Key=key, UpdateExpression='add #count :amount, #version :one',
+        ExpressionAttributeNames={'#count': 'count', '#version': 'version'}, ExpressionAttributeValues={':amount': amount, ':one': 1})
+
+
+def get_version(table, partition_key_name, sort_key_name, tenant_id):
+    """ Version of the data of a tenant in a table, it changes whenever an item is written.
+    Item writes bump the version of the counter item of the item in the same transaction,
+    so the bumps are spread over the counter shards like the counts. Writes of many items at
+    once, such as a purge or a reshard, bump the version marker of the tenant instead.
+    Both are read with a single strongly consistent BatchGetItem.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+
+    Returns:
+        string, e.g. 3.1042. A purge resets the counters, the marker it bumps keeps the version from repeating.
+    """
+    marker_key = shard_manager.get_version_key(partition_key_name, sort_key_name, tenant_id)
+    items = dynamodb_manager.batch_get_items(table, [marker_key] + get_counter_keys(partition_key_name, sort_key_name, tenant_id),
+        (partition_key_name, sort_key_name), attribute_names=['version'], consistent_read=True)
+    versions = [int(item.get('version', 0)) if item else 0 for item in items]
+    return str(versions[0]) + '.' + str(sum(versions[1:]))
+
+
+def get_count(table, partition_key_name, sort_key_name, tenant_id):
+    """ Sums the counter items of a tenant with a single BatchGetItem
+
+    Returns:
+        int
+    """
+    items = dynamodb_manager.batch_get_items(table, get_counter_keys(partition_key_name, sort_key_name, tenant_id),
+        (partition_key_name, sort_key_name))
+    return sum(int(item['count']) for item in items if item)
+
+
+def reconcile(table, partition_key_name, sort_key_name, tenant_id, partition_ids, timeout_seconds=None):
+    """ Recomputes the counters of a tenant from its data.
+    The items are counted while the counters are unchanged, then the difference is added
+    to one counter item, so increments made concurrently are preserved. Every write of an
+    item bumps the version of its counter item, so a create and a delete that cancel out
+    still show as a change and the count is retried.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        partition_ids (list): every shard holding items of the tenant
+        timeout_seconds (number): deadline for counting the shards
+
+    Returns:
+        tuple: (number of items, correction applied to the counters), None when the
+        counters kept changing while the items were counted
+    """
+    for attempt in range(max_reconcile_attempts):
+        counters_before = __get_counters(table, partition_key_name, sort_key_name, tenant_id)
+        response = fanout_executor.run(lambda partition_id: __count_partition(table, partition_key_name, partition_id),
+            partition_ids, timeout_seconds)
+        item_count = sum(response.results)
+        if counters_before != __get_counters(table, partition_key_name, sort_key_name, tenant_id):
+            continue
+        correction = item_count - sum(count for count, version in counters_before)
+        if correction:
+            increment(table, get_counter_keys(partition_key_name, sort_key_name, tenant_id)[0], correction)
+        return item_count, correction
+    return None
+
+
+def __get_counters(table, partition_key_name, sort_key_name, tenant_id):
+    # (count, version) of every counter item, strongly consistent so a completed write is seen
+    items = dynamodb_manager.batch_get_items(table, get_counter_keys(partition_key_name, sort_key_name, tenant_id),
+        (partition_key_name, sort_key_name), consistent_read=True)
+    return [(int(item.get('count', 0)), int(item.get('version', 0))) if item else (0, 0) for item in items]
+
+
+def __count_partition(table, partition_key_name, partition_id):
+    return sum(response['Count'] for response in dynamodb_manager.query_pages(table,
+        KeyConditionExpression=Key(partition_key_name).eq(partition_id), Select='COUNT'))
@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import time
+import threading
+
+import metrics_manager
+from cache_manager import LruTtlCache
+
+# credentials handed out must outlive the authorizer cache of API Gateway and the requests using them
+refresh_margin_seconds = int(os.environ.get('STS_CREDENTIALS_REFRESH_MARGIN_SECONDS', 300))
+# AssumeRole credentials last one hour by default, entries expire with them at the latest
+credentials = LruTtlCache(int(os.environ.get('STS_CREDENTIALS_CACHE_MAX_ENTRIES', 1000)), 3600)
+# a refresh of one key does not wait for the refresh of another, unless they share a stripe
+__refresh_locks = [threading.Lock() for _ in range(64)]
+
+stats = {'hits': 0, 'misses': 0}
+
+
+def get_credentials(tenant_id, user_role, service_identifier, assume_role):
+    """ Assumed role credentials of a tenant, shared by every user of the tenant with the same role.
+    The scoped down policy depends only on these, so their credentials are interchangeable.
+    Credentials are reused until refresh_margin_seconds before they expire, concurrent misses
+    for the same key wait for a single AssumeRole call.
+
+    Args:
+        tenant_id (string):
+        user_role (string):
+        service_identifier (string): see utils.Service_Identifier
+        assume_role (function): calls AssumeRole, returns the Credentials of the response
+
+    Returns:
+        dict: Credentials with AccessKeyId, SecretAccessKey, SessionToken and Expiration
+    """
+    key = (user_role, service_identifier)
+    cached = __get_fresh(tenant_id, key)
+    if (cached is None):
+        with __refresh_locks[hash((tenant_id, key)) % len(__refresh_locks)]:
+            cached = __get_fresh(tenant_id, key)
+            if (cached is None):
+                __record(tenant_id, 'StsCredentialsCacheMiss', 'misses')
+                cached = assume_role()
+                credentials.put(tenant_id, key, cached)
+                return cached
+    __record(tenant_id, 'StsCredentialsCacheHit', 'hits')
+    return cached
+
+
+def get_hit_rate():
+    lookups = stats['hits'] + stats['misses']
+    return stats['hits'] / lookups if lookups else 0.0
+
+
+def clear():
+    credentials.clear()
+    stats['hits'] = 0
+    stats['misses'] = 0
+
+
+def __get_fresh(tenant_id, key):
+    cached = credentials.get(tenant_id, key)
+    if (cached is not None and cached['Expiration'].timestamp() - refresh_margin_seconds <= time.time()):
+        credentials.invalidate(tenant_id, key)
+        return None
+    return cached
+
+
+def __record(tenant_id, metric_name, stat_name):
+    stats[stat_name] += 1
+    metrics_manager.record_tenant_metric(tenant_id, metric_name, 'Count', 1)
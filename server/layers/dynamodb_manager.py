@@ -0,0 +1,322 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import time
+import base64
+import random
+import binascii
+
+import fanout_executor
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+
+# BatchGetItem accepts at most 100 keys and BatchWriteItem 25 items per request
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+max_batch_attempts = 8
+
+
+class UnprocessedItemsError(Exception):
+    """Raised when DynamoDB keeps returning unprocessed items after every retry"""
+    pass
+
+
+class InvalidCursorError(Exception):
+    """Raised when a paging cursor cannot be decoded or does not belong to the partitions queried"""
+    pass
+
+
+def query_pages(table, **query_args):
+    """ Queries a table and follows LastEvaluatedKey until every page has been read
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        query_args: arguments passed to table.query, e.g. KeyConditionExpression
+
+    Returns:
+        generator of query responses, one per page
+    """
+    while True:
+        response = table.query(**query_args)
+        yield response
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if not last_evaluated_key:
+            break
+        query_args['ExclusiveStartKey'] = last_evaluated_key
+
+
+def query_partitions_page(table, partition_ids, partition_key_name, sort_key_name, limit, cursor=None, timeout_seconds=None, index_name=None, index_sort_key=None):
+    """ Reads one page of at most limit items across write sharded partitions
+
+    Partitions are read in parallel, round robin: every round splits the items still
+    missing from the page between the partitions that still have items, so every item
+    read is returned and a page reads no more than limit items.
+    The cursor records, for every partition that still has items, the sort key of the
+    last item read from it, so the next page resumes each partition exactly there.
+
+    With index_name, only the slice of every partition matching index_sort_key is read
+    from an index that shares the partition key of the table, e.g. the products of one category.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        partition_ids (list): partition key values, e.g. tenant shard ids
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        limit (int): maximum number of items to return
+        cursor (string): cursor returned with the previous page, none for the first page
+        timeout_seconds (number): deadline for each round of partition queries
+        index_name (string): index to query instead of the table
+        index_sort_key (tuple): (name, value) of the index sort key, e.g. ('category', 'books')
+
+    Returns:
+        tuple: (list of items, cursor for the next page or None when every partition is exhausted)
+    """
+    positions = decode_cursor(cursor, partition_ids)
+    items = []
+
+    while len(items) < limit and positions:
+        remaining = limit - len(items)
+        open_partitions = [partition_id for partition_id in partition_ids if partition_id in positions][:remaining]
+        shares = [remaining // len(open_partitions) + (1 if index < remaining % len(open_partitions) else 0)
+            for index in range(len(open_partitions))]
+        response = fanout_executor.run(
+            lambda index: __query_partition(table, partition_key_name, open_partitions[index], sort_key_name,
+                positions[open_partitions[index]], shares[index], index_name, index_sort_key),
+            range(len(open_partitions)), timeout_seconds)
+
+        for partition_id, (page_items, last_evaluated_key) in zip(open_partitions, response.results):
+            items.extend(page_items)
+            if last_evaluated_key:
+                positions[partition_id] = last_evaluated_key[sort_key_name]
+            else:
+                del positions[partition_id]
+
+    return items, encode_cursor(positions)
+
+
+def encode_cursor(positions):
+    """ Encodes partition positions into an opaque, url safe cursor
+
+    Args:
+        positions (dict): partition id -> last sort key read, None when the partition has not been read yet
+
+    Returns:
+        string cursor, None when there is nothing left to read
+    """
+    if not positions:
+        return None
+    document = json.dumps(positions, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(document.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, partition_ids):
+    """ Decodes a cursor created by encode_cursor
+
+    Args:
+        cursor (string): cursor, none to start from the beginning of every partition
+        partition_ids (list): partitions the caller is allowed to read
+
+    Returns:
+        dict: partition id -> last sort key read, None when the partition has not been read yet
+    """
+    if not cursor:
+        return {partition_id: None for partition_id in partition_ids}
+
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise InvalidCursorError('Cursor is not valid')
+
+    if not isinstance(positions, dict) or not set(positions).issubset(partition_ids):
+        raise InvalidCursorError('Cursor is not valid')
+    # positions are passed to DynamoDB as sort keys, which are strings
+    if not all(position is None or isinstance(position, str) for position in positions.values()):
+        raise InvalidCursorError('Cursor is not valid')
+    return positions
+
+
+def is_condition_failure(error):
+    """ True when a ClientError was raised because a condition of the write, or of one
+    of the writes of a transaction, did not hold
+    """
+    if error.response['Error']['Code'] == 'ConditionalCheckFailedException':
+        return True
+    reasons = [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+    return 'ConditionalCheckFailed' in reasons
+
+
+def get_version(table, key):
+    """ Reads a version marker item, strongly consistent so a version bumped by a completed write is seen
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        key (dict): primary key of the marker item
+
+    Returns:
+        int version, 0 when nothing has been written yet
+    """
+    item = table.get_item(Key=key, ConsistentRead=True,
+        ProjectionExpression='#version', ExpressionAttributeNames={'#version': 'version'}).get('Item')
+    return int(item['version']) if item else 0
+
+
+def bump_version(table, key):
+    """ Increments a version marker item. Call after the write it records has completed,
+    so that a reader that sees the new version also sees the write.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        key (dict): primary key of the marker item
+    """
+    table.update_item(Key=key, UpdateExpression='add #version :one',
+        ExpressionAttributeNames={'#version': 'version'}, ExpressionAttributeValues={':one': 1})
+
+
+def batch_get_items(table, keys, key_names, timeout_seconds=None, attribute_names=None, consistent_read=False):
+    """ Reads items by key with BatchGetItem, in parallel chunks of 100 keys.
+    Unprocessed keys are retried with exponential backoff.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        keys (list): dicts with the primary key of every item, duplicates are allowed
+        key_names (tuple): primary key attribute names, e.g. ('shardId', 'productId')
+        timeout_seconds (number): deadline for all the chunks
+        attribute_names (list): only read these attributes and the key, every attribute when not passed
+        consistent_read (bool): strongly consistent reads, e.g. of version markers
+
+    Returns:
+        list: the item for every key, in the same order as keys, None where the item does not exist
+    """
+    unique_keys = list({__key_of(key, key_names): key for key in keys}.values())
+    chunks = [unique_keys[i:i + BATCH_GET_SIZE] for i in range(0, len(unique_keys), BATCH_GET_SIZE)]
+
+    request = {}
+    if attribute_names:
+        names = list(key_names) + [name for name in attribute_names if name not in key_names]
+        request['ProjectionExpression'] = ', '.join('#a' + str(index) for index in range(len(names)))
+        request['ExpressionAttributeNames'] = {'#a' + str(index): name for index, name in enumerate(names)}
+    if consistent_read:
+        request['ConsistentRead'] = True
+
+    response = fanout_executor.run(lambda index: __batch_get_chunk(table, chunks[index], request), range(len(chunks)), timeout_seconds)
+
+    items_by_key = {}
+    for items in response.results:
+        for item in items:
+            items_by_key[__key_of(item, key_names)] = item
+    return [items_by_key.get(__key_of(key, key_names)) for key in keys]
+
+
+def batch_write_items(table, items, timeout_seconds=None):
+    """ Puts items with BatchWriteItem, in parallel chunks of 25 items.
+    Unprocessed items are retried with exponential backoff.
+    A chunk that fails does not stop the other chunks, its items are reported as failed.
+    No request is started after the deadline, the items not written by then are reported
+    as failed, so the caller always learns which items were written.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        items (list): items to put, their primary keys must be unique
+        timeout_seconds (number): deadline for all the chunks
+
+    Returns:
+        list: for every item, in the same order as items, None when it was written or the error message
+    """
+    chunks = [items[i:i + BATCH_WRITE_SIZE] for i in range(0, len(items), BATCH_WRITE_SIZE)]
+    deadline = None if timeout_seconds is None else time.monotonic() + timeout_seconds
+
+    response = fanout_executor.run(lambda index: __batch_write_chunk(table, chunks[index], deadline), range(len(chunks)))
+
+    return [error for errors in response.results for error in errors]
+
+
+def batch_delete_items(table, keys):
+    """ Deletes items by key with BatchWriteItem, one chunk of 25 keys after the other.
+    It does not use the fan-out pool, so it can run inside a fan-out worker.
+    Unprocessed keys are retried with exponential backoff.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        keys (list): dicts with the primary key of every item
+
+    Returns:
+        int: number of keys deleted
+    """
+    client = table.meta.client
+    for i in range(0, len(keys), BATCH_WRITE_SIZE):
+        request = {table.name: [{'DeleteRequest': {'Key': key}} for key in keys[i:i + BATCH_WRITE_SIZE]]}
+        for attempt in range(max_batch_attempts):
+            response = client.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                break
+            backoff(attempt)
+        else:
+            raise UnprocessedItemsError('Keys remained unprocessed after {0} attempts'.format(max_batch_attempts))
+    return len(keys)
+
+
+def backoff(attempt):
+    """ Sleeps before retrying unprocessed items, exponential with full jitter
+    """
+    time.sleep(random.uniform(0, min(2.0, 0.05 * (2 ** attempt))))
+
+
+def __batch_get_chunk(table, keys, projection):
+    client = table.meta.client
+    request = {table.name: dict(projection, Keys=keys)}
+    items = []
+    for attempt in range(max_batch_attempts):
+        response = client.batch_get_item(RequestItems=request)
+        items.extend(response['Responses'].get(table.name, []))
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return items
+        backoff(attempt)
+    raise UnprocessedItemsError('Keys remained unprocessed after {0} attempts'.format(max_batch_attempts))
+
+
+def __batch_write_chunk(table, items, deadline=None):
+    client = table.meta.client
+    request = {table.name: [{'PutRequest': {'Item': item}} for item in items]}
+    message = 'Item remained unprocessed after {0} attempts'.format(max_batch_attempts)
+    try:
+        for attempt in range(max_batch_attempts):
+            if deadline is not None and time.monotonic() > deadline:
+                message = 'Item was not written before the deadline'
+                break
+            response = client.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                return [None] * len(items)
+            backoff(attempt)
+    except ClientError as e:
+        return [e.response['Error']['Message']] * len(items)
+
+    # identify the items still unprocessed, every other item of the chunk was written
+    unprocessed = [json.dumps(put['PutRequest']['Item'], sort_keys=True, default=str) for put in request[table.name]]
+    return [message if json.dumps(item, sort_keys=True, default=str) in unprocessed else None for item in items]
+
+
+def __key_of(item, key_names):
+    return tuple(item[name] for name in key_names)
+
+
+def __query_partition(table, partition_key_name, partition_id, sort_key_name, last_sort_key, limit, index_name=None, index_sort_key=None):
+    query_args = {
+        'KeyConditionExpression': Key(partition_key_name).eq(partition_id),
+        'Limit': limit
+    }
+    if last_sort_key is not None:
+        query_args['ExclusiveStartKey'] = {partition_key_name: partition_id, sort_key_name: last_sort_key}
+    if index_name:
+        # every item of the slice has the same index sort key, the table sort key orders them
+        index_sort_key_name, index_sort_key_value = index_sort_key
+        query_args['IndexName'] = index_name
+        query_args['KeyConditionExpression'] = query_args['KeyConditionExpression'] & Key(index_sort_key_name).eq(index_sort_key_value)
+        if last_sort_key is not None:
+            query_args['ExclusiveStartKey'][index_sort_key_name] = index_sort_key_value
+    response = table.query(**query_args)
+    return response['Items'], response.get('LastEvaluatedKey')
@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import io
+import json
+import time
+import uuid
+import zlib
+
+import utils
+import client_manager
+
+# every part but the last must be at least 5 MiB, memory stays around one part
+PART_SIZE = 8 * 1024 * 1024
+compression_level = 6
+# STS credentials of the request, export jobs run with the role of the function instead
+credential_names = ('accesskey', 'secretkey', 'sessiontoken', 'credentialsexpiration')
+
+
+def get_export_key(tenant_id, name):
+    """ Object key of a new export, under the prefix of the tenant
+
+    Args:
+        tenant_id (string):
+        name (string): e.g. products
+
+    Returns:
+        string, e.g. tenantId/products/20240101T000000Z-<uuid>.ndjson.gz
+    """
+    return '{0}/{1}/{2}-{3}.ndjson.gz'.format(tenant_id, name, time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()), uuid.uuid4())
+
+
+def is_tenant_export_key(tenant_id, key):
+    """ True when an object key is under the prefix of the tenant, export jobs only write there
+
+    Args:
+        tenant_id (string):
+        key (string): object key of an export
+
+    Returns:
+        bool
+    """
+    return isinstance(key, str) and key.startswith(tenant_id + '/')
+
+
+def start_export_job(function_arn, event, key):
+    """ Runs an export in the background: invokes the export function asynchronously
+    with the authorizer context of the request and the object key to write, so the export
+    is not bound by the API Gateway timeout. The invoked function recognizes the job with
+    is_export_job. The STS credentials of the request are left out, they can expire before
+    a long export completes, the job runs with the role of the function.
+
+    Args:
+        function_arn (string): function running the export, usually the one handling the request
+        event: lambda event with authorizer context
+        key (string): object key of the export, see get_export_key
+    """
+    authorizer = {name: value for name, value in event['requestContext']['authorizer'].items() if name not in credential_names}
+    payload = {'exportKey': key, 'requestContext': {'authorizer': authorizer}}
+    client_manager.get_client('lambda').invoke(FunctionName=function_arn, InvocationType='Event',
+        Payload=json.dumps(payload, default=str))
+
+
+def is_export_job(event):
+    # API Gateway events never carry an export key at the top level
+    return 'exportKey' in event
+
+
+def export_ndjson(s3, bucket, key, records, part_size=PART_SIZE):
+    """ Writes records to an object as gzip compressed NDJSON, one JSON document per line.
+    Records are compressed as they are read and uploaded in parts of a multipart upload,
+    so memory does not grow with the number of records. The upload is aborted when it fails.
+
+    Args:
+        s3: boto3 S3 client
+        bucket (string):
+        key (string):
+        records (iterable): models or dicts, serialized like API responses
+        part_size (int): compressed bytes buffered before a part is uploaded
+
+    Returns:
+        int: number of records written
+    """
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key,
+        ContentType='application/x-ndjson', ContentEncoding='gzip')['UploadId']
+    try:
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        buffer = io.BytesIO()
+        parts = []
+        count = 0
+        for record in records:
+            buffer.write(compressor.compress((utils.encode_to_json_object(record) + '\n').encode('utf-8')))
+            count += 1
+            if buffer.tell() >= part_size:
+                parts.append(__upload_part(s3, bucket, key, upload_id, len(parts) + 1, buffer))
+                buffer = io.BytesIO()
+        buffer.write(compressor.flush())
+        parts.append(__upload_part(s3, bucket, key, upload_id, len(parts) + 1, buffer))
+
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return count
+
+
+def __upload_part(s3, bucket, key, upload_id, part_number, buffer):
+    response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=buffer.getvalue())
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
@@ -0,0 +1,167 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+
+# The pool is created once per container and reused across warm invocations.
+# Work submitted to the pool must not itself block on the pool, otherwise it can starve.
+max_workers = int(os.environ.get('FANOUT_MAX_WORKERS', 16))
+
+__lock = threading.Lock()
+__executor = None
+
+
+class FanOutTimeoutError(Exception):
+    """Raised when the shards did not complete before the request deadline"""
+    pass
+
+
+class FanOutResult:
+    def __init__(self, results, latencies):
+        # one result per shard, in the same order as the shards passed in
+        self.results = results
+        # shard -> milliseconds spent executing that shard
+        self.latencies = latencies
+
+    def slowest_shard(self):
+        if not self.latencies:
+            return None
+        return max(self.latencies, key=self.latencies.get)
+
+
+def get_executor():
+    """ Returns the bounded thread pool shared by every fan-out in this container
+    """
+    global __executor
+    with __lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+        return __executor
+
+
+def run(fn, shards, timeout_seconds=None):
+    """ Runs fn(shard) for every shard on the shared pool
+
+    Args:
+        fn (callable): invoked once per shard
+        shards (list): shard identifiers, e.g. partition ids
+        timeout_seconds (number): deadline for the whole fan-out, none by default
+
+    Returns:
+        FanOutResult: results in shard order and per shard latency.
+        The first shard error (in completion order) is raised and pending shards are cancelled.
+    """
+    shards = list(shards)
+    executor = get_executor()
+    futures = {}
+    for index, shard in enumerate(shards):
+        futures[executor.submit(__timed, fn, shard)] = index
+
+    results = [None] * len(futures)
+    latencies = {}
+    try:
+        for future in as_completed(futures, timeout=timeout_seconds):
+            index = futures[future]
+            results[index], latencies[shards[index]] = future.result()
+    except TimeoutError:
+        __cancel(futures)
+        raise FanOutTimeoutError('Shards did not complete within {0} seconds'.format(timeout_seconds))
+    except Exception:
+        __cancel(futures)
+        raise
+
+    return FanOutResult(results, latencies)
+
+
+def stream(fn, shards, timeout_seconds=None, latencies=None, max_buffered_batches=None):
+    """ Runs fn(shard) for every shard on the shared pool and yields items as they arrive
+
+    Args:
+        fn (callable): invoked once per shard, returns an iterable of batches (e.g. query pages)
+        shards (list): shard identifiers, e.g. partition ids
+        timeout_seconds (number): deadline for the whole fan-out, none by default
+        latencies (dict): if passed, filled with shard -> milliseconds spent on that shard
+        max_buffered_batches (number): batches held in memory before shards are paused
+
+    Returns:
+        generator of the individual items in every batch.
+        Closing the generator early stops the shards after their current batch.
+    """
+    shards = list(shards)
+    if not shards:
+        return
+    if max_buffered_batches is None:
+        max_buffered_batches = 2 * len(shards)
+
+    batches = queue.Queue(maxsize=max_buffered_batches)
+    stopped = threading.Event()
+    executor = get_executor()
+    futures = [executor.submit(__stream_shard, fn, shard, batches, stopped) for shard in shards]
+
+    deadline = None if timeout_seconds is None else time.monotonic() + timeout_seconds
+    pending = len(shards)
+    try:
+        while pending > 0:
+            try:
+                kind, shard, payload = batches.get(timeout=__remaining(deadline))
+            except queue.Empty:
+                raise FanOutTimeoutError('Shards did not complete within {0} seconds'.format(timeout_seconds))
+            if kind is __BATCH:
+                yield from payload
+            elif kind is __DONE:
+                pending -= 1
+                if latencies is not None:
+                    latencies[shard] = payload
+            else:
+                raise payload
+    finally:
+        stopped.set()
+        __cancel(futures)
+
+
+__BATCH = 'batch'
+__DONE = 'done'
+__ERROR = 'error'
+
+
+def __stream_shard(fn, shard, batches, stopped):
+    start = time.perf_counter()
+    try:
+        for batch in fn(shard):
+            if not __put(batches, (__BATCH, shard, batch), stopped):
+                return
+        __put(batches, (__DONE, shard, (time.perf_counter() - start) * 1000), stopped)
+    except Exception as e:
+        __put(batches, (__ERROR, shard, e), stopped)
+
+
+def __put(batches, message, stopped):
+    # block while the consumer is behind, but give up once it has gone away
+    while not stopped.is_set():
+        try:
+            batches.put(message, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def __remaining(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def __timed(fn, shard):
+    start = time.perf_counter()
+    result = fn(shard)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def __cancel(futures):
+    for future in futures:
+        future.cancel()
@@ -0,0 +1,161 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.request
+
+from jose import jwk, jwt
+from jose.utils import base64url_decode
+
+import logger
+from cache_manager import LruTtlCache
+
+# user pools rotate their keys rarely, an unknown kid triggers a refresh before the TTL ends
+jwks_ttl_seconds = int(os.environ.get('JWKS_CACHE_TTL_SECONDS', 3600))
+# refreshes on an unknown kid, and retries after a failed refresh, are at most this frequent per user pool
+jwks_refresh_interval_seconds = int(os.environ.get('JWKS_REFRESH_INTERVAL_SECONDS', 30))
+jwks_fetch_timeout_seconds = 5
+# claims of tokens whose signature was verified, by token hash. A session sends the same token
+# until it expires, a hit skips the RSA verification. 0 entries disables the cache.
+verified_tokens = LruTtlCache(int(os.environ.get('VERIFIED_TOKEN_CACHE_MAX_ENTRIES', 1000)),
+    int(os.environ.get('VERIFIED_TOKEN_CACHE_TTL_SECONDS', 3600)))
+
+__lock = threading.Lock()
+# jwks url -> KeySet, lives as long as the lambda container
+__key_sets = {}
+
+
+class KeySet:
+    def __init__(self, keys, fetched_at):
+        self.keys = {key['kid']: key for key in keys}
+        # constructed lazily, a refresh starts a new key set so rotated keys are dropped with it
+        self.public_keys = {}
+        self.fetched_at = fetched_at
+        self.expires_at = fetched_at + jwks_ttl_seconds
+        self.attempted_at = fetched_at
+
+
+def get_jwks_url(region, user_pool_id):
+    return 'https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json'.format(region, user_pool_id)
+
+
+def get_signing_key(jwks_url, kid):
+    """ Public key of a user pool that signed a token, from the key set cached for the container.
+    The key set is downloaded again once its TTL expires, or when it does not hold kid and was
+    not refreshed within the refresh interval. When a download fails the cached key set keeps being used.
+
+    Args:
+        jwks_url (string): see get_jwks_url
+        kid (string): key id of the token header
+
+    Returns:
+        JWK as a dict, None when the user pool has no such key
+    """
+    with __lock:
+        now = time.monotonic()
+        key_set = __key_sets.get(jwks_url)
+        if (key_set is None or key_set.expires_at <= now):
+            key_set = __refresh(jwks_url, key_set, now)
+        elif (kid not in key_set.keys and key_set.attempted_at + jwks_refresh_interval_seconds <= now):
+            logger.info('Key {0} not found in jwks.json, refreshing it'.format(kid))
+            key_set = __refresh(jwks_url, key_set, now)
+        return key_set.keys.get(kid)
+
+
+def get_public_key(jwks_url, kid):
+    """ Like get_signing_key, but returns the constructed key, which is kept with the key set
+
+    Returns:
+        jose key, None when the user pool has no such key
+    """
+    key = get_signing_key(jwks_url, kid)
+    if (key is None):
+        return None
+    with __lock:
+        key_set = __key_sets[jwks_url]
+        public_key = key_set.public_keys.get(kid)
+        if (public_key is None):
+            public_key = jwk.construct(key)
+            key_set.public_keys[kid] = public_key
+        return public_key
+
+
+def verify_token(token, app_client_id, jwks_url):
+    """ Verifies the signature, expiration and audience of a Cognito ID token.
+    Tokens verified before are recognized by their hash until they expire.
+
+    Args:
+        token (string): JWT
+        app_client_id (string): expected audience
+        jwks_url (string): key set of the user pool that issued the token
+
+    Returns:
+        claims of the token, False when it is not valid
+    """
+    namespace = (jwks_url, app_client_id)
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    claims = verified_tokens.get(namespace, token_hash)
+    if (claims is None):
+        claims = __verify_signature(token, jwks_url)
+        if (claims is False):
+            return False
+        if (claims['aud'] != app_client_id):
+            logger.info('Token was not issued for this audience')
+            return False
+        if (time.time() <= claims['exp']):
+            verified_tokens.put(namespace, token_hash, claims)
+    # the expiration is checked on every use, cached claims expire with their token
+    if (time.time() > claims['exp']):
+        logger.info('Token is expired')
+        verified_tokens.invalidate(namespace, token_hash)
+        return False
+    return claims
+
+
+def fetch_jwks(jwks_url):
+    with urllib.request.urlopen(jwks_url, timeout=jwks_fetch_timeout_seconds) as f:
+        response = f.read()
+    return json.loads(response.decode('utf-8'))['keys']
+
+
+def clear():
+    with __lock:
+        __key_sets.clear()
+    verified_tokens.clear()
+
+
+def __refresh(jwks_url, stale_key_set, now):
+    try:
+        key_set = KeySet(fetch_jwks(jwks_url), now)
+    except Exception as e:
+        if (stale_key_set is None):
+            raise Exception('Error downloading jwks.json', e)
+        logger.error('Error downloading jwks.json, using the cached keys: {0}'.format(e))
+        # retry after the refresh interval rather than on every token
+        stale_key_set.attempted_at = now
+        stale_key_set.expires_at = max(stale_key_set.expires_at, now + jwks_refresh_interval_seconds)
+        return stale_key_set
+    __key_sets[jwks_url] = key_set
+    return key_set
+
+
+def __verify_signature(token, jwks_url):
+    # get the kid from the headers prior to verification
+    headers = jwt.get_unverified_headers(token)
+    public_key = get_public_key(jwks_url, headers['kid'])
+    if (public_key is None):
+        logger.info('Public key not found in jwks.json')
+        return False
+    # get the last two sections of the token, message and signature (encoded in base64)
+    message, encoded_signature = str(token).rsplit('.', 1)
+    decoded_signature = base64url_decode(encoded_signature.encode('utf-8'))
+    if not public_key.verify(message.encode("utf8"), decoded_signature):
+        logger.info('Signature verification failed')
+        return False
+    logger.info('Signature successfully verified')
+    # since we passed the verification, we can now safely use the unverified claims
+    return jwt.get_unverified_claims(token)
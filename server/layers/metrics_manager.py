@@ -16,7 +16,19 @@ def record_metric(event, metric_name, metric_unit, metric_value):
         metric_unit ([type]): [description]
         metric_value ([type]): [description]
     """
-    metrics.add_dimension(name="tenant_id", value=event['requestContext']['authorizer']['tenantId'])
+    record_tenant_metric(event['requestContext']['authorizer']['tenantId'], metric_name, metric_unit, metric_value)
+
+
+def record_tenant_metric(tenant_id, metric_name, metric_unit, metric_value):
+    """ Record the metric in Cloudwatch using EMF format, for callers without an API Gateway event such as authorizers
+
+    Args:
+        tenant_id (string): value of the tenant_id dimension
+        metric_name (string):
+        metric_unit (string): e.g. Count
+        metric_value (number):
+    """
+    metrics.add_dimension(name="tenant_id", value=tenant_id)
     metrics.add_metric(name=metric_name, unit=metric_unit, value=metric_value)
     metrics_object = metrics.serialize_metric_set()
     metrics.clear_metrics()
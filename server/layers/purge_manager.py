@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import threading
+
+from boto3.dynamodb.conditions import Key
+
+import dynamodb_manager
+import fanout_executor
+import counter_manager
+
+# keys read per query, deleted as a few BatchWriteItem chunks
+purge_page_size = dynamodb_manager.BATCH_WRITE_SIZE * 4
+
+
+class RateLimiter:
+    """ Token bucket shared by the threads of a purge, so deleting a tenant
+    does not consume the write capacity the other tenants of the table rely on.
+    A rate of 0 or less disables the limit.
+    """
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.__lock = threading.Lock()
+        self.__tokens = per_second
+        self.__updated_at = time.monotonic()
+
+    def acquire(self, count):
+        """ Blocks until count writes fit within the rate
+        """
+        if self.per_second <= 0:
+            return
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.per_second, self.__tokens + (now - self.__updated_at) * self.per_second)
+                self.__updated_at = now
+                # a request larger than the bucket waits for a full bucket
+                needed = min(count, self.per_second)
+                if self.__tokens >= needed:
+                    self.__tokens -= count
+                    return
+                wait = (needed - self.__tokens) / self.per_second
+            time.sleep(wait)
+
+
+def get_tenant_partition_ids(tenant_id, shard_count):
+    """ Every partition that holds data of a tenant: its numbered shards and its counters.
+    The version marker is not included, it has to outlive the data so that entity tags
+    issued before a purge never match the data written after it.
+
+    Args:
+        tenant_id (string):
+        shard_count (int): highest shard count the tenant has used
+
+    Returns:
+        list of partition ids
+    """
+    return [tenant_id + '-' + str(suffix) for suffix in range(1, shard_count + 1)] + counter_manager.get_counter_partition_ids(tenant_id)
+
+
+def purge_partitions(table, partition_key_name, sort_key_name, partition_ids, deadline, rate_limiter):
+    """ Deletes every item of the partitions, the partitions are walked in parallel.
+    Each partition is re-queried from its start until it is empty, so a purge that stopped
+    at the deadline resumes from the partitions it did not finish.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        partition_ids (list): partitions to empty
+        deadline (number): epoch seconds after which purging stops
+        rate_limiter (RateLimiter): limits the items deleted per second
+
+    Returns:
+        tuple: (number of items deleted, list of the partitions that still hold items)
+    """
+    response = fanout_executor.run(
+        lambda partition_id: __purge_partition(table, partition_key_name, sort_key_name, partition_id, deadline, rate_limiter),
+        partition_ids)
+
+    deleted = sum(count for count, emptied in response.results)
+    remaining = [partition_id for partition_id, (count, emptied) in zip(partition_ids, response.results) if not emptied]
+    return deleted, remaining
+
+
+def __purge_partition(table, partition_key_name, sort_key_name, partition_id, deadline, rate_limiter):
+    deleted = 0
+    while time.time() < deadline:
+        response = table.query(KeyConditionExpression=Key(partition_key_name).eq(partition_id),
+            ProjectionExpression='#pk, #sk', ExpressionAttributeNames={'#pk': partition_key_name, '#sk': sort_key_name},
+            Limit=purge_page_size)
+        keys = response['Items']
+        if not keys:
+            return deleted, True
+        rate_limiter.acquire(len(keys))
+        deleted += dynamodb_manager.batch_delete_items(table, keys)
+    return deleted, False
@@ -0,0 +1,339 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import zlib
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import dynamodb_manager
+
+# Tenants onboarded before the shard count was configurable were written across 9 shards
+DEFAULT_SHARD_COUNT = 9
+MAX_SHARD_COUNT = 100
+# an item updated this many times while it is being moved fails the drain, which is retried
+max_move_attempts = 5
+
+
+def is_valid_shard_count(shard_count):
+    """ True when a tenant can be sharded this many ways
+    """
+    return isinstance(shard_count, int) and not isinstance(shard_count, bool) and 1 <= shard_count <= MAX_SHARD_COUNT
+
+
+def get_shard_count(event):
+    """ Number of shards new items of the tenant are written to, passed by the authorizer
+
+    Args:
+        event: lambda event with authorizer context
+
+    Returns:
+        int
+    """
+    authorizer = event['requestContext']['authorizer']
+    return int(authorizer.get('shardCount') or DEFAULT_SHARD_COUNT)
+
+
+def get_read_shard_count(event):
+    """ Number of shards that can hold items of the tenant.
+    While a tenant is being resharded to fewer shards this includes the shards being retired.
+
+    Args:
+        event: lambda event with authorizer context
+
+    Returns:
+        int
+    """
+    authorizer = event['requestContext']['authorizer']
+    return max(get_shard_count(event), int(authorizer.get('previousShardCount') or 0))
+
+
+def get_partition_ids(tenant_id, shard_count):
+    return [tenant_id + '-' + str(suffix) for suffix in range(1, shard_count + 1)]
+
+
+def get_read_partition_ids(event, tenant_id):
+    return get_partition_ids(tenant_id, get_read_shard_count(event))
+
+
+def get_version_key(partition_key_name, sort_key_name, tenant_id):
+    """ Key of the item that records the version of the data of a tenant in a table,
+    bumped by writes of many items at once, see counter_manager.get_version.
+    It is kept outside the numbered shards, so reads of the data never return it.
+
+    Args:
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+
+    Returns:
+        dict primary key
+    """
+    return {partition_key_name: tenant_id + '-meta', sort_key_name: 'version'}
+
+
+def get_item_partition_id(tenant_id, item_id, shard_count):
+    """ Shard an item id belongs to, derived from a stable hash of the id
+
+    Args:
+        tenant_id (string):
+        item_id (string): e.g. productId
+        shard_count (int):
+
+    Returns:
+        partition id, e.g. tenantId-3
+    """
+    return tenant_id + '-' + str(zlib.crc32(item_id.encode('utf-8')) % shard_count + 1)
+
+
+def get_write_partition_id(event, tenant_id, item_id):
+    return get_item_partition_id(tenant_id, item_id, get_shard_count(event))
+
+
+def split_key(key):
+    """ Splits a public key into shard and item id
+
+    Args:
+        key (string): shardId:itemId, or a bare itemId
+
+    Returns:
+        tuple: (shardId or None for a bare id, itemId)
+    """
+    if ':' in key:
+        shard_id, item_id = key.split(':', 1)
+        return shard_id, item_id
+    return None, key
+
+
+def is_valid_key(event, tenant_id, key):
+    """ True when a public key can name an item of the tenant: a bare item id, or an item id
+    in one of the numbered shards of the tenant. Keys of the version marker, the counters or
+    the shards of another tenant are not valid. Keys of shards retired by an earlier reshard
+    stay valid, get_item resolves them by their item id.
+
+    Args:
+        event: lambda event with authorizer context
+        tenant_id (string):
+        key (string): shardId:itemId, or a bare itemId
+
+    Returns:
+        bool
+    """
+    if not isinstance(key, str):
+        return False
+    shard_id, item_id = split_key(key)
+    if not item_id or ':' in item_id:
+        return False
+    if shard_id is None or shard_id in get_read_partition_ids(event, tenant_id):
+        return True
+    suffix = shard_id[len(tenant_id) + 1:]
+    return shard_id.startswith(tenant_id + '-') and suffix.isdigit() and str(int(suffix)) == suffix and 1 <= int(suffix) <= MAX_SHARD_COUNT
+
+
+def find_item(event, table, partition_key_name, sort_key_name, tenant_id, item_id):
+    """ Finds an item of the tenant by its bare id.
+    The shards the id hashes to under the current and previous shard count are read first.
+    Items written before the tenant was resharded, or before shards were derived from the id,
+    can sit in any shard, those are found with a single BatchGetItem over the other shards.
+
+    Args:
+        event: lambda event with authorizer context
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        item_id (string):
+
+    Returns:
+        item, None when it does not exist
+    """
+    hashed_partition_ids = __get_hashed_partition_ids(event, tenant_id, item_id)
+    for partition_id in hashed_partition_ids:
+        item = table.get_item(Key={partition_key_name: partition_id, sort_key_name: item_id}).get('Item')
+        if item:
+            return item
+
+    keys = [{partition_key_name: partition_id, sort_key_name: item_id}
+        for partition_id in get_read_partition_ids(event, tenant_id) if partition_id not in hashed_partition_ids]
+    for item in dynamodb_manager.batch_get_items(table, keys, (partition_key_name, sort_key_name)):
+        if item:
+            return item
+    return None
+
+
+def get_item(event, table, partition_key_name, sort_key_name, tenant_id, key):
+    """ Gets an item of the tenant by its public key.
+    A key names the shard the item was in when the key was handed out, a reshard may have
+    moved the item since, so an item missing from that shard is looked up with find_item.
+
+    Args:
+        event: lambda event with authorizer context
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        key (string): shardId:itemId, or a bare itemId
+
+    Returns:
+        item, None when it does not exist
+    """
+    shard_id, item_id = split_key(key)
+    if shard_id:
+        item = table.get_item(Key={partition_key_name: shard_id, sort_key_name: item_id}).get('Item')
+        if item:
+            return item
+    return find_item(event, table, partition_key_name, sort_key_name, tenant_id, item_id)
+
+
+def batch_find_items(event, table, partition_key_name, sort_key_name, tenant_id, item_ids, timeout_seconds=None, attribute_names=None, other_shards=True):
+    """ Finds items of the tenant by their bare ids, like find_item, with BatchGetItem.
+    The shards the ids hash to are read first, the other shards only for the ids not found there.
+
+    Args:
+        event: lambda event with authorizer context
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        item_ids (list): bare item ids, duplicates are allowed
+        timeout_seconds (number): deadline for each BatchGetItem fan-out
+        attribute_names (list): only read these attributes and the key, every attribute when not passed
+        other_shards (bool): False to only read the hashed shards, for ids that were always written there
+
+    Returns:
+        list: the item for every id, in the same order as item_ids, None where the item does not exist
+    """
+    hashed_partition_ids = {item_id: __get_hashed_partition_ids(event, tenant_id, item_id) for item_id in item_ids}
+    found = {}
+    keys = [{partition_key_name: partition_id, sort_key_name: item_id}
+        for item_id, partition_ids in hashed_partition_ids.items() for partition_id in partition_ids]
+    for item in dynamodb_manager.batch_get_items(table, keys, (partition_key_name, sort_key_name), timeout_seconds, attribute_names):
+        if item:
+            found[item[sort_key_name]] = item
+
+    if other_shards:
+        read_partition_ids = get_read_partition_ids(event, tenant_id)
+        keys = [{partition_key_name: partition_id, sort_key_name: item_id}
+            for item_id, partition_ids in hashed_partition_ids.items() if item_id not in found
+            for partition_id in read_partition_ids if partition_id not in partition_ids]
+        for item in dynamodb_manager.batch_get_items(table, keys, (partition_key_name, sort_key_name), timeout_seconds, attribute_names):
+            if item:
+                found[item[sort_key_name]] = item
+    return [found.get(item_id) for item_id in item_ids]
+
+
+def batch_get_items(event, table, partition_key_name, sort_key_name, tenant_id, keys, timeout_seconds=None, attribute_names=None):
+    """ Gets items of the tenant by their public keys, like get_item, with BatchGetItem.
+    Keys naming a shard are read from it first, bare ids and items a reshard has moved
+    since are resolved with batch_find_items.
+
+    Args:
+        event: lambda event with authorizer context
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        keys (list): shardId:itemId, or bare itemIds, duplicates are allowed
+        timeout_seconds (number): deadline for each BatchGetItem fan-out
+        attribute_names (list): only read these attributes and the key, every attribute when not passed
+
+    Returns:
+        list: the item for every key, in the same order as keys, None where the item does not exist or the key is not valid
+    """
+    keys_to_read = list(dict.fromkeys(key for key in keys if is_valid_key(event, tenant_id, key)))
+    shard_keys = [key for key in keys_to_read if split_key(key)[0]]
+    items = dict(zip(shard_keys, dynamodb_manager.batch_get_items(table,
+        [dict(zip((partition_key_name, sort_key_name), split_key(key))) for key in shard_keys],
+        (partition_key_name, sort_key_name), timeout_seconds, attribute_names)))
+
+    unresolved = [key for key in keys_to_read if items.get(key) is None]
+    if unresolved:
+        items.update(zip(unresolved, batch_find_items(event, table, partition_key_name, sort_key_name, tenant_id,
+            [split_key(key)[1] for key in unresolved], timeout_seconds, attribute_names)))
+    return [items.get(key) for key in keys]
+
+
+def drain_partitions(table, partition_key_name, sort_key_name, tenant_id, retired_shard_count, shard_count, deadline):
+    """ Moves every item from the shards above shard_count into the remaining shards.
+    Each item is moved with a transaction (put into the new shard, delete from the old one),
+    so a concurrent reader sees it exactly once. The delete only succeeds while the item is
+    unchanged since it was read, an item written in between is read again and moved as written.
+    Items move to the shard their id hashes to, the shard prefix of moved item keys changes,
+    get_item still finds them by their old key.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        partition_key_name (string): e.g. shardId
+        sort_key_name (string): e.g. productId
+        tenant_id (string):
+        retired_shard_count (int): shard count the tenant is being resharded from
+        shard_count (int): shard count the tenant is being resharded to
+        deadline (number): epoch seconds after which draining stops
+
+    Returns:
+        tuple: (number of items moved, True when the retired shards are empty)
+    """
+    moved = 0
+    for suffix in range(shard_count + 1, retired_shard_count + 1):
+        partition_id = tenant_id + '-' + str(suffix)
+        for response in dynamodb_manager.query_pages(table, KeyConditionExpression=Key(partition_key_name).eq(partition_id)):
+            for item in response['Items']:
+                if time.time() > deadline:
+                    return moved, False
+                new_partition_id = get_item_partition_id(tenant_id, item[sort_key_name], shard_count)
+                if __move_item(table, partition_key_name, sort_key_name, item, new_partition_id):
+                    moved += 1
+    return moved, True
+
+
+def __get_hashed_partition_ids(event, tenant_id, item_id):
+    # the shards an id hashes to under the current and the previous shard count
+    authorizer = event['requestContext']['authorizer']
+    partition_ids = []
+    for shard_count in (get_shard_count(event), int(authorizer.get('previousShardCount') or 0)):
+        if shard_count:
+            partition_id = get_item_partition_id(tenant_id, item_id, shard_count)
+            if partition_id not in partition_ids:
+                partition_ids.append(partition_id)
+    return partition_ids
+
+
+def __move_item(table, partition_key_name, sort_key_name, item, new_partition_id):
+    key = {partition_key_name: item[partition_key_name], sort_key_name: item[sort_key_name]}
+    for attempt in range(max_move_attempts):
+        try:
+            __transact_move(table.meta.client, table.name, key, item, dict(item, **{partition_key_name: new_partition_id}))
+            return True
+        except ClientError as e:
+            if not dynamodb_manager.is_condition_failure(e):
+                raise
+        # the item was updated or deleted since it was read
+        item = table.get_item(Key=key, ConsistentRead=True).get('Item')
+        if not item:
+            return False
+    raise Exception('Item {0} kept changing while it was moved'.format(key))
+
+
+# the client of a Table resource serializes python values, items are passed as read
+def __transact_move(client, table_name, key, item, new_item):
+    # the item is only deleted when every attribute still has the value that was copied
+    names = {'#a' + str(index): name for index, name in enumerate(item)}
+    values = {':v' + str(index): value for index, value in enumerate(item.values())}
+    client.transact_write_items(TransactItems=[
+        {
+            'Put': {
+                'TableName': table_name,
+                'Item': new_item
+            }
+        },
+        {
+            'Delete': {
+                'TableName': table_name,
+                'Key': key,
+                'ConditionExpression': ' and '.join('#a{0} = :v{0}'.format(index) for index in range(len(item))),
+                'ExpressionAttributeNames': names,
+                'ExpressionAttributeValues': values
+            }
+        }
+    ])
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import time
+import threading
+
+import logger
+import dynamodb_manager
+from cache_manager import LruTtlCache
+
+# settings item whose version changes whenever tenant details are written
+tenant_details_version_key = {'settingName': 'tenantDetailsVersion'}
+# what the authorizers need of a tenant, these rarely change
+tenant_details_attributes = ['userPoolId', 'appClientId', 'apiGatewayUrl', 'apiKey', 'shardCount', 'previousShardCount']
+# a write to tenant details reaches a warm container within this many seconds
+version_check_interval_seconds = int(os.environ.get('TENANT_DETAILS_VERSION_CHECK_SECONDS', 10))
+
+tenant_details = LruTtlCache(int(os.environ.get('TENANT_DETAILS_CACHE_MAX_ENTRIES', 10000)),
+    int(os.environ.get('TENANT_DETAILS_CACHE_TTL_SECONDS', 300)))
+# tokens of unknown tenants are rejected without reading the table each time, for a shorter while
+unknown_tenants = LruTtlCache(int(os.environ.get('TENANT_DETAILS_CACHE_MAX_ENTRIES', 10000)),
+    int(os.environ.get('UNKNOWN_TENANT_CACHE_TTL_SECONDS', 30)))
+
+__lock = threading.Lock()
+__version = {'version': None, 'checked_at': None}
+
+
+def get_tenant_details(tenant_details_table, settings_table, tenant_id):
+    """ Tenant details needed to authorize a request, cached for the container.
+    Every cached entry is dropped once the tenant details version marker changes,
+    which is read at most once per version check interval.
+
+    Args:
+        tenant_details_table: boto3 DynamoDB Table resource of ServerlessSaaS-TenantDetails
+        settings_table: boto3 DynamoDB Table resource of ServerlessSaaS-Settings
+        tenant_id (string):
+
+    Returns:
+        dict with tenant_details_attributes, None when the tenant does not exist
+    """
+    __check_version(settings_table)
+    item = tenant_details.get(tenant_id, 'details')
+    if (item is not None):
+        return item
+    if (unknown_tenants.get(tenant_id, 'details') is not None):
+        return None
+
+    item = tenant_details_table.get_item(Key={'tenantId': tenant_id},
+        ProjectionExpression=', '.join('#a' + str(index) for index in range(len(tenant_details_attributes))),
+        ExpressionAttributeNames={'#a' + str(index): name for index, name in enumerate(tenant_details_attributes)}).get('Item')
+    if (item is None):
+        logger.info('Tenant {0} not found'.format(tenant_id))
+        unknown_tenants.put(tenant_id, 'details', True)
+        return None
+    tenant_details.put(tenant_id, 'details', item)
+    return item
+
+
+def clear():
+    with __lock:
+        __version['version'] = None
+        __version['checked_at'] = None
+    tenant_details.clear()
+    unknown_tenants.clear()
+
+
+def __check_version(settings_table):
+    with __lock:
+        now = time.monotonic()
+        if (__version['checked_at'] is not None and now - __version['checked_at'] < version_check_interval_seconds):
+            return
+        __version['checked_at'] = now
+        try:
+            version = dynamodb_manager.get_version(settings_table, tenant_details_version_key)
+        except Exception as e:
+            # keep serving the cached details, they are still bounded by their TTL
+            logger.error('Error reading the tenant details version: {0}'.format(e))
+            return
+        if (__version['version'] is not None and version != __version['version']):
+            logger.info('Tenant details changed, dropping the cached tenant details')
+            tenant_details.clear()
+            unknown_tenants.clear()
+        __version['version'] = version
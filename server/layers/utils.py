@@ -1,14 +1,21 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import os
 import json
-import jsonpickle
+import zlib
+import base64
+import hashlib
 import simplejson
 
 import boto3
 from aws_requests_auth.aws_auth import AWSRequestsAuth
 from enum import Enum
 
+# responses shorter than this are not worth the CPU to compress
+compression_min_bytes = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+compression_level = 6
+
 class TenantTier(Enum):
     PLATINUM    = "Platinum"
     PREMIUM     = "Premium"
@@ -18,6 +25,8 @@ class TenantTier(Enum):
 
 class StatusCodes(Enum):
     SUCCESS    = 200
+    NOT_MODIFIED = 304
+    BAD_REQUEST = 400
     UN_AUTHORIZED  = 401
     NOT_FOUND = 404
     
@@ -64,6 +73,19 @@ def create_notfound_response(message):
         }),
     }
 
+def create_badrequest_response(message):
+    return {
+        "statusCode": StatusCodes.BAD_REQUEST.value,
+        "headers": {
+            "Access-Control-Allow-Headers" : "Content-Type",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "OPTIONS,POST,GET,PUT"
+        },
+        "body": json.dumps({
+            "message": message
+        }),
+    }
+
 def get_auth(host, region):
     session = boto3.Session()
     credentials = session.get_credentials()
@@ -78,9 +100,75 @@ def get_auth(host, region):
 def get_headers(event):
     return event['headers']
 
-
-def generate_response(inputObject):
+def get_header(event, name):
+    # header names are case insensitive and API Gateway passes them as the client sent them
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for header, value in headers.items():
+        if (header.lower() == name):
+            return value
+    return None
+
+def get_query_parameter(event, name, default=None):
+    parameters = event.get('queryStringParameters') or {}
+    return parameters.get(name, default)
+
+
+def get_request_body(event):
+    """ Returns the request body as a string.
+    API Gateway passes bodies base64 encoded since the APIs accept binary media types.
+    """
+    body = event.get('body')
+    if (body and event.get('isBase64Encoded')):
+        return base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def create_etag(*parts):
+    """ Returns a weak entity tag identifying a representation, e.g. from a data version and the query parameters
+    """
+    digest = hashlib.blake2b('|'.join(str(part) for part in parts).encode('utf-8'), digest_size=16).hexdigest()
+    return 'W/"' + digest + '"'
+
+def is_not_modified(event, etag):
+    """ True when the request is a GET whose If-None-Match header matches etag
+    """
+    if (event.get('httpMethod') != 'GET'):
+        return False
+    if_none_match = get_header(event, 'If-None-Match')
+    if (not if_none_match):
+        return False
+    # If-None-Match uses the weak comparison
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or __strip_weak(etag) in (__strip_weak(tag) for tag in tags)
+
+def create_not_modified_response(etag):
     return {
+        "statusCode": StatusCodes.NOT_MODIFIED.value,
+        "headers": {
+            "Access-Control-Allow-Headers" : "Content-Type, Origin, X-Requested-With, Accept, Authorization, Access-Control-Allow-Methods, Access-Control-Allow-Headers, Access-Control-Allow-Origin",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "OPTIONS,POST,GET,PUT",
+            "Access-Control-Expose-Headers": "ETag",
+            "ETag": etag
+        },
+        "body": "",
+    }
+
+def generate_response(inputObject, event=None, etag=None):
+    """ Returns a 200 response with inputObject serialized as JSON
+
+    Args:
+        inputObject: models, lists and dicts to serialize
+        event: the request event. When passed, a body of at least compression_min_bytes is
+            compressed with gzip or deflate if the Accept-Encoding header of the request allows it,
+            and GET responses carry an ETag and become 304 Not Modified when If-None-Match matches it
+        etag (string): entity tag from create_etag, by default a hash of the body
+
+    Returns:
+        lambda proxy response
+    """
+    response = {
         "statusCode": 200,
         "headers": {
             "Access-Control-Allow-Headers" : "Content-Type, Origin, X-Requested-With, Accept, Authorization, Access-Control-Allow-Methods, Access-Control-Allow-Headers, Access-Control-Allow-Origin",
@@ -89,13 +177,78 @@ def generate_response(inputObject):
         },
         "body": encode_to_json_object(inputObject),
     }
+    if (event is None):
+        return response
+
+    if (event.get('httpMethod') == 'GET'):
+        if (etag is None):
+            etag = create_etag(response['body'])
+        if (is_not_modified(event, etag)):
+            return create_not_modified_response(etag)
+        response['headers']['ETag'] = etag
+        response['headers']['Access-Control-Expose-Headers'] = 'ETag'
+    __compress_response(response, event)
+    return response
+
+def __strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+def __compress_response(response, event):
+    if (len(response['body']) < compression_min_bytes):
+        return
+    content_encoding = __get_content_encoding(get_header(event, 'Accept-Encoding'))
+    if (content_encoding is None):
+        return
+
+    if (content_encoding == 'gzip'):
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zlib.compressobj(compression_level)
+    body = compressor.compress(response['body'].encode('utf-8')) + compressor.flush()
+
+    response['body'] = base64.b64encode(body).decode('ascii')
+    response['isBase64Encoded'] = True
+    response['headers']['Content-Encoding'] = content_encoding
+    response['headers']['Vary'] = 'Accept-Encoding'
+
+def __get_content_encoding(accept_encoding):
+    """ Picks gzip or deflate from an Accept-Encoding header, None when neither is acceptable
+    """
+    if (not accept_encoding):
+        return None
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, parameters = coding.partition(';')
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition('=')
+        if (parameter.strip().lower() == 'q'):
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    for content_encoding in ('gzip', 'deflate'):
+        if (qualities.get(content_encoding, qualities.get('*', 0.0)) > 0):
+            return content_encoding
+    return None
 
 def  encode_to_json_object(inputObject):
-    jsonpickle.set_encoder_options('simplejson', use_decimal=True, sort_keys=True)
-    jsonpickle.set_preferred_backend('simplejson')
-    return jsonpickle.encode(inputObject, unpicklable=False, use_decimal=True)
-
-
-
-
-
+    """ Serializes models, lists and dicts of models to JSON.
+    Models provide their attributes with for_json, other objects (e.g. SimpleNamespace
+    payloads) are serialized as their attribute dict. The output is the same as
+    jsonpickle.encode(inputObject, unpicklable=False) with the simplejson backend, sorted keys
+    and Decimal support, which this replaced.
+    """
+    return __json_encoder.encode(inputObject)
+
+def __to_json_object(value):
+    # models and SimpleNamespace payloads are serialized as their attributes
+    try:
+        return vars(value)
+    except TypeError:
+        pass
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError('Object of type ' + type(value).__name__ + ' is not JSON serializable')
+
+__json_encoder = simplejson.JSONEncoder(use_decimal=True, sort_keys=True, for_json=True, default=__to_json_object)
@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares building a DynamoDB table resource per request with the credential keyed cache.
+# Usage: python tests/benchmark/bench_client_manager.py
+
+import os
+import sys
+import timeit
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'layers'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+import client_manager
+
+iterations = 200
+
+
+def uncached():
+    dynamodb = boto3.resource('dynamodb',
+        aws_access_key_id='AKIABENCHMARK',
+        aws_secret_access_key='secret',
+        aws_session_token='token')
+    return dynamodb.Table('Product-pooled')
+
+
+def cached():
+    return client_manager.get_table('Product-pooled', 'AKIABENCHMARK', 'secret', 'token')
+
+
+if __name__ == '__main__':
+    for name, fn in [('boto3.resource per request', uncached), ('client_manager', cached)]:
+        # warm up so that botocore has loaded the service model for both variants
+        fn()
+        seconds = timeit.timeit(fn, number=iterations)
+        print('{0:<28} {1:8.3f} ms/call'.format(name, seconds * 1000 / iterations))
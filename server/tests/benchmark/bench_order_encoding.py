@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the stored size, and the read and write capacity units it costs, of orders
+# with their line items stored as a list of maps and with the encoding of order_models.
+# Sizes follow the DynamoDB item size rules.
+# Usage: python tests/benchmark/bench_order_encoding.py
+
+import os
+import sys
+import math
+import uuid
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'OrderService'))
+from order_models import Order, OrderProduct
+
+
+def value_size(value):
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (int, Decimal)):
+        digits = len(str(abs(value)).replace('.', '').lstrip('0')) or 1
+        return math.ceil(digits / 2) + 1
+    if isinstance(value, list):
+        return 3 + sum(1 + value_size(element) for element in value)
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(name) + value_size(element) for name, element in value.items())
+    raise TypeError(value)
+
+
+def item_size(item):
+    return sum(len(name) + value_size(value) for name, value in item.items())
+
+
+def legacy_item(order):
+    return {
+        'shardId': order.shardId,
+        'orderId': order.orderId,
+        'orderName': order.orderName,
+        'orderProducts': [orderProduct.to_item() for orderProduct in order.orderProducts],
+        'orderTotal': order.orderTotal
+    }
+
+
+def order_with_lines(count):
+    # orders repeat a catalog of products, like real baskets do
+    products = ['tenant-{0}:{1}'.format(index % 9 + 1, uuid.uuid4()) for index in range(200)]
+    orderProducts = [OrderProduct(products[index % len(products)], Decimal(index % 5000) / 100 + 1, index % 4 + 1) for index in range(count)]
+    return Order('tenant-1', str(uuid.uuid4()), 'order', orderProducts)
+
+
+if __name__ == '__main__':
+    print('{0:>6} {1:>22} {2:>22} {3:>8}'.format('lines', 'list of maps (B/RCU/WCU)', 'encoded (B/RCU/WCU)', 'version'))
+    for count in [1, 10, 100, 500, 2000]:
+        order = order_with_lines(count)
+        legacy = item_size(legacy_item(order))
+        item = order.to_item()
+        encoded = item_size(item)
+        print('{0:>6} {1:>10} {2:>5} {3:>5} {4:>10} {5:>5} {6:>5} {7:>8}'.format(count,
+            legacy, math.ceil(legacy / 4096), math.ceil(legacy / 1024),
+            encoded, math.ceil(encoded / 4096), math.ceil(encoded / 1024), item['orderProductsVersion']))
@@ -0,0 +1,36 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the time per call of building the policy of a tenant user as nested dicts
+# serialized with json.dumps, of rendering it from the compiled template, and of
+# looking it up among the memoized policies.
+# Usage: python tests/benchmark/bench_policy_rendering.py
+
+import os
+import sys
+import uuid
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'layers'))
+import auth_manager
+import utils
+
+calls = 20000
+
+
+def per_call(function):
+    return min(timeit.repeat(function, number=calls, repeat=5)) / calls * 1000000
+
+
+if __name__ == '__main__':
+    tenant_ids = [uuid.uuid4().hex for _ in range(100)]
+    service = utils.Service_Identifier.BUSINESS_SERVICES.value
+    build = getattr(auth_manager, '__getPolicyForTenantAdmin')
+    render = getattr(auth_manager, '__renderPolicy').__wrapped__
+
+    print('{0:>12} {1:>10}'.format('', 'us/call'))
+    print('{0:>12} {1:>10.2f}'.format('json.dumps', per_call(lambda: build(tenant_ids[0], service, 'us-east-1', '123456789012'))))
+    print('{0:>12} {1:>10.2f}'.format('template', per_call(lambda: render('TenantAdmin', service, tenant_ids[0], 'us-east-1', '123456789012'))))
+    for tenant_id in tenant_ids:
+        auth_manager.getPolicyForUser('TenantAdmin', service, tenant_id, 'us-east-1', '123456789012')
+    print('{0:>12} {1:>10.2f}'.format('memoized', per_call(lambda: auth_manager.getPolicyForUser('TenantAdmin', service, tenant_ids[7], 'us-east-1', '123456789012'))))
@@ -0,0 +1,39 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the jsonpickle based response serialization with utils.encode_to_json_object
+# on a listing of 10,000 products.
+# Usage: python tests/benchmark/bench_serializer.py
+
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+import jsonpickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'layers'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ProductService'))
+import utils
+from product_models import Product
+
+iterations = 5
+products = [Product('tenant-{0}'.format(index % 9 + 1), 'product-{0}'.format(index), 'sku-{0}'.format(index),
+    'Product {0}'.format(index), Decimal(index) / 100, 'category-{0}'.format(index % 20)) for index in range(10000)]
+
+
+def encode_with_jsonpickle():
+    jsonpickle.set_encoder_options('simplejson', use_decimal=True, sort_keys=True)
+    jsonpickle.set_preferred_backend('simplejson')
+    return jsonpickle.encode(products, unpicklable=False, use_decimal=True)
+
+
+def encode_with_utils():
+    return utils.encode_to_json_object(products)
+
+
+if __name__ == '__main__':
+    assert encode_with_jsonpickle() == encode_with_utils()
+    for name, fn in [('jsonpickle', encode_with_jsonpickle), ('utils.encode_to_json_object', encode_with_utils)]:
+        seconds = timeit.timeit(fn, number=iterations)
+        print('{0:<28} {1:8.1f} ms per 10k products'.format(name, seconds * 1000 / iterations))
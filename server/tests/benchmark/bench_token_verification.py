@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the latency of verifying the ID tokens of a few sessions, each sending its token
+# several times, when the public key is constructed for every token, when it is cached,
+# and when verified tokens are also remembered. The key set is served from memory.
+# Usage: python tests/benchmark/bench_token_verification.py
+
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from jose.utils import base64url_decode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'layers'))
+import jwks_manager
+
+sessions = 50
+requests_per_session = 20
+
+
+def verify_uncached(token, app_client_id, keys):
+    # the verification the authorizers did before the key and token caches
+    kid = jwt.get_unverified_headers(token)['kid']
+    public_key = jwk.construct([key for key in keys if key['kid'] == kid][0])
+    message, encoded_signature = str(token).rsplit('.', 1)
+    if not public_key.verify(message.encode('utf8'), base64url_decode(encoded_signature.encode('utf-8'))):
+        return False
+    claims = jwt.get_unverified_claims(token)
+    return claims if claims['aud'] == app_client_id and time.time() <= claims['exp'] else False
+
+
+def percentiles(verify, tokens):
+    latencies = []
+    for token in tokens:
+        started = time.perf_counter()
+        assert verify(token)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == '__main__':
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    keys = [dict(jwk.construct(pem, 'RS256').public_key().to_dict(), kid='k' + str(index)) for index in range(2)]
+    jwks_manager.fetch_jwks = lambda jwks_url: keys
+    exp = int(time.time()) + 3600
+    session_tokens = [jwt.encode({'aud': 'client', 'exp': exp, 'sub': str(index)}, pem, algorithm='RS256', headers={'kid': 'k1'})
+        for index in range(sessions)]
+    tokens = [token for _ in range(requests_per_session) for token in session_tokens]
+
+    print('{0:>22} {1:>9} {2:>9}'.format('', 'p50 (ms)', 'p99 (ms)'))
+    print('{0:>22} {1:>9.3f} {2:>9.3f}'.format('construct per token', *percentiles(lambda token: verify_uncached(token, 'client', keys), tokens)))
+    jwks_manager.verified_tokens.max_entries = 0
+    print('{0:>22} {1:>9.3f} {2:>9.3f}'.format('cached public key', *percentiles(lambda token: jwks_manager.verify_token(token, 'client', 'pool'), tokens)))
+    jwks_manager.verified_tokens.max_entries = sessions
+    print('{0:>22} {1:>9.3f} {2:>9.3f}'.format('remembered tokens', *percentiles(lambda token: jwks_manager.verify_token(token, 'client', 'pool'), tokens)))
@@ -0,0 +1,13 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import sys
+
+# Lambda functions import the layer and their own modules by name, mirror that here
+server_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+for folder in ['layers', 'ProductService', 'OrderService', 'TenantManagementService', 'Resources']:
+    sys.path.insert(0, os.path.join(server_dir, folder))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
@@ -0,0 +1,38 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+
+import pytest
+
+import auth_manager
+import utils
+
+SERVICES = [utils.Service_Identifier.SHARED_SERVICES.value, utils.Service_Identifier.BUSINESS_SERVICES.value]
+
+
+def build_policy(user_role, service_identifier, tenant_id, region, aws_account_id):
+    # the policies as they are built without templates
+    if (auth_manager.isSystemAdmin(user_role)):
+        return getattr(auth_manager, '__getPolicyForSystemAdmin')(region, aws_account_id)
+    if (auth_manager.isTenantAdmin(user_role)):
+        return getattr(auth_manager, '__getPolicyForTenantAdmin')(tenant_id, service_identifier, region, aws_account_id)
+    if (auth_manager.isTenantUser(user_role)):
+        return getattr(auth_manager, '__getPolicyForTenantUser')(tenant_id, region, aws_account_id)
+    return ""
+
+
+@pytest.mark.parametrize('user_role', ['SystemAdmin', 'CustomerSupport', 'TenantAdmin', 'TenantUser'])
+@pytest.mark.parametrize('service_identifier', SERVICES)
+@pytest.mark.parametrize('tenant_id', ['b7f3c2e0a1d94c6f8e2b5a7d9c1e3f5a', 'quote"back\\slash', 'ünïcode-${region}'])
+def test_rendered_policies_are_byte_for_byte_the_built_ones(user_role, service_identifier, tenant_id):
+    rendered = auth_manager.getPolicyForUser(user_role, service_identifier, tenant_id, 'us-east-1', '123456789012')
+
+    assert rendered == build_policy(user_role, service_identifier, tenant_id, 'us-east-1', '123456789012')
+
+
+def test_values_are_substituted_in_place():
+    policy = json.loads(auth_manager.getPolicyForUser('TenantUser', SERVICES[1], 't1', 'eu-west-1', '210987654321'))
+
+    assert policy['Statement'][0]['Resource'] == ['arn:aws:dynamodb:eu-west-1:210987654321:table/Product-*']
+    assert policy['Statement'][0]['Condition']['ForAllValues:StringLike']['dynamodb:LeadingKeys'] == ['t1-*']
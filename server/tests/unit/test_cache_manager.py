@@ -0,0 +1,47 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+
+import cache_manager
+
+
+def test_entries_are_isolated_per_namespace():
+    cache = cache_manager.LruTtlCache(10, 60)
+    cache.put('tenant-a', 'p1', 'a')
+
+    assert cache.get('tenant-a', 'p1') == 'a'
+    assert cache.get('tenant-b', 'p1') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = cache_manager.LruTtlCache(2, 60)
+    cache.put('t', 'p1', 1)
+    cache.put('t', 'p2', 2)
+    cache.get('t', 'p1')
+
+    assert cache.put('t', 'p3', 3) == 1
+    assert cache.get('t', 'p2') is None
+    assert cache.get('t', 'p1') == 1
+
+
+def test_expired_and_invalidated_entries_are_missed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = cache_manager.LruTtlCache(10, 30)
+    cache.put('t', 'p1', 1)
+    cache.put('t', 'p2', 2)
+
+    cache.invalidate('t', 'p2')
+    assert cache.get('t', 'p2') is None
+
+    now[0] += 31
+    assert cache.get('t', 'p1') is None
+    assert len(cache) == 0
+
+
+def test_zero_entries_disables_the_cache():
+    cache = cache_manager.LruTtlCache(0, 30)
+    cache.put('t', 'p1', 1)
+
+    assert cache.get('t', 'p1') is None
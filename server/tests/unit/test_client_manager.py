@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+
+import pytest
+
+import client_manager
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    client_manager.clear()
+    yield
+    client_manager.clear()
+
+
+def test_resource_is_reused_for_same_credentials():
+    first = client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token')
+    second = client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token')
+    other = client_manager.get_resource('dynamodb', 'AKIA2', 'secret', 'token')
+
+    assert first is second
+    assert first is not other
+
+
+def test_expired_credentials_are_evicted():
+    expired = client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token', time.time())
+    fresh = client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token', time.time() + 3600)
+
+    assert expired is not fresh
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    monkeypatch.setattr(client_manager, 'max_entries', 2)
+    first = client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token')
+    client_manager.get_resource('dynamodb', 'AKIA2', 'secret', 'token')
+    client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token')
+    client_manager.get_resource('dynamodb', 'AKIA3', 'secret', 'token')
+
+    assert client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token') is first
+
+
+def test_resource_for_tenant_reads_authorizer_context():
+    event = {'requestContext': {'authorizer': {
+        'accesskey': 'AKIA1', 'secretkey': 'secret', 'sessiontoken': 'token'}}}
+
+    assert client_manager.get_resource_for_tenant('dynamodb', event) is client_manager.get_resource('dynamodb', 'AKIA1', 'secret', 'token')
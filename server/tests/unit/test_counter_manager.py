@@ -0,0 +1,94 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import counter_manager
+import dynamodb_manager
+import shard_manager
+
+
+class CountedTable:
+    """ Items and counters of one tenant, queried by partition """
+    def __init__(self, partitions):
+        self.name = 'counted'
+        self.partitions = partitions
+        self.counters = {}
+        self.meta = self
+        self.client = self
+        self.on_query = None
+
+    def query(self, KeyConditionExpression, Select):
+        if self.on_query:
+            self.on_query()
+        partition_id = KeyConditionExpression.get_expression()['values'][1]
+        return {'Count': self.partitions.get(partition_id, 0)}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.name]['Keys']
+        return {'Responses': {self.name: [dict(key, **self.counters[key['shardId']]) for key in keys if key['shardId'] in self.counters]}}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        counter = self.counters.setdefault(Key['shardId'], {'count': 0, 'version': 0})
+        counter['count'] += ExpressionAttributeValues.get(':amount', 0)
+        counter['version'] += ExpressionAttributeValues[':one']
+
+
+def test_counter_keys_sit_outside_the_data_shards():
+    keys = counter_manager.get_counter_keys('shardId', 'id', 't')
+    partition_ids = shard_manager.get_partition_ids('t', shard_manager.MAX_SHARD_COUNT)
+
+    assert len({key['shardId'] for key in keys}) == counter_manager.COUNTER_SHARD_COUNT
+    assert not {key['shardId'] for key in keys} & set(partition_ids)
+    assert counter_manager.get_counter_key('shardId', 'id', 't', 'a') in keys
+    assert counter_manager.get_counter_key('shardId', 'id', 't', 'a') == counter_manager.get_counter_key('shardId', 'id', 't', 'a')
+
+
+def test_count_sums_every_counter_shard():
+    table = CountedTable({})
+    for item_id in ['a', 'b', 'c', 'd']:
+        counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', item_id), 1)
+    counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'a'), -1)
+
+    assert counter_manager.get_count(table, 'shardId', 'id', 't') == 3
+
+
+def test_reconcile_corrects_drift():
+    table = CountedTable({'t-1': 4, 't-2': 3})
+    counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'a'), 2)
+
+    assert counter_manager.reconcile(table, 'shardId', 'id', 't', ['t-1', 't-2']) == (7, 5)
+    assert counter_manager.get_count(table, 'shardId', 'id', 't') == 7
+    assert counter_manager.reconcile(table, 'shardId', 'id', 't', ['t-1', 't-2']) == (7, 0)
+
+
+def test_reconcile_gives_up_while_counters_keep_changing():
+    table = CountedTable({'t-1': 4})
+    table.on_query = lambda: counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'a'), 1)
+
+    assert counter_manager.reconcile(table, 'shardId', 'id', 't', ['t-1']) is None
+
+
+def test_version_changes_with_every_write_and_does_not_repeat_after_a_purge():
+    table = CountedTable({})
+    versions = [counter_manager.get_version(table, 'shardId', 'id', 't')]
+    for item_id in ['a', 'b', 'a']:
+        counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', item_id), 1)
+        versions.append(counter_manager.get_version(table, 'shardId', 'id', 't'))
+
+    # a purge deletes the counters and bumps the version marker
+    table.counters.clear()
+    dynamodb_manager.bump_version(table, shard_manager.get_version_key('shardId', 'id', 't'))
+    versions.append(counter_manager.get_version(table, 'shardId', 'id', 't'))
+
+    assert len(set(versions)) == len(versions)
+
+
+def test_reconcile_sees_a_create_and_a_delete_that_cancel_out():
+    table = CountedTable({'t-1': 4})
+    counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'a'), 4)
+
+    def create_and_delete():
+        counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'b'), 1)
+        counter_manager.increment(table, counter_manager.get_counter_key('shardId', 'id', 't', 'c'), -1)
+    table.on_query = create_and_delete
+
+    assert counter_manager.reconcile(table, 'shardId', 'id', 't', ['t-1']) is None
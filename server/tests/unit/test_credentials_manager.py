@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+import credentials_manager
+import metrics_manager
+
+
+class Sts:
+    """ Counts AssumeRole calls, the credentials expire lifetime seconds after they are issued """
+    def __init__(self, lifetime=3600, delay=0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def assume_role(self):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        return {'AccessKeyId': 'key-' + str(calls), 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+            'Expiration': datetime.fromtimestamp(time.time() + self.lifetime, tz=timezone.utc)}
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    credentials_manager.clear()
+    metrics = []
+    monkeypatch.setattr(metrics_manager, 'record_tenant_metric', lambda tenant_id, name, unit, value: metrics.append((tenant_id, name)))
+    yield metrics
+    credentials_manager.clear()
+
+
+def test_credentials_are_reused_per_tenant_role_and_service(recorded):
+    sts = Sts()
+
+    first = credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role)
+    assert credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role) is first
+    assert sts.calls == 1
+
+    credentials_manager.get_credentials('t1', 'TenantAdmin', 'business', sts.assume_role)
+    credentials_manager.get_credentials('t1', 'TenantUser', 'shared', sts.assume_role)
+    credentials_manager.get_credentials('t2', 'TenantUser', 'business', sts.assume_role)
+    assert sts.calls == 4
+
+    assert recorded.count(('t1', 'StsCredentialsCacheHit')) == 1
+    assert credentials_manager.get_hit_rate() == 0.2
+
+
+def test_credentials_are_refreshed_before_they_expire(recorded):
+    sts = Sts(lifetime=credentials_manager.refresh_margin_seconds + 1)
+
+    first = credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role)
+    assert credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role) is first
+
+    sts.lifetime = credentials_manager.refresh_margin_seconds
+    credentials_manager.clear()
+    credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role)
+    credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role)
+    assert sts.calls == 3
+
+
+def test_concurrent_misses_assume_the_role_once(recorded):
+    sts = Sts(delay=0.2)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(
+        credentials_manager.get_credentials('t1', 'TenantUser', 'business', sts.assume_role))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sts.calls == 1
+    assert all(result is results[0] for result in results)
+    assert recorded.count(('t1', 'StsCredentialsCacheMiss')) == 1
@@ -0,0 +1,236 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import pytest
+from botocore.exceptions import ClientError
+
+import dynamodb_manager
+
+
+class PagedTable:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def query(self, **kwargs):
+        self.calls.append(dict(kwargs))
+        index = kwargs.get('ExclusiveStartKey', 0)
+        response = {'Items': self.pages[index]}
+        if index + 1 < len(self.pages):
+            response['LastEvaluatedKey'] = index + 1
+        return response
+
+
+def test_query_pages_follows_last_evaluated_key():
+    table = PagedTable([[1, 2], [3], [4, 5]])
+
+    items = [item for page in dynamodb_manager.query_pages(table, KeyConditionExpression='k') for item in page['Items']]
+
+    assert items == [1, 2, 3, 4, 5]
+    assert [call.get('ExclusiveStartKey') for call in table.calls] == [None, 1, 2]
+
+
+class PartitionedTable:
+    """Serves sorted items per partition, honouring Limit and ExclusiveStartKey like DynamoDB"""
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.read = 0
+
+    def query(self, KeyConditionExpression, Limit, ExclusiveStartKey=None):
+        partition_id = KeyConditionExpression.get_expression()['values'][1]
+        items = [{'shardId': partition_id, 'id': sort_key} for sort_key in sorted(self.partitions[partition_id])]
+        if ExclusiveStartKey:
+            items = [item for item in items if item['id'] > ExclusiveStartKey['id']]
+        response = {'Items': items[:Limit]}
+        self.read += len(response['Items'])
+        if len(items) > Limit:
+            response['LastEvaluatedKey'] = {'shardId': partition_id, 'id': items[Limit - 1]['id']}
+        return response
+
+
+def test_pages_cover_every_item_exactly_once():
+    partitions = {'t-1': ['a', 'b', 'c', 'd'], 't-2': [], 't-3': ['e', 'f', 'g']}
+    table = PartitionedTable(partitions)
+
+    seen = []
+    cursor = None
+    while True:
+        items, cursor = dynamodb_manager.query_partitions_page(table, list(partitions), 'shardId', 'id', 3, cursor)
+        assert len(items) <= 3
+        seen.extend(item['id'] for item in items)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+    assert len(seen) == len(set(seen))
+
+
+def test_pages_read_only_the_items_they_return():
+    partitions = {'t-' + str(shard): ['{0:04d}'.format(index) for index in range(1000)] for shard in range(1, 10)}
+    table = PartitionedTable(partitions)
+
+    returned = 0
+    cursor = None
+    while True:
+        items, cursor = dynamodb_manager.query_partitions_page(table, list(partitions), 'shardId', 'id', 50, cursor)
+        assert len(items) == 50 or cursor is None
+        returned += len(items)
+        if cursor is None:
+            break
+
+    assert returned == 9000
+    assert table.read == returned
+
+
+def test_cursor_for_other_partitions_is_rejected():
+    cursor = dynamodb_manager.encode_cursor({'other-tenant-1': 'a'})
+
+    with pytest.raises(dynamodb_manager.InvalidCursorError):
+        dynamodb_manager.decode_cursor(cursor, ['t-1', 't-2'])
+
+    with pytest.raises(dynamodb_manager.InvalidCursorError):
+        dynamodb_manager.decode_cursor('not a cursor', ['t-1', 't-2'])
+
+    for position in ({'x': 1}, 1, ['a']):
+        with pytest.raises(dynamodb_manager.InvalidCursorError):
+            dynamodb_manager.decode_cursor(dynamodb_manager.encode_cursor({'t-1': position}), ['t-1', 't-2'])
+
+
+class BatchTable:
+    """Holds items by id and leaves the second half of every request unprocessed on the first attempt"""
+    def __init__(self, ids):
+        self.name = 'batch'
+        self.items = {item_id: {'shardId': 't-1', 'id': item_id} for item_id in ids}
+        self.requests = []
+        self.meta = self
+        self.client = self
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.name]['Keys']
+        self.requests.append(len(keys))
+        assert len(keys) <= dynamodb_manager.BATCH_GET_SIZE
+        served, unprocessed = keys, []
+        if len(self.requests) <= 3:
+            served, unprocessed = keys[:len(keys) // 2], keys[len(keys) // 2:]
+        response = {'Responses': {self.name: [self.items[key['id']] for key in served if key['id'] in self.items]}}
+        if unprocessed:
+            response['UnprocessedKeys'] = {self.name: {'Keys': unprocessed}}
+        return response
+
+
+def test_batch_get_items_preserves_order_and_retries_unprocessed_keys(monkeypatch):
+    monkeypatch.setattr(dynamodb_manager, 'backoff', lambda attempt: None)
+    table = BatchTable(range(250))
+    keys = [{'shardId': 't-1', 'id': item_id} for item_id in [249, 3, 999, 3] + list(range(200))]
+
+    items = dynamodb_manager.batch_get_items(table, keys, ('shardId', 'id'))
+
+    assert [item and item['id'] for item in items] == [249, 3, None, 3] + list(range(200))
+    assert sum(table.requests) > 202
+
+
+def test_batch_get_items_projects_the_key_and_requested_attributes():
+    requests = []
+
+    class ProjectedTable(BatchTable):
+        def batch_get_item(self, RequestItems):
+            requests.append(RequestItems[self.name])
+            return {'Responses': {self.name: []}}
+
+    dynamodb_manager.batch_get_items(ProjectedTable([]), [{'shardId': 't-1', 'id': 1}], ('shardId', 'id'), attribute_names=['price'])
+
+    names = requests[0]['ExpressionAttributeNames']
+    assert [names[name.strip()] for name in requests[0]['ProjectionExpression'].split(',')] == ['shardId', 'id', 'price']
+
+
+class BatchWriteTable:
+    """Leaves the last item of every request unprocessed once, and rejects chunks holding a bad item"""
+    def __init__(self):
+        self.name = 'batch'
+        self.written = []
+        self.retried = set()
+        self.meta = self
+        self.client = self
+
+    def batch_write_item(self, RequestItems):
+        items = [put['PutRequest']['Item'] for put in RequestItems[self.name]]
+        assert len(items) <= dynamodb_manager.BATCH_WRITE_SIZE
+        if any(item['id'] == 'bad' for item in items):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad item'}}, 'BatchWriteItem')
+        last = items[-1]
+        if last['id'] not in self.retried:
+            self.retried.add(last['id'])
+            self.written.extend(items[:-1])
+            return {'UnprocessedItems': {self.name: [{'PutRequest': {'Item': last}}]}}
+        self.written.extend(items)
+        return {'UnprocessedItems': {}}
+
+
+def test_batch_write_items_retries_unprocessed_items_and_reports_failed_chunks(monkeypatch):
+    monkeypatch.setattr(dynamodb_manager, 'backoff', lambda attempt: None)
+    table = BatchWriteTable()
+    items = [{'shardId': 't-1', 'id': str(index)} for index in range(60)]
+    items[55]['id'] = 'bad'
+
+    errors = dynamodb_manager.batch_write_items(table, items)
+
+    assert errors[:50] == [None] * 50
+    assert errors[50:] == ['bad item'] * 10
+    assert sorted(item['id'] for item in table.written) == sorted(str(index) for index in range(50))
+
+
+def test_batch_write_items_reports_the_items_not_written_by_the_deadline(monkeypatch):
+    monkeypatch.setattr(dynamodb_manager, 'backoff', lambda attempt: None)
+    now = [0.0]
+    monkeypatch.setattr(dynamodb_manager.time, 'monotonic', lambda: now[0])
+
+    class SlowTable(BatchWriteTable):
+        def batch_write_item(self, RequestItems):
+            now[0] += 10
+            return super().batch_write_item(RequestItems)
+
+    table = SlowTable()
+    items = [{'shardId': 't-1', 'id': str(index)} for index in range(100)]
+
+    errors = dynamodb_manager.batch_write_items(table, items, 5)
+
+    written = sorted(item['id'] for item in table.written)
+    assert written == sorted(item['id'] for item, error in zip(items, errors) if error is None)
+    assert 'Item was not written before the deadline' in errors
+
+
+class IndexedTable:
+    """Serves items of one partition from a category index, sorted by id within a category"""
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+
+    def query(self, KeyConditionExpression, Limit, IndexName=None, ExclusiveStartKey=None):
+        self.calls.append({'IndexName': IndexName, 'ExclusiveStartKey': ExclusiveStartKey})
+        category = KeyConditionExpression.get_expression()['values'][1].get_expression()['values'][1]
+        items = sorted((item for item in self.items if item['category'] == category), key=lambda item: item['id'])
+        if ExclusiveStartKey:
+            assert ExclusiveStartKey['category'] == category
+            items = [item for item in items if item['id'] > ExclusiveStartKey['id']]
+        response = {'Items': items[:Limit]}
+        if len(items) > Limit:
+            last = items[Limit - 1]
+            response['LastEvaluatedKey'] = {'shardId': 't-1', 'category': category, 'id': last['id']}
+        return response
+
+
+def test_pages_of_an_index_slice_only_read_matching_items():
+    items = [{'shardId': 't-1', 'id': str(index), 'category': 'books' if index % 3 == 0 else 'games'} for index in range(12)]
+    table = IndexedTable(items)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = dynamodb_manager.query_partitions_page(table, ['t-1'], 'shardId', 'id', 3, cursor,
+            index_name='CategoryIndex', index_sort_key=('category', 'books'))
+        seen.extend(item['id'] for item in page)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(str(index) for index in range(0, 12, 3))
+    assert all(call['IndexName'] == 'CategoryIndex' for call in table.calls)
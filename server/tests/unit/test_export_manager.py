@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import gzip
+import json
+import hashlib
+from decimal import Decimal
+
+import pytest
+
+import client_manager
+import export_manager
+
+moto = pytest.importorskip('moto')
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        import boto3
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='exports')
+        yield client
+
+
+def test_records_are_uploaded_as_gzip_ndjson_in_parts(s3):
+    # hashed names compress poorly, so the records span several parts
+    records = ({'id': str(index), 'name': __name(index), 'price': Decimal('1.5')} for index in range(120000))
+    part_size = 5 * 1024 * 1024
+
+    count = export_manager.export_ndjson(s3, 'exports', 't/products/export.ndjson.gz', records, part_size)
+
+    obj = s3.get_object(Bucket='exports', Key='t/products/export.ndjson.gz')
+    # the entity tag of a multipart object ends with the number of parts
+    assert int(obj['ETag'].strip('"').split('-')[1]) > 1
+    assert obj['ContentEncoding'] == 'gzip'
+    body = obj['Body'].read()
+    lines = gzip.decompress(body).decode('utf-8').splitlines()
+    assert count == len(lines) == 120000
+    assert json.loads(lines[7]) == {'id': '7', 'name': __name(7), 'price': 1.5}
+
+
+def test_failed_export_aborts_the_upload(s3):
+    def records():
+        yield {'id': '1'}
+        raise RuntimeError('shard failed')
+
+    with pytest.raises(RuntimeError):
+        export_manager.export_ndjson(s3, 'exports', 't/products/failed.ndjson.gz', records())
+
+    assert s3.list_multipart_uploads(Bucket='exports').get('Uploads', []) == []
+    assert s3.list_objects_v2(Bucket='exports').get('KeyCount') == 0
+
+
+def test_export_keys_are_under_the_tenant_prefix():
+    assert export_manager.get_export_key('t', 'orders').startswith('t/orders/')
+    assert export_manager.get_export_key('t', 'orders').endswith('.ndjson.gz')
+
+
+def test_export_keys_of_other_tenants_are_rejected():
+    assert export_manager.is_tenant_export_key('t', 't/orders/export.ndjson.gz')
+    for key in ('t2/orders/export.ndjson.gz', 'orders/export.ndjson.gz', 't', None):
+        assert not export_manager.is_tenant_export_key('t', key)
+
+
+def test_export_jobs_carry_the_authorizer_context_and_the_key(monkeypatch):
+    invocations = []
+
+    class Lambda:
+        def invoke(self, **kwargs):
+            invocations.append(kwargs)
+    monkeypatch.setattr(client_manager, 'get_client', lambda service_name: Lambda())
+    request = {'httpMethod': 'POST', 'body': None, 'requestContext': {'authorizer': {'tenantId': 't', 'userRole': 'TenantAdmin',
+        'accesskey': 'a', 'secretkey': 's', 'sessiontoken': 't', 'credentialsexpiration': 1}}}
+
+    export_manager.start_export_job('arn:aws:lambda:us-east-1:1:function:export', request, 't/products/export.ndjson.gz')
+
+    assert invocations[0]['InvocationType'] == 'Event'
+    job = json.loads(invocations[0]['Payload'])
+    # the job runs with the role of the function, the credentials of the request may expire first
+    assert job == {'exportKey': 't/products/export.ndjson.gz', 'requestContext': {'authorizer': {'tenantId': 't', 'userRole': 'TenantAdmin'}}}
+    assert export_manager.is_export_job(job)
+    assert not export_manager.is_export_job(request)
+
+
+def __name(index):
+    return hashlib.sha512(str(index).encode('utf-8')).hexdigest()
@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+
+import pytest
+
+import fanout_executor
+
+
+def test_results_are_returned_in_shard_order():
+    def query(shard):
+        # later shards finish first
+        time.sleep((5 - shard) * 0.01)
+        return shard * 10
+
+    response = fanout_executor.run(query, [1, 2, 3, 4])
+
+    assert response.results == [10, 20, 30, 40]
+    assert set(response.latencies) == {1, 2, 3, 4}
+    assert response.slowest_shard() == 1
+
+
+def test_shard_error_is_propagated():
+    def query(shard):
+        if shard == 3:
+            raise ValueError('shard 3 failed')
+        return shard
+
+    with pytest.raises(ValueError, match='shard 3 failed'):
+        fanout_executor.run(query, [1, 2, 3, 4])
+
+
+def test_deadline_is_enforced():
+    with pytest.raises(fanout_executor.FanOutTimeoutError):
+        fanout_executor.run(lambda shard: time.sleep(0.5), [1, 2], timeout_seconds=0.05)
+
+
+def test_pool_is_reused():
+    assert fanout_executor.get_executor() is fanout_executor.get_executor()
+
+
+def test_stream_yields_every_item_of_every_batch():
+    def pages(shard):
+        for page in range(3):
+            yield [(shard, page, item) for item in range(2)]
+
+    latencies = {}
+    items = list(fanout_executor.stream(pages, [1, 2, 3], latencies=latencies))
+
+    assert sorted(items) == sorted((shard, page, item) for shard in [1, 2, 3] for page in range(3) for item in range(2))
+    assert set(latencies) == {1, 2, 3}
+
+
+def test_stream_stops_shards_when_closed_early():
+    pages_read = []
+
+    def pages(shard):
+        for page in range(1000):
+            pages_read.append(page)
+            yield [page]
+
+    items = fanout_executor.stream(pages, [1, 2], max_buffered_batches=1)
+    next(items)
+    items.close()
+    time.sleep(0.3)
+
+    assert len(pages_read) < 20
+
+
+def test_stream_propagates_shard_error():
+    def pages(shard):
+        yield [shard]
+        raise ValueError('page failed')
+
+    with pytest.raises(ValueError, match='page failed'):
+        list(fanout_executor.stream(pages, [1, 2]))
@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import jwks_manager
+
+
+class JwksStub(HTTPServer):
+    """ Local jwks.json endpoint, serves the kids in self.kids and counts the downloads """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), JwksHandler)
+        self.kids = ['k1']
+        self.failing = False
+        self.downloads = 0
+        self.url = 'http://127.0.0.1:{0}/pool/.well-known/jwks.json'.format(self.server_port)
+
+
+class JwksHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.downloads += 1
+        if self.server.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({'keys': [{'kid': kid, 'kty': 'RSA'} for kid in self.server.kids]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    jwks_manager.clear()
+    server = JwksStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.now = now
+    yield server
+    server.shutdown()
+    server.server_close()
+    jwks_manager.clear()
+
+
+def test_keys_are_downloaded_once_per_ttl(jwks):
+    assert jwks_manager.get_signing_key(jwks.url, 'k1')['kid'] == 'k1'
+    assert jwks_manager.get_signing_key(jwks.url, 'k1')['kid'] == 'k1'
+    assert jwks.downloads == 1
+
+    jwks.now[0] += jwks_manager.jwks_ttl_seconds
+    jwks_manager.get_signing_key(jwks.url, 'k1')
+    assert jwks.downloads == 2
+
+
+def test_unknown_kid_refreshes_at_most_once_per_interval(jwks):
+    jwks_manager.get_signing_key(jwks.url, 'k1')
+    jwks.now[0] += jwks_manager.jwks_refresh_interval_seconds
+
+    assert jwks_manager.get_signing_key(jwks.url, 'forged') is None
+    assert jwks_manager.get_signing_key(jwks.url, 'forged') is None
+    assert jwks.downloads == 2
+
+    # the user pool rotated its keys
+    jwks.kids = ['k1', 'k2']
+    assert jwks_manager.get_signing_key(jwks.url, 'k2') is None
+    jwks.now[0] += jwks_manager.jwks_refresh_interval_seconds
+    assert jwks_manager.get_signing_key(jwks.url, 'k2')['kid'] == 'k2'
+    assert jwks.downloads == 3
+
+
+def test_stale_keys_are_used_when_the_download_fails(jwks):
+    jwks_manager.get_signing_key(jwks.url, 'k1')
+    jwks.failing = True
+    jwks.now[0] += jwks_manager.jwks_ttl_seconds
+
+    assert jwks_manager.get_signing_key(jwks.url, 'k1')['kid'] == 'k1'
+    assert jwks_manager.get_signing_key(jwks.url, 'k1')['kid'] == 'k1'
+    assert jwks.downloads == 2
+
+    jwks.failing = False
+    jwks.now[0] += jwks_manager.jwks_refresh_interval_seconds
+    jwks_manager.get_signing_key(jwks.url, 'k1')
+    assert jwks.downloads == 3
+
+
+def test_failed_first_download_raises(jwks):
+    jwks.failing = True
+
+    with pytest.raises(Exception):
+        jwks_manager.get_signing_key(jwks.url, 'k1')
+
+
+def test_key_sets_are_kept_per_user_pool(jwks):
+    jwks_manager.get_signing_key(jwks.url, 'k1')
+    other_pool = jwks.url.replace('/pool/', '/other/')
+
+    assert jwks_manager.get_signing_key(other_pool, 'k1')['kid'] == 'k1'
+    assert jwks.downloads == 2
+
+
+@pytest.fixture
+def signed(monkeypatch):
+    from jose import jwk, jwt
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    jwks_manager.clear()
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_key = dict(jwk.construct(pem, 'RS256').public_key().to_dict(), kid='k1')
+    downloads = []
+    monkeypatch.setattr(jwks_manager, 'fetch_jwks', lambda url: downloads.append(url) or [public_key])
+
+    def sign(**claims):
+        claims = dict({'aud': 'client', 'exp': int(time.time()) + 3600, 'sub': 'user'}, **claims)
+        return jwt.encode(claims, pem, algorithm='RS256', headers={'kid': 'k1'})
+    sign.downloads = downloads
+    yield sign
+    jwks_manager.clear()
+
+
+def test_verified_tokens_skip_the_signature_check(signed, monkeypatch):
+    token = signed()
+    assert jwks_manager.verify_token(token, 'client', 'pool')['sub'] == 'user'
+
+    monkeypatch.setattr(jwks_manager, 'get_public_key', lambda jwks_url, kid: pytest.fail('verified again'))
+    assert jwks_manager.verify_token(token, 'client', 'pool')['sub'] == 'user'
+
+
+def test_public_keys_are_constructed_once_per_key_set(signed):
+    jwks_manager.verify_token(signed(sub='a'), 'client', 'pool')
+    jwks_manager.verify_token(signed(sub='b'), 'client', 'pool')
+
+    assert jwks_manager.get_public_key('pool', 'k1') is jwks_manager.get_public_key('pool', 'k1')
+    assert signed.downloads == ['pool']
+
+
+def test_invalid_tokens_are_rejected(signed):
+    token = signed()
+    header, payload, _ = token.split('.')
+
+    assert jwks_manager.verify_token(header + '.' + payload + '.' + signed(sub='other').split('.')[2], 'client', 'pool') is False
+    assert jwks_manager.verify_token(token, 'other-client', 'pool') is False
+    assert jwks_manager.verify_token(signed(exp=int(time.time()) - 1), 'client', 'pool') is False
+
+
+def test_cached_claims_expire_with_their_token(signed, monkeypatch):
+    token = signed(exp=int(time.time()) + 60)
+    assert jwks_manager.verify_token(token, 'client', 'pool')
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert jwks_manager.verify_token(token, 'client', 'pool') is False
@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from decimal import Decimal
+
+import pytest
+
+from product_models import Product
+import order_models
+from order_models import Order, OrderProduct
+
+
+def test_product_item_round_trip():
+    item = {'shardId': 't-1', 'productId': 'p1', 'sku': 's', 'name': 'n', 'price': Decimal('9.99'), 'category': 'c'}
+    product = Product.from_item(item)
+
+    assert product.key == 't-1:p1'
+    assert product.to_item() == item
+
+
+def test_order_item_round_trip_builds_line_items():
+    item = {'shardId': 't-1', 'orderId': 'o1', 'orderName': 'o',
+        'orderProducts': [['t-1:p1', Decimal('1.5'), Decimal(2)], ['t-1:p2', Decimal('0.25'), Decimal(4)]],
+        'orderProductsVersion': order_models.COMPACT_VERSION,
+        'orderTotal': Decimal('4')}
+    order = Order.from_item(item)
+
+    assert isinstance(order.orderProducts[0], OrderProduct)
+    assert order.to_item() == item
+    assert order.for_json()['key'] == 't-1:o1'
+
+
+def test_orders_stored_as_a_list_of_maps_are_still_read():
+    item = {'shardId': 't-1', 'orderId': 'o1', 'orderName': 'o',
+        'orderProducts': [{'productId': 't-1:p1', 'price': Decimal('1.5'), 'quantity': Decimal(2)}]}
+    order = Order.from_item(item)
+
+    assert order.orderProducts[0].to_item() == {'productId': 't-1:p1', 'price': Decimal('1.5'), 'quantity': Decimal(2)}
+    assert order.orderTotal == Decimal('3')
+
+
+def test_large_orders_are_stored_compressed():
+    orderProducts = [OrderProduct('t-1:p' + str(index), Decimal('1.25'), Decimal(index % 5 + 1)) for index in range(500)]
+    item = Order('t-1', 'o1', 'o', orderProducts).to_item()
+
+    assert item['orderProductsVersion'] == order_models.COMPRESSED_VERSION
+    assert isinstance(item['orderProducts'], bytes)
+    assert [orderProduct.to_item() for orderProduct in Order.from_item(item).orderProducts] == [orderProduct.to_item() for orderProduct in orderProducts]
+
+
+def test_models_have_no_instance_dict():
+    with pytest.raises(AttributeError):
+        Product('t-1', 'p1', 's', 'n', 1, 'c').extra = 1
+    with pytest.raises(AttributeError):
+        OrderProduct('t-1:p1', 1, 1).__dict__
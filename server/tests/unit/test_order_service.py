@@ -0,0 +1,94 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+# the DAL reads its configuration when it is imported
+os.environ.setdefault('POWERTOOLS_TRACE_DISABLED', 'true')
+os.environ.setdefault('IS_POOLED_DEPLOY', 'true')
+os.environ.setdefault('ORDER_TABLE_NAME', 'Order-pooled')
+os.environ.setdefault('PRODUCT_TABLE_NAME', 'Product-pooled')
+
+import cache_manager
+import client_manager
+import metrics_manager
+import shard_manager
+import order_service
+import order_service_dal
+from order_models import Order, OrderProduct
+
+authorizer = {'tenantId': 't', 'userRole': 'TenantAdmin', 'shardCount': 2,
+    'accesskey': 'testing', 'secretkey': 'testing', 'sessiontoken': 'testing'}
+# the product moved by a reshard from the shard of its key, t-5, to the shard it hashes to now
+moved_to = shard_manager.get_item_partition_id('t', 'moved', 2)
+bare_in = shard_manager.get_item_partition_id('t', 'bare', 2)
+
+
+def request(key, expand=None):
+    return {'httpMethod': 'GET', 'pathParameters': {'id': key},
+        'queryStringParameters': {'expand': expand} if expand else None,
+        'requestContext': {'authorizer': dict(authorizer)}}
+
+
+def __create_table(dynamodb, name, sort_key_name):
+    return dynamodb.create_table(TableName=name,
+        KeySchema=[{'AttributeName': 'shardId', 'KeyType': 'HASH'}, {'AttributeName': sort_key_name, 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'shardId', 'AttributeType': 'S'}, {'AttributeName': sort_key_name, 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+
+
+@pytest.fixture
+def order(monkeypatch):
+    moto = pytest.importorskip('moto')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setattr(metrics_manager, 'record_metric', lambda *args: None)
+    monkeypatch.setattr(order_service_dal, 'order_product_cache', cache_manager.LruTtlCache(1000, 30))
+    client_manager.clear()
+    with moto.mock_aws():
+        import boto3
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        products = __create_table(dynamodb, 'Product-pooled', 'productId')
+        for shardId, productId, price in (('t-1', 'prefixed', 10), (bare_in, 'bare', 20), (moved_to, 'moved', 30)):
+            products.put_item(Item={'shardId': shardId, 'productId': productId, 'sku': productId, 'name': productId,
+                'price': Decimal(price), 'category': 'c', 'description': 'not shown with orders'})
+
+        order = Order('t-1', 'o', 'order', [OrderProduct('t-1:prefixed', Decimal(10), 1), OrderProduct('bare', Decimal(20), 2),
+            OrderProduct('t-5:moved', Decimal(30), 1), OrderProduct('t-1:deleted', Decimal(5), 1), OrderProduct('t-1:prefixed', Decimal(10), 3)])
+        __create_table(dynamodb, 'Order-pooled', 'orderId').put_item(Item=order.to_item())
+        yield order
+    client_manager.clear()
+
+
+def test_products_of_an_order_are_resolved_by_prefixed_bare_and_moved_ids(order):
+    products = order_service_dal.get_products_of_order(request(order.key), order)
+
+    assert {key: product and product['shardId'] for key, product in products.items()} == {
+        't-1:prefixed': 't-1', 'bare': bare_in, 't-5:moved': moved_to, 't-1:deleted': None}
+    # only the attributes shown with the line items are read
+    assert set(products['bare']) == {'shardId', 'productId', 'sku', 'name', 'price', 'category'}
+
+
+def test_order_is_expanded_with_the_product_of_every_line(order):
+    response = order_service.get_order(request(order.key, 'products'), None)
+
+    assert response['statusCode'] == 200
+    lines = json.loads(response['body'])['orderProducts']
+    assert [line['productId'] for line in lines] == ['t-1:prefixed', 'bare', 't-5:moved', 't-1:deleted', 't-1:prefixed']
+    assert [line['product'] and line['product']['productId'] for line in lines] == ['prefixed', 'bare', 'moved', None, 'prefixed']
+    assert [line['quantity'] for line in lines] == [1, 2, 1, 1, 3]
+
+
+def test_order_is_not_expanded_by_default(order):
+    response = order_service.get_order(request(order.key), None)
+
+    assert response['statusCode'] == 200
+    assert all('product' not in line for line in json.loads(response['body'])['orderProducts'])
+
+
+def test_only_products_can_be_expanded(order):
+    assert order_service.get_order(request(order.key, 'customer'), None)['statusCode'] == 400
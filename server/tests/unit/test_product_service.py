@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+
+import pytest
+
+# the DAL reads its configuration when it is imported
+os.environ.setdefault('POWERTOOLS_TRACE_DISABLED', 'true')
+os.environ.setdefault('IS_POOLED_DEPLOY', 'true')
+os.environ.setdefault('PRODUCT_TABLE_NAME', 'Product-pooled')
+
+import metrics_manager
+import product_service
+import product_service_dal
+
+
+def request(body, key=None):
+    return {'body': json.dumps(body), 'pathParameters': {'id': key},
+        'requestContext': {'authorizer': {'tenantId': 't', 'userRole': 'TenantAdmin'}}}
+
+
+@pytest.fixture
+def written(monkeypatch):
+    written = []
+    monkeypatch.setattr(metrics_manager, 'record_metric', lambda *args: None)
+    monkeypatch.setattr(product_service_dal, 'create_product', lambda event, payload: written.append(payload) or {'price': payload.price})
+    monkeypatch.setattr(product_service_dal, 'update_product', lambda event, payload, key: written.append(payload) or {'price': payload.price})
+    return written
+
+
+@pytest.mark.parametrize('price', [-1, '10', True, None, [1]])
+def test_products_without_a_non_negative_price_are_rejected(written, price):
+    body = {'sku': 's', 'name': 'n', 'category': 'c', 'price': price}
+
+    assert product_service.create_product(request(body), None)['statusCode'] == 400
+    assert product_service.update_product(request(body, 't-1:p'), None)['statusCode'] == 400
+    assert written == []
+
+
+@pytest.mark.parametrize('price', [0, 10, 9.99])
+def test_products_with_a_non_negative_price_are_written(written, price):
+    body = {'sku': 's', 'name': 'n', 'category': 'c', 'price': price}
+
+    assert product_service.create_product(request(body), None)['statusCode'] == 200
+    assert product_service.update_product(request(body, 't-1:p'), None)['statusCode'] == 200
+    assert len(written) == 2
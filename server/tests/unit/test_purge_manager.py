@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import threading
+
+import dynamodb_manager
+import purge_manager
+
+
+class PurgedTable:
+    """ Partitions of items keyed by shardId and id, leaves the first key of every delete request unprocessed once """
+    def __init__(self, partitions):
+        self.name = 'purged'
+        self.partitions = {partition_id: list(ids) for partition_id, ids in partitions.items()}
+        self.retried = set()
+        self.lock = threading.Lock()
+        self.meta = self
+        self.client = self
+
+    def query(self, KeyConditionExpression, ProjectionExpression, ExpressionAttributeNames, Limit):
+        partition_id = KeyConditionExpression.get_expression()['values'][1]
+        with self.lock:
+            return {'Items': [{'shardId': partition_id, 'id': item_id} for item_id in self.partitions.get(partition_id, [])[:Limit]]}
+
+    def batch_write_item(self, RequestItems):
+        keys = [delete['DeleteRequest']['Key'] for delete in RequestItems[self.name]]
+        assert len(keys) <= dynamodb_manager.BATCH_WRITE_SIZE
+        with self.lock:
+            first = keys[0]
+            if (first['shardId'], first['id']) not in self.retried:
+                self.retried.add((first['shardId'], first['id']))
+                keys = keys[1:]
+                unprocessed = {self.name: [{'DeleteRequest': {'Key': first}}]}
+            else:
+                unprocessed = {}
+            for key in keys:
+                self.partitions[key['shardId']].remove(key['id'])
+        return {'UnprocessedItems': unprocessed}
+
+
+def test_purge_empties_every_partition(monkeypatch):
+    monkeypatch.setattr(dynamodb_manager, 'backoff', lambda attempt: None)
+    table = PurgedTable({'t-1': [str(index) for index in range(250)], 't-2': ['a'], 't-3': []})
+
+    deleted, remaining = purge_manager.purge_partitions(table, 'shardId', 'id', ['t-1', 't-2', 't-3'],
+        time.time() + 30, purge_manager.RateLimiter(0))
+
+    assert deleted == 251
+    assert remaining == []
+    assert not any(table.partitions.values())
+
+
+def test_purge_stops_at_the_deadline_and_resumes():
+    table = PurgedTable({'t-1': [str(index) for index in range(10)]})
+    table.retried = {('t-1', str(index)) for index in range(10)}
+
+    assert purge_manager.purge_partitions(table, 'shardId', 'id', ['t-1'], time.time() - 1, purge_manager.RateLimiter(0)) == (0, ['t-1'])
+    assert purge_manager.purge_partitions(table, 'shardId', 'id', ['t-1'], time.time() + 30, purge_manager.RateLimiter(0)) == (10, [])
+
+
+def test_tenant_partitions_include_the_counters_but_not_the_version_marker():
+    partition_ids = purge_manager.get_tenant_partition_ids('t', 3)
+
+    assert partition_ids[:3] == ['t-1', 't-2', 't-3']
+    assert 't-count-1' in partition_ids
+    assert 't-meta' not in partition_ids
+
+
+def test_rate_limiter_waits_once_the_bucket_is_spent(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(time, 'sleep', lambda seconds: now.__setitem__(0, now[0] + seconds))
+    rate_limiter = purge_manager.RateLimiter(100)
+
+    rate_limiter.acquire(100)
+    assert now[0] == 0.0
+    rate_limiter.acquire(50)
+    assert now[0] == 0.5
@@ -0,0 +1,142 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import pytest
+
+import shard_manager
+
+
+def event_for(shard_count, previous_shard_count=None):
+    authorizer = {'tenantId': 't', 'shardCount': shard_count}
+    if previous_shard_count:
+        authorizer['previousShardCount'] = previous_shard_count
+    return {'requestContext': {'authorizer': authorizer}}
+
+
+class KeyedTable:
+    def __init__(self, items):
+        self.name = 'keyed'
+        self.items = {(item['shardId'], item['id']): item for item in items}
+        self.gets = []
+        self.meta = self
+        self.client = self
+
+    def get_item(self, Key):
+        self.gets.append(Key['shardId'])
+        item = self.items.get((Key['shardId'], Key['id']))
+        return {'Item': item} if item else {}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.name]['Keys']
+        return {'Responses': {self.name: [self.items[(key['shardId'], key['id'])] for key in keys if (key['shardId'], key['id']) in self.items]}}
+
+
+def test_item_partition_is_stable_and_within_the_shard_count():
+    partition_ids = [shard_manager.get_item_partition_id('t', str(index), 9) for index in range(900)]
+
+    assert partition_ids == [shard_manager.get_item_partition_id('t', str(index), 9) for index in range(900)]
+    assert set(partition_ids) == set(shard_manager.get_partition_ids('t', 9))
+
+
+def test_bare_id_is_found_in_its_hashed_shard_with_one_read():
+    partition_id = shard_manager.get_item_partition_id('t', 'a', 4)
+    table = KeyedTable([{'shardId': partition_id, 'id': 'a'}])
+
+    assert shard_manager.find_item(event_for(4), table, 'shardId', 'id', 't', 'a')['shardId'] == partition_id
+    assert table.gets == [partition_id]
+
+
+def test_bare_id_written_to_another_shard_is_still_found():
+    hashed = [shard_manager.get_item_partition_id('t', 'a', shard_count) for shard_count in (4, 6)]
+    other = [partition_id for partition_id in shard_manager.get_partition_ids('t', 6) if partition_id not in hashed][0]
+    table = KeyedTable([{'shardId': other, 'id': 'a'}])
+
+    assert shard_manager.find_item(event_for(4, 6), table, 'shardId', 'id', 't', 'a')['shardId'] == other
+    assert shard_manager.find_item(event_for(4, 6), table, 'shardId', 'id', 't', 'missing') is None
+
+
+def test_split_key_accepts_full_and_bare_keys():
+    assert shard_manager.split_key('t-1:abc') == ('t-1', 'abc')
+    assert shard_manager.split_key('abc') == (None, 'abc')
+
+
+def test_moved_item_is_found_by_its_old_key():
+    moved_to = shard_manager.get_item_partition_id('t', 'a', 2)
+    table = KeyedTable([{'shardId': moved_to, 'id': 'a'}])
+
+    assert shard_manager.get_item(event_for(2), table, 'shardId', 'id', 't', 't-3:a')['shardId'] == moved_to
+    assert shard_manager.get_item(event_for(2), table, 'shardId', 'id', 't', 't-3:missing') is None
+
+
+@pytest.fixture
+def dynamodb_table(monkeypatch):
+    moto = pytest.importorskip('moto')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        import boto3
+        yield boto3.resource('dynamodb', region_name='us-east-1').create_table(TableName='items',
+            KeySchema=[{'AttributeName': 'shardId', 'KeyType': 'HASH'}, {'AttributeName': 'id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'shardId', 'AttributeType': 'S'}, {'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+
+def test_item_updated_while_it_is_drained_is_moved_as_updated(dynamodb_table, monkeypatch):
+    dynamodb_table.put_item(Item={'shardId': 't-3', 'id': 'a', 'name': 'old'})
+    transact_move = shard_manager.__dict__['__transact_move']
+    updates = ['new']
+
+    def update_then_move(*args):
+        if updates:
+            dynamodb_table.update_item(Key={'shardId': 't-3', 'id': 'a'}, UpdateExpression='set #n = :n',
+                ExpressionAttributeNames={'#n': 'name'}, ExpressionAttributeValues={':n': updates.pop()})
+        transact_move(*args)
+    monkeypatch.setitem(shard_manager.__dict__, '__transact_move', update_then_move)
+
+    assert shard_manager.drain_partitions(dynamodb_table, 'shardId', 'id', 't', 3, 2, float('inf')) == (1, True)
+
+    items = dynamodb_table.scan()['Items']
+    assert items == [{'shardId': shard_manager.get_item_partition_id('t', 'a', 2), 'id': 'a', 'name': 'new'}]
+
+
+def test_only_keys_of_numbered_shards_of_the_tenant_are_valid():
+    event = event_for(4)
+
+    assert shard_manager.is_valid_key(event, 't', 't-4:a')
+    assert shard_manager.is_valid_key(event, 't', 'a')
+    # retired by an earlier reshard, resolved by the item id
+    assert shard_manager.is_valid_key(event, 't', 't-9:a')
+    for key in ('t-meta:version', 't-count-3:count', 't-0:a', 't-01:a', 't-101:a', 'other-1:a', 't-1:', 't-1:a:b', '', None):
+        assert not shard_manager.is_valid_key(event, 't', key)
+
+
+def test_batch_find_reads_other_shards_only_for_ids_missing_from_their_hashed_shard():
+    hashed = shard_manager.get_item_partition_id('t', 'a', 4)
+    other = [partition_id for partition_id in shard_manager.get_partition_ids('t', 4) if partition_id != shard_manager.get_item_partition_id('t', 'b', 4)][0]
+    table = KeyedTable([{'shardId': hashed, 'id': 'a'}, {'shardId': other, 'id': 'b'}])
+    requested = []
+    batch_get_item = table.batch_get_item
+    table.batch_get_item = lambda RequestItems: requested.append(len(RequestItems[table.name]['Keys'])) or batch_get_item(RequestItems)
+
+    items = shard_manager.batch_find_items(event_for(4), table, 'shardId', 'id', 't', ['b', 'a', 'missing', 'a'])
+
+    assert [item and item['shardId'] for item in items] == [other, hashed, None, hashed]
+    # three hashed keys, then the three other shards of b and of missing
+    assert requested == [3, 6]
+    assert shard_manager.batch_find_items(event_for(4), table, 'shardId', 'id', 't', ['b'], other_shards=False) == [None]
+
+
+def test_batch_get_resolves_bare_and_moved_keys_in_key_order():
+    moved_to = shard_manager.get_item_partition_id('t', 'b', 2)
+    table = KeyedTable([{'shardId': 't-1', 'id': 'a'}, {'shardId': moved_to, 'id': 'b'}])
+
+    items = shard_manager.batch_get_items(event_for(2), table, 'shardId', 'id', 't', ['t-1:a', 't-3:b', 'b', 't-1:missing', 'other-1:a', 't-1:a'])
+
+    assert [item and item['shardId'] for item in items] == ['t-1', moved_to, moved_to, None, None, 't-1']
+
+
+def test_shard_counts_are_bounded():
+    assert shard_manager.is_valid_shard_count(1)
+    assert shard_manager.is_valid_shard_count(shard_manager.MAX_SHARD_COUNT)
+    for shard_count in (0, -1, shard_manager.MAX_SHARD_COUNT + 1, 100000, '9', 9.0, True, None):
+        assert not shard_manager.is_valid_shard_count(shard_count)
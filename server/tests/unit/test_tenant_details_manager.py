@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+
+import pytest
+
+import tenant_details_manager
+
+
+class Table:
+    """ Items by their single key attribute, counts the reads """
+    def __init__(self, key_name, items):
+        self.key_name = key_name
+        self.items = items
+        self.reads = 0
+
+    def get_item(self, Key, **kwargs):
+        self.reads += 1
+        item = self.items.get(Key[self.key_name])
+        return {'Item': dict(item)} if item is not None else {}
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    tenant_details_manager.clear()
+    tenant_table = Table('tenantId', {'t1': {'userPoolId': 'pool-1', 'apiKey': 'key-1'}})
+    settings_table = Table('settingName', {'tenantDetailsVersion': {'version': 1}})
+    yield tenant_table, settings_table, now
+    tenant_details_manager.clear()
+
+
+def test_details_are_read_once(tables):
+    tenant_table, settings_table, now = tables
+
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')['userPoolId'] == 'pool-1'
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')['userPoolId'] == 'pool-1'
+    assert tenant_table.reads == 1
+    assert settings_table.reads == 1
+
+
+def test_unknown_tenants_are_cached_for_a_shorter_while(tables):
+    tenant_table, settings_table, now = tables
+
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 'nobody') is None
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 'nobody') is None
+    assert tenant_table.reads == 1
+
+    now[0] += tenant_details_manager.unknown_tenants.ttl_seconds
+    tenant_details_manager.get_tenant_details(tenant_table, settings_table, 'nobody')
+    assert tenant_table.reads == 2
+
+
+def test_a_version_bump_drops_the_cached_details(tables):
+    tenant_table, settings_table, now = tables
+    tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')
+    tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't2')
+
+    tenant_table.items['t1']['apiKey'] = 'key-2'
+    tenant_table.items['t2'] = {'userPoolId': 'pool-2', 'apiKey': 'key-3'}
+    settings_table.items['tenantDetailsVersion']['version'] = 2
+
+    # the version is not read again before the check interval
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')['apiKey'] == 'key-1'
+    now[0] += tenant_details_manager.version_check_interval_seconds
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')['apiKey'] == 'key-2'
+    assert tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't2')['apiKey'] == 'key-3'
+    assert settings_table.reads == 2
+
+
+def test_details_expire_after_their_ttl(tables):
+    tenant_table, settings_table, now = tables
+    tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')
+
+    now[0] += tenant_details_manager.tenant_details.ttl_seconds
+    tenant_details_manager.get_tenant_details(tenant_table, settings_table, 't1')
+    assert tenant_table.reads == 2
@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import gzip
+import zlib
+import base64
+from decimal import Decimal
+from types import SimpleNamespace
+
+import jsonpickle
+import pytest
+
+import utils
+from product_models import Product
+from order_models import Order, OrderProduct
+
+
+def jsonpickle_encode(value):
+    jsonpickle.set_encoder_options('simplejson', use_decimal=True, sort_keys=True)
+    jsonpickle.set_preferred_backend('simplejson')
+    return jsonpickle.encode(value, unpicklable=False, use_decimal=True)
+
+
+responses = [
+    Product('t-1', 'p1', 'sku', 'name', Decimal('10.50'), 'books'),
+    [Product('t-{0}'.format(index), 'p{0}'.format(index), 'sku', u'näme "quoted"', Decimal(index) / 3, 'c') for index in range(20)],
+    Order('t-2', 'o1', 'order', [OrderProduct('t-1:p1', Decimal('1.25'), 2)]),
+    Order('t-2', 'o2', 'order', [SimpleNamespace(productId='t-1:p1', price=Decimal('1.25'), quantity=2)]),
+    {'items': [Product('t-1', 'p1', 'sku', 'name', 10, 'books'), None], 'nextCursor': None},
+    [],
+]
+
+
+@pytest.mark.parametrize('response', responses)
+def test_output_matches_jsonpickle(response):
+    assert utils.encode_to_json_object(response) == jsonpickle_encode(response)
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError):
+        utils.encode_to_json_object(object())
+
+
+def request_with(accept_encoding):
+    return {'headers': {'accept-encoding': accept_encoding}}
+
+
+large_response = [Product('t-1', 'p{0}'.format(index), 'sku', 'name', Decimal(index), 'books') for index in range(100)]
+
+
+@pytest.mark.parametrize('accept_encoding, content_encoding, decompress', [
+    ('gzip, deflate, br', 'gzip', lambda body: gzip.decompress(body)),
+    ('deflate', 'deflate', lambda body: zlib.decompress(body)),
+    ('gzip;q=0, *;q=0.5', 'deflate', lambda body: zlib.decompress(body)),
+])
+def test_large_responses_are_compressed_when_accepted(accept_encoding, content_encoding, decompress):
+    response = utils.generate_response(large_response, request_with(accept_encoding))
+
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == content_encoding
+    assert decompress(base64.b64decode(response['body'])).decode('utf-8') == utils.encode_to_json_object(large_response)
+
+
+@pytest.mark.parametrize('response, event', [
+    (large_response, request_with('identity')),
+    (large_response, request_with('gzip;q=0')),
+    (large_response, {'headers': None}),
+    (large_response, None),
+    ([], request_with('gzip')),
+])
+def test_responses_are_not_compressed(response, event):
+    generated = utils.generate_response(response, event)
+
+    assert 'isBase64Encoded' not in generated
+    assert generated['body'] == utils.encode_to_json_object(response)
+
+
+def test_base64_request_bodies_are_decoded():
+    body = '{"name": "näme"}'
+
+    assert utils.get_request_body({'body': base64.b64encode(body.encode('utf-8')).decode('ascii'), 'isBase64Encoded': True}) == body
+    assert utils.get_request_body({'body': body, 'isBase64Encoded': False}) == body
+
+
+def get_request(if_none_match=None):
+    return {'httpMethod': 'GET', 'headers': {'If-None-Match': if_none_match} if if_none_match else {}}
+
+
+def test_get_responses_carry_an_etag_and_become_not_modified():
+    response = utils.generate_response(responses[0], get_request())
+    etag = response['headers']['ETag']
+
+    assert utils.generate_response(responses[0], get_request(etag))['statusCode'] == 304
+    assert utils.generate_response(responses[1], get_request(etag))['statusCode'] == 200
+
+
+@pytest.mark.parametrize('if_none_match, not_modified', [
+    ('W/"a", W/"b"', True),
+    ('"b"', True),
+    ('*', True),
+    ('W/"c"', False),
+])
+def test_if_none_match_uses_weak_comparison(if_none_match, not_modified):
+    etag = 'W/"b"'
+
+    assert utils.is_not_modified(get_request(if_none_match), etag) is not_modified
+    assert utils.is_not_modified(dict(get_request(if_none_match), httpMethod='POST'), etag) is False
+
+
+def test_etag_depends_on_every_part():
+    assert utils.create_etag(1, None, 'books') == utils.create_etag(1, None, 'books')
+    assert utils.create_etag(1, None, 'books') != utils.create_etag(2, None, 'books')
+    assert utils.create_etag(1, None, 'books') != utils.create_etag(1, None, 'games')